@@ -6,249 +6,83 @@ Descargador GUI mejorado con yt-dlp - Versión optimizada final - CORREGIDO
 import os
 import sys
 import threading
-import queue
 import time
-import json
 import logging
+from collections import deque
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import yt_dlp
 
-# ---------------------------
-# Configuration & Constants
-# ---------------------------
-class Config:
-    DEFAULT_BITRATE = "192"
-    SUPPORTED_FORMATS = ["mp3", "m4a", "flac", "wav"]
-    BITRATE_OPTIONS = ["320", "256", "192", "128", "96"]
-    DEFAULT_OUT_TEMPLATE = "%(artist)s - %(title).200s.%(ext)s"
-    FALLBACK_TEMPLATE = "%(uploader)s - %(title).200s.%(ext)s"
-    CONFIG_FILE = "downloader_config.json"
-    LOG_FILE = "downloader.log"
-    MAX_LOG_SIZE = 1024 * 1024  # 1MB
+from downloader_metrics import MetricsServer
+from downloader_engine import (
+    Config, ConfigManager, DownloadArchive, DownloadScheduler, JobJournal, LibraryIndex, ProgressAggregator,
+    parse_playlist_items, setup_logging,
+    preload_yt_dlp, yt_dlp_available,
+    JOB_QUEUED, JOB_RUNNING, JOB_PAUSED, JOB_CONVERTING, JOB_DONE, JOB_ERROR, JOB_CANCELED, JOB_SKIPPED,
+    FINISHED_STATES
+)
 
 # ---------------------------
-# Logging Setup
+# Log Model
 # ---------------------------
-def setup_logging():
-    """Configure logging with rotation"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(Config.LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    return logging.getLogger(__name__)
+class LogBuffer:
+    """Bounded log model behind the log widget.
 
-# ---------------------------
-# Configuration Manager
-# ---------------------------
-class ConfigManager:
-    def __init__(self):
-        self.config_path = Path(Config.CONFIG_FILE)
-        self.default_config = {
-            "output_dir": str(Path.home() / "Downloads"),
-            "bitrate": Config.DEFAULT_BITRATE,
-            "format": "mp3",
-            "template": Config.DEFAULT_OUT_TEMPLATE,
-            "create_artist_folders": False,
-            "skip_existing": True,
-            "max_concurrent": 3,
-            "save_cover_art": True,
-            "cover_format": "jpg",
-            "cover_size": "original"
-        }
-    
-    def load_config(self) -> Dict[str, Any]:
-        """Load configuration from file"""
-        try:
-            if self.config_path.exists():
-                with open(self.config_path, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    # Merge with defaults for missing keys
-                    return {**self.default_config, **config}
-        except Exception as e:
-            logging.warning(f"Failed to load config: {e}")
-        return self.default_config.copy()
-    
-    def save_config(self, config: Dict[str, Any]):
-        """Save configuration to file"""
-        try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            logging.error(f"Failed to save config: {e}")
+    Only the last ``max_lines`` entries are kept in memory (and in the
+    widget); every entry is also appended to a session file on disk so the
+    full history can still be searched.
+    """
+    def __init__(self, path: str, max_lines: int = 1000):
+        self.path = Path(path)
+        self.lines = deque(maxlen=max(1, max_lines))
+        self._pending = deque(maxlen=max(1, max_lines))
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self.total = 0
 
-# ---------------------------
-# Enhanced Downloader Thread
-# ---------------------------
-class DownloaderThread(threading.Thread):
-    def __init__(self, url: str, config: Dict[str, Any], progress_queue: queue.Queue, 
-                 stop_event: threading.Event, logger: logging.Logger):
-        super().__init__(daemon=True)
-        self.url = url
-        self.config = config
-        self.progress_queue = progress_queue
-        self.stop_event = stop_event
-        self.logger = logger
-        self.download_info = {}
-        
-    def run(self):
-        try:
-            self._download()
-        except Exception as e:
-            if self.stop_event.is_set():
-                self.progress_queue.put(("canceled", "Descarga cancelada por usuario"))
-            else:
-                self.logger.error(f"Download error: {e}")
-                self.progress_queue.put(("error", f"Error: {str(e)}"))
+    @property
+    def max_lines(self) -> int:
+        return self.lines.maxlen
 
-    def _download(self):
-        """Main download logic with enhanced options"""
-        output_dir = Path(self.config['output_dir'])
-        
-        # Create artist subfolder if enabled
-        if self.config.get('create_artist_folders', False):
-            try:
-                # First, extract info to get artist name
-                with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-                    info = ydl.extract_info(self.url, download=False)
-                    artist = info.get('artist') or info.get('uploader') or 'Unknown'
-                    output_dir = output_dir / self._sanitize_filename(artist)
-            except Exception:
-                pass  # Continue with original output_dir
-        
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Build output template
-        template = self.config.get('template', Config.DEFAULT_OUT_TEMPLATE)
-        outtmpl = str(output_dir / template)
-        
-        # Enhanced yt-dlp options
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': outtmpl,
-            'noplaylist': True,
-            'quiet': True,
-            'no_warnings': True,
-            'progress_hooks': [self._progress_hook],
-            'extract_flat': False,
-            'writethumbnail': True,  # Download thumbnail
-            'writeinfojson': False,  # Skip JSON metadata
-            'embedthumbnail': True,  # Embed thumbnail in audio
-            'restrictfilenames': False,
-            'nocheckcertificate': True,
-            'socket_timeout': 30,
-            'retries': 3,
-            'fragment_retries': 3,
-            'skip_download': False,
-        }
-        
-        # Skip if file exists
-        if self.config.get('skip_existing', True):
-            ydl_opts['overwrites'] = False
-        
-        # Audio postprocessing
-        audio_format = self.config.get('format', 'mp3')
-        bitrate = self.config.get('bitrate', Config.DEFAULT_BITRATE)
-        
-        postprocessors = []
-        
-        if audio_format in ['mp3', 'm4a']:
-            postprocessors.append({
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': audio_format,
-                'preferredquality': bitrate,
-            })
-        
-        # Add metadata
-        postprocessors.append({
-            'key': 'FFmpegMetadata',
-            'add_metadata': True,
-        })
-        
-        # Embed thumbnail in audio file
-        if audio_format == 'mp3':
-            postprocessors.append({
-                'key': 'EmbedThumbnail',
-                'already_have_thumbnail': False,
-            })
-        
-        ydl_opts['postprocessors'] = postprocessors
-        
-        self.progress_queue.put(("status", "Extrayendo información..."))
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Extract info first
-            info = ydl.extract_info(self.url, download=False)
-            self.download_info = {
-                'ALONSO AGRADECE CADA DESCARGA'
-                'title': info.get('title', 'Unknown'),
-                'artist': info.get('artist') or info.get('uploader', 'Unknown'),
-                'duration': info.get('duration'),
-                'description': info.get('description', ''),
-                'webpage_url': info.get('webpage_url', self.url)
-            }
-            
-            self.progress_queue.put(("info", self.download_info))
-            self.progress_queue.put(("status", "Iniciando descarga..."))
-            
-            # Download
-            ydl.download([self.url])
-            
-            if not self.stop_event.is_set():
-                self.progress_queue.put(("complete", "Descarga completada exitosamente"))
-
-    def _progress_hook(self, d):
-        """Enhanced progress hook with better error handling"""
-        if self.stop_event.is_set():
-            raise yt_dlp.DownloadError("User cancelled")
-        
-        status = d.get('status')
-        
-        if status == 'downloading':
-            self._handle_download_progress(d)
-        elif status == 'finished':
-            filename = Path(d.get('filename', '')).name
-            self.progress_queue.put(("status", f"Descarga finalizada: {filename}"))
-            self.progress_queue.put(("status", "Procesando audio..."))
-        elif status == 'error':
-            error_msg = d.get('error', 'Unknown error')
-            self.progress_queue.put(("error", f"Error en descarga: {error_msg}"))
-
-    def _handle_download_progress(self, d):
-        """Handle download progress with detailed information"""
-        downloaded = d.get('downloaded_bytes', 0)
-        total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-        speed = d.get('speed', 0)
-        eta = d.get('eta', 0)
-        filename = Path(d.get('filename', '')).name
-        
-        percent = None
-        if total > 0:
-            percent = min(100.0, (downloaded / total) * 100.0)
-        
-        progress_info = {
-            'percent': percent,
-            'downloaded': downloaded,
-            'total': total,
-            'speed': speed,
-            'eta': eta,
-            'filename': filename
-        }
-        
-        self.progress_queue.put(("progress", progress_info))
+    def set_max_lines(self, max_lines: int):
+        """Change the in-memory cap, keeping the newest entries"""
+        self.lines = deque(self.lines, maxlen=max(1, max_lines))
+        self._pending = deque(self._pending, maxlen=max(1, max_lines))
 
-    def _sanitize_filename(self, filename: str) -> str:
-        """Sanitize filename for filesystem compatibility"""
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, '')
-        return filename.strip()
+    def append(self, text: str):
+        """Add a timestamped entry"""
+        line = f"[{time.strftime('%H:%M:%S')}] {text}"
+        self.lines.append(line)
+        self._pending.append(line)
+        self._file.write(line + "\n")
+        self.total += 1
+
+    def take_pending(self) -> List[str]:
+        """Entries not rendered yet (at most ``max_lines``)"""
+        pending = list(self._pending)
+        self._pending.clear()
+        if pending:
+            self._file.flush()
+        return pending
+
+    def clear(self):
+        """Clear the in-memory view; the session file keeps everything"""
+        self.lines.clear()
+        self._pending.clear()
+
+    def search(self, term: str, limit: int = 500) -> List[str]:
+        """Case-insensitive search over the whole session log on disk"""
+        self._file.flush()
+        term = term.lower()
+        matches = deque(maxlen=limit)  # Keep the most recent matches
+        with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if term in line.lower():
+                    matches.append(line.rstrip("\n"))
+        return list(matches)
+
+    def close(self):
+        self._file.close()
 
 # ---------------------------
 # Enhanced GUI Application
@@ -257,13 +91,13 @@ class EnhancedApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Enhanced SoundCloud Downloader (yt-dlp)")
-        self.root.geometry("800x600")
+        self.root.geometry("900x720")
         self.root.resizable(True, True)
         
         # Initialize components
-        self.logger = setup_logging()
         self.config_manager = ConfigManager()
         self.config = self.config_manager.load_config()
+        self.logger = setup_logging(json_format=self.config['log_format'] == 'json')
         
         # Variables
         self.url_var = tk.StringVar()
@@ -274,15 +108,50 @@ class EnhancedApp:
         self.skip_existing_var = tk.BooleanVar(value=self.config['skip_existing'])
         self.save_cover_var = tk.BooleanVar(value=self.config['save_cover_art'])
         self.cover_format_var = tk.StringVar(value=self.config['cover_format'])
+        self.cover_size_var = tk.StringVar(value=self.config['cover_size'])
+        self.playlist_mode_var = tk.BooleanVar(value=self.config['playlist_mode'])
+        self.playlist_items_var = tk.StringVar(value=self.config['playlist_items'])
+        self.queue_order_var = tk.StringVar(value=self.config['queue_order'])
+        self.dedup_action_var = tk.StringVar(value=self.config['dedup_action'])
+        self.loudness_mode_var = tk.StringVar(value=self.config['loudness_mode'])
+        self.loudness_target_var = tk.DoubleVar(value=self.config['loudness_target'])
+        self.log_max_lines_var = tk.IntVar(value=self.config['log_max_lines'])
+        self.log_format_var = tk.StringVar(value=self.config['log_format'])
+        self.metrics_port_var = tk.IntVar(value=self.config['metrics_port'])
+        self.bandwidth_limit_var = tk.IntVar(value=self.config['bandwidth_limit_kb'])
+        self.job_bandwidth_limit_var = tk.IntVar(value=self.config['job_bandwidth_limit_kb'])
+        self.staging_dir_var = tk.StringVar(value=self.config['staging_dir'])
+        self.min_free_var = tk.IntVar(value=self.config['min_free_mb'])
+        self.log_search_var = tk.StringVar()
+        self.library_search_var = tk.StringVar()
         
         # Queues and threading
-        self.progress_queue = queue.Queue()
-        self.stop_event = threading.Event()
-        self.worker = None
+        self.progress_queue = ProgressAggregator()
+        self._poll_interval = Config.POLL_MIN_MS
+        self.archive = DownloadArchive(Config.ARCHIVE_FILE)
+        self.journal = JobJournal(Config.JOURNAL_FILE)
+        self.library = LibraryIndex(Config.LIBRARY_FILE)
+        self.scheduler = DownloadScheduler(self.config, self.progress_queue, self.logger,
+                                           archive=self.archive, journal=self.journal, library=self.library)
+        self.scheduler.start()
         self.download_info = {}
+        self.job_rows: Dict[str, str] = {}  # job id -> queue tree item
+        self.job_percent: Dict[str, float] = {}
+        self.batch_results: Dict[str, str] = {}  # job id -> final state
+        self.log_buffer = LogBuffer(Config.SESSION_LOG_FILE, self.config['log_max_lines'])
+        self.metrics_server = self._start_metrics_server(self.config['metrics_port'])
         
         self._build_enhanced_ui()
         self._periodic_check()
+        self._refresh_stats()
+        
+        # Load yt-dlp in the background once the window has been drawn
+        self.root.after_idle(preload_yt_dlp)
+        
+        # Jobs left unfinished by the previous session (closed or crashed)
+        unfinished = len(self.journal.unfinished())
+        if unfinished:
+            self.root.after(300, lambda: self._offer_resume(unfinished))
         
         # Bind cleanup on close
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
@@ -304,12 +173,22 @@ class EnhancedApp:
         self.settings_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.settings_frame, text="Configuracion")
         
+        # Library tab
+        self.library_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.library_frame, text="Biblioteca")
+        
+        # Stats tab
+        self.stats_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.stats_frame, text="Estadisticas")
+        
         # Info tab
         self.info_frame = ttk.Frame(self.notebook)
         self.notebook.add(self.info_frame, text="Acerca de")
         
         self._build_download_tab()
         self._build_settings_tab()
+        self._build_library_tab()
+        self._build_stats_tab()
         self._build_info_tab()
         
     def _build_download_tab(self):
@@ -317,7 +196,7 @@ class EnhancedApp:
         frame = self.download_frame
         
         # URL section with improved styling
-        url_frame = ttk.LabelFrame(frame, text="URL de Audio", padding=15)
+        url_frame = ttk.LabelFrame(frame, text="URL de Audio (una o varias, separadas por espacios)", padding=15)
         url_frame.pack(fill=tk.X, padx=10, pady=(5, 10))
         
         # URL input with paste button in same row
@@ -370,6 +249,13 @@ class EnhancedApp:
         ttk.Checkbutton(left_options, text="Omitir archivos existentes", 
                        variable=self.skip_existing_var).pack(anchor=tk.W, pady=2)
         
+        playlist_frame = ttk.Frame(left_options)
+        playlist_frame.pack(anchor=tk.W, pady=2)
+        ttk.Checkbutton(playlist_frame, text="Lista / set completo", 
+                       variable=self.playlist_mode_var).pack(side=tk.LEFT)
+        ttk.Label(playlist_frame, text="Pistas:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(playlist_frame, textvariable=self.playlist_items_var, width=12).pack(side=tk.LEFT, padx=(5, 0))
+        
         right_options = ttk.Frame(options_frame)
         right_options.pack(side=tk.RIGHT, fill=tk.X, expand=True)
         
@@ -380,7 +266,7 @@ class EnhancedApp:
         cover_format_frame.pack(anchor=tk.W, pady=2)
         ttk.Label(cover_format_frame, text="Formato caratula:").pack(side=tk.LEFT)
         ttk.Combobox(cover_format_frame, textvariable=self.cover_format_var, 
-                    values=["jpg", "png"], width=6, state="readonly").pack(side=tk.LEFT, padx=(5, 0))
+                    values=Config.COVER_FORMATS, width=6, state="readonly").pack(side=tk.LEFT, padx=(5, 0))
         
         # Control buttons with icons
         control_frame = ttk.Frame(frame)
@@ -389,6 +275,12 @@ class EnhancedApp:
         self.btn_download = ttk.Button(control_frame, text="Descargar", command=self._on_download)
         self.btn_download.pack(side=tk.LEFT, padx=(0, 15))
         
+        self.btn_pause = ttk.Button(control_frame, text="Pausar", command=self._on_pause, state=tk.DISABLED)
+        self.btn_pause.pack(side=tk.LEFT, padx=(0, 5))
+        
+        self.btn_resume = ttk.Button(control_frame, text="Reanudar", command=self._on_resume, state=tk.DISABLED)
+        self.btn_resume.pack(side=tk.LEFT, padx=(0, 5))
+        
         self.btn_cancel = ttk.Button(control_frame, text="Cancelar", command=self._on_cancel, state=tk.DISABLED)
         self.btn_cancel.pack(side=tk.LEFT)
         
@@ -398,6 +290,25 @@ class EnhancedApp:
         ttk.Button(control_frame, text="Limpiar log", 
                   command=self._clear_log).pack(side=tk.RIGHT)
         
+        # Download queue, one row per job
+        queue_frame = ttk.LabelFrame(frame, text="Cola de Descargas", padding=10)
+        queue_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.job_tree = ttk.Treeview(queue_frame, columns=("titulo", "estimado", "estado", "progreso"),
+                                     show="headings", height=5)
+        self.job_tree.heading("titulo", text="Track")
+        self.job_tree.heading("estimado", text="Duracion / Tamano")
+        self.job_tree.heading("estado", text="Estado")
+        self.job_tree.heading("progreso", text="Progreso")
+        self.job_tree.column("titulo", width=400)
+        self.job_tree.column("estimado", width=130, anchor=tk.CENTER)
+        self.job_tree.column("estado", width=110, anchor=tk.CENTER)
+        self.job_tree.column("progreso", width=90, anchor=tk.CENTER)
+        queue_scroll = ttk.Scrollbar(queue_frame, orient=tk.VERTICAL, command=self.job_tree.yview)
+        self.job_tree.configure(yscrollcommand=queue_scroll.set)
+        self.job_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        queue_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        
         # Info section with better styling
         info_frame = ttk.LabelFrame(frame, text="Informacion del Track", padding=15)
         info_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -423,6 +334,18 @@ class EnhancedApp:
         self.lbl_status = ttk.Label(progress_frame, text="Listo para descargar", font=('Arial', 9))
         self.lbl_status.pack(anchor=tk.W, pady=(0, 8))
         
+        # Aggregate throughput against the bandwidth budget
+        self.lbl_bandwidth = ttk.Label(progress_frame, text="", font=('Arial', 9), foreground="gray")
+        self.lbl_bandwidth.pack(anchor=tk.W, pady=(0, 8))
+        
+        # Search over the full session log (kept on disk)
+        log_search_frame = ttk.Frame(progress_frame)
+        log_search_frame.pack(fill=tk.X, pady=(0, 5))
+        log_search_entry = ttk.Entry(log_search_frame, textvariable=self.log_search_var)
+        log_search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        log_search_entry.bind("<Return>", lambda event: self._search_log())
+        ttk.Button(log_search_frame, text="Buscar en log", command=self._search_log).pack(side=tk.RIGHT)
+        
         # Enhanced log with scrollbar
         log_container = ttk.Frame(progress_frame)
         log_container.pack(fill=tk.BOTH, expand=True)
@@ -435,6 +358,28 @@ class EnhancedApp:
         self.txt_log.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
+    def _build_log_settings(self, frame):
+        """Log view limits"""
+        log_frame = ttk.LabelFrame(frame, text="Registro", padding=15)
+        log_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(log_frame, text="Lineas maximas en pantalla:").pack(side=tk.LEFT)
+        ttk.Spinbox(log_frame, from_=100, to=100000, increment=100, width=10,
+                    textvariable=self.log_max_lines_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(log_frame, text="(el log completo de la sesion se guarda en disco)").pack(side=tk.LEFT, padx=(10, 0))
+        
+        ttk.Label(log_frame, text="Formato de archivo:").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Combobox(log_frame, textvariable=self.log_format_var, values=Config.LOG_FORMATS,
+                    width=6, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        
+        metrics_frame = ttk.LabelFrame(frame, text="Metricas", padding=15)
+        metrics_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(metrics_frame, text="Puerto local de metricas (0 = desactivado):").pack(side=tk.LEFT)
+        ttk.Spinbox(metrics_frame, from_=0, to=65535, width=8,
+                    textvariable=self.metrics_port_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(metrics_frame, text="(/metrics y /metrics.json, requiere reiniciar)").pack(side=tk.LEFT, padx=(10, 0))
+
     def _build_settings_tab(self):
         """Build enhanced settings tab"""
         frame = self.settings_frame
@@ -455,6 +400,17 @@ class EnhancedApp:
         ttk.Combobox(defaults_frame, textvariable=self.bitrate_var, values=Config.BITRATE_OPTIONS, 
                     width=10, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
         
+        loudness_frame = ttk.Frame(audio_frame)
+        loudness_frame.pack(fill=tk.X)
+        ttk.Label(loudness_frame, text="Volumen (EBU R128):").pack(side=tk.LEFT)
+        ttk.Combobox(loudness_frame, textvariable=self.loudness_mode_var, values=Config.LOUDNESS_MODES,
+                    width=12, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(loudness_frame, text="Objetivo (LUFS):").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Spinbox(loudness_frame, from_=-31, to=-5, increment=1, width=6,
+                   textvariable=self.loudness_target_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(loudness_frame, text="(replaygain = solo etiquetas, normalize = ajustar al convertir)"
+                  ).pack(side=tk.LEFT, padx=(10, 0))
+        
         # File organization
         org_frame = ttk.LabelFrame(frame, text="Organizacion de Archivos", padding=15)
         org_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -463,6 +419,26 @@ class EnhancedApp:
                        variable=self.artist_folder_var).pack(anchor=tk.W, pady=3)
         ttk.Checkbutton(org_frame, text="Omitir archivos que ya existen", 
                        variable=self.skip_existing_var).pack(anchor=tk.W, pady=3)
+        ttk.Checkbutton(org_frame, text="Descargar listas, sets y paginas de artista completas", 
+                       variable=self.playlist_mode_var).pack(anchor=tk.W, pady=3)
+        
+        items_frame = ttk.Frame(org_frame)
+        items_frame.pack(fill=tk.X, pady=(3, 0))
+        ttk.Label(items_frame, text="Rango de pistas (ej. 1-50,75):").pack(side=tk.LEFT)
+        ttk.Entry(items_frame, textvariable=self.playlist_items_var, width=20).pack(side=tk.LEFT, padx=(10, 0))
+        
+        ttk.Label(items_frame, text="Orden de la cola:").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Combobox(items_frame, textvariable=self.queue_order_var, values=Config.QUEUE_ORDERS,
+                    width=10, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(items_frame, text="(shortest = las mas cortas primero)").pack(side=tk.LEFT, padx=(10, 0))
+        
+        dedup_frame = ttk.Frame(org_frame)
+        dedup_frame.pack(fill=tk.X, pady=(3, 0))
+        ttk.Label(dedup_frame, text="Pistas duplicadas:").pack(side=tk.LEFT)
+        ttk.Combobox(dedup_frame, textvariable=self.dedup_action_var, values=Config.DEDUP_ACTIONS,
+                    width=10, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(dedup_frame, text="(misma grabacion desde otra URL: skip = omitir, "
+                                    "hardlink = enlazar sin ocupar espacio)").pack(side=tk.LEFT, padx=(10, 0))
         
         # Cover art settings
         cover_frame = ttk.LabelFrame(frame, text="Configuracion de Caratulas", padding=15)
@@ -476,7 +452,60 @@ class EnhancedApp:
         
         ttk.Label(cover_options_frame, text="Formato de caratula:", font=('Arial', 10, 'bold')).pack(side=tk.LEFT)
         ttk.Combobox(cover_options_frame, textvariable=self.cover_format_var, 
-                    values=["jpg", "png", "webp"], width=8, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+                    values=Config.COVER_FORMATS, width=8, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        
+        ttk.Label(cover_options_frame, text="Tamaño (px):", font=('Arial', 10, 'bold')).pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Combobox(cover_options_frame, textvariable=self.cover_size_var, 
+                    values=Config.COVER_SIZES, width=10, state="readonly").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(cover_frame, text="El tamaño se aplica a la caratula embebida y al archivo separado", 
+                 foreground="gray").pack(anchor=tk.W, pady=(5, 0))
+        
+        # Download archive
+        archive_frame = ttk.LabelFrame(frame, text="Historial de Descargas", padding=15)
+        archive_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.lbl_archive = ttk.Label(archive_frame, text=f"Pistas en el historial: {self.archive.count()}")
+        self.lbl_archive.pack(anchor=tk.W, pady=(0, 5))
+        
+        archive_buttons = ttk.Frame(archive_frame)
+        archive_buttons.pack(fill=tk.X)
+        ttk.Button(archive_buttons, text="Importar biblioteca existente", 
+                  command=lambda: self._scan_library(rebuild=False)).pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(archive_buttons, text="Reconstruir historial", 
+                  command=lambda: self._scan_library(rebuild=True)).pack(side=tk.LEFT)
+        
+        # Bandwidth budget
+        bandwidth_frame = ttk.LabelFrame(frame, text="Ancho de Banda", padding=15)
+        bandwidth_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(bandwidth_frame, text="Limite total (KB/s):").pack(side=tk.LEFT)
+        ttk.Spinbox(bandwidth_frame, from_=0, to=1000000, increment=100, width=10,
+                    textvariable=self.bandwidth_limit_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(bandwidth_frame, text="Por descarga (KB/s):").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Spinbox(bandwidth_frame, from_=0, to=1000000, increment=100, width=10,
+                    textvariable=self.job_bandwidth_limit_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(bandwidth_frame, text="(0 = sin limite, se aplica al guardar)").pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Staging folder and free space
+        disk_frame = ttk.LabelFrame(frame, text="Disco", padding=15)
+        disk_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(disk_frame, text="Carpeta temporal (vacia = la carpeta de salida):").pack(anchor=tk.W)
+        staging_input_frame = ttk.Frame(disk_frame)
+        staging_input_frame.pack(fill=tk.X, pady=(5, 10))
+        ttk.Entry(staging_input_frame, textvariable=self.staging_dir_var).pack(side=tk.LEFT, fill=tk.X, expand=True,
+                                                                               padx=(0, 10))
+        ttk.Button(staging_input_frame, text="Explorar", command=self._choose_staging_dir,
+                   width=12).pack(side=tk.RIGHT)
+        
+        free_frame = ttk.Frame(disk_frame)
+        free_frame.pack(fill=tk.X)
+        ttk.Label(free_frame, text="Espacio libre minimo (MB):").pack(side=tk.LEFT)
+        ttk.Spinbox(free_frame, from_=0, to=1000000, increment=100, width=10,
+                    textvariable=self.min_free_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(free_frame, text="(las descargas que no caben esperan)").pack(side=tk.LEFT, padx=(10, 0))
+        
+        self._build_log_settings(frame)
         
         # Action buttons
         action_frame = ttk.Frame(frame)
@@ -489,6 +518,67 @@ class EnhancedApp:
         ttk.Button(action_frame, text="Abrir carpeta de configuracion", 
                   command=self._open_config_folder).pack(side=tk.LEFT)
 
+    def _build_library_tab(self):
+        """Build the search over downloaded tracks"""
+        frame = self.library_frame
+        
+        search_frame = ttk.LabelFrame(frame, text="Buscar en la biblioteca", padding=15)
+        search_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        search_entry = ttk.Entry(search_frame, textvariable=self.library_search_var, font=('Consolas', 10))
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        # The index answers in milliseconds, so search while typing (after a short pause)
+        search_entry.bind("<KeyRelease>", lambda event: self._schedule_library_search())
+        ttk.Button(search_frame, text="Reescanear carpeta", 
+                  command=self._rescan_library).pack(side=tk.RIGHT)
+        
+        self.lbl_library = ttk.Label(frame, text=f"Pistas en la biblioteca: {self.library.count()}")
+        self.lbl_library.pack(anchor=tk.W, padx=10)
+        
+        results_frame = ttk.Frame(frame, padding=10)
+        results_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ("artista", "titulo", "duracion", "formato", "tamano", "ruta")
+        self.library_tree = ttk.Treeview(results_frame, columns=columns, show="headings", height=15)
+        headings = ("Artista", "Titulo", "Duracion", "Formato", "Tamano", "Archivo")
+        for column, heading in zip(columns, headings):
+            self.library_tree.heading(column, text=heading)
+            self.library_tree.column(column, width=80, anchor=tk.CENTER)
+        self.library_tree.column("artista", width=160, anchor=tk.W)
+        self.library_tree.column("titulo", width=240, anchor=tk.W)
+        self.library_tree.column("ruta", width=300, anchor=tk.W)
+        library_scroll = ttk.Scrollbar(results_frame, orient=tk.VERTICAL, command=self.library_tree.yview)
+        self.library_tree.configure(yscrollcommand=library_scroll.set)
+        self.library_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        library_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        # Double click shows the file in its folder
+        self.library_tree.bind("<Double-1>", lambda event: self._open_library_track())
+        self._library_search_job = None
+        self._search_library()
+
+    def _build_stats_tab(self):
+        """Build per-job timing statistics tab"""
+        frame = self.stats_frame
+        
+        summary_frame = ttk.LabelFrame(frame, text="Resumen", padding=15)
+        summary_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.stats_text = tk.Text(summary_frame, height=14, wrap='none', state=tk.DISABLED,
+                                  font=('Consolas', 9), relief=tk.FLAT, borderwidth=0)
+        self.stats_text.pack(fill=tk.X)
+        
+        recent_frame = ttk.LabelFrame(frame, text="Ultimas descargas", padding=10)
+        recent_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        columns = ("url", "estado", "total", "descarga", "bytes", "velocidad", "reintentos")
+        self.stats_tree = ttk.Treeview(recent_frame, columns=columns, show="headings", height=8)
+        headings = ("URL", "Estado", "Total", "Descarga", "Tamano", "Velocidad", "Reintentos")
+        for column, heading in zip(columns, headings):
+            self.stats_tree.heading(column, text=heading)
+            self.stats_tree.column(column, width=80, anchor=tk.CENTER)
+        self.stats_tree.column("url", width=300, anchor=tk.W)
+        self.stats_tree.pack(fill=tk.BOTH, expand=True)
+
     def _build_info_tab(self):
         """Build info/about tab"""
         frame = self.info_frame
@@ -552,17 +642,84 @@ class EnhancedApp:
         if directory:
             self.outdir_var.set(directory)
 
-    def _save_settings(self):
-        """Save current settings to config"""
-        self.config.update({
+    def _choose_staging_dir(self):
+        """Choose the local folder for intermediate files"""
+        directory = filedialog.askdirectory(title="Seleccionar carpeta temporal", 
+                                          initialdir=self.staging_dir_var.get() or self.outdir_var.get())
+        if directory:
+            self.staging_dir_var.set(directory)
+
+    def _settings_from_ui(self) -> Dict[str, Any]:
+        """Current values of every setting widget"""
+        return {
             'output_dir': self.outdir_var.get(),
             'bitrate': self.bitrate_var.get(),
             'format': self.format_var.get(),
             'create_artist_folders': self.artist_folder_var.get(),
             'skip_existing': self.skip_existing_var.get(),
             'save_cover_art': self.save_cover_var.get(),
-            'cover_format': self.cover_format_var.get()
-        })
+            'cover_format': self.cover_format_var.get(),
+            'cover_size': self.cover_size_var.get(),
+            'playlist_mode': self.playlist_mode_var.get(),
+            'playlist_items': self.playlist_items_var.get().strip(),
+            'queue_order': self.queue_order_var.get(),
+            'dedup_action': self.dedup_action_var.get(),
+            'loudness_mode': self.loudness_mode_var.get(),
+            'loudness_target': self._loudness_target(),
+            'log_max_lines': self._log_max_lines(),
+            'log_format': self.log_format_var.get(),
+            'metrics_port': self._metrics_port(),
+            'bandwidth_limit_kb': self._bandwidth_limit(self.bandwidth_limit_var),
+            'job_bandwidth_limit_kb': self._bandwidth_limit(self.job_bandwidth_limit_var),
+            'staging_dir': self.staging_dir_var.get().strip(),
+            'min_free_mb': self._min_free()
+        }
+
+    def _metrics_port(self) -> int:
+        """Validated value of the metrics port"""
+        try:
+            return min(65535, max(0, int(self.metrics_port_var.get())))
+        except (tk.TclError, ValueError):
+            return 0
+
+    def _bandwidth_limit(self, var: tk.IntVar) -> int:
+        """Validated value of a bandwidth limit in KB/s"""
+        try:
+            return max(0, int(var.get()))
+        except (tk.TclError, ValueError):
+            return 0
+
+    def _min_free(self) -> int:
+        """Validated free-space margin in MB"""
+        try:
+            return max(0, int(self.min_free_var.get()))
+        except (tk.TclError, ValueError):
+            return self.config_manager.default_config['min_free_mb']
+
+    def _loudness_target(self) -> float:
+        """Validated loudness target in LUFS"""
+        try:
+            return min(-5.0, max(-31.0, float(self.loudness_target_var.get())))
+        except (tk.TclError, ValueError):
+            return self.config_manager.default_config['loudness_target']
+
+    def _log_max_lines(self) -> int:
+        """Validated value of the log line cap"""
+        try:
+            return max(100, int(self.log_max_lines_var.get()))
+        except (tk.TclError, ValueError):
+            return self.config_manager.default_config['log_max_lines']
+
+    def _save_settings(self):
+        """Save current settings to config"""
+        previous_format = self.config['log_format']
+        self.config.update(self._settings_from_ui())
+        self.log_buffer.set_max_lines(self.config['log_max_lines'])
+        # Running downloads pick up the new budget on their next block
+        self.scheduler.set_bandwidth_limits(self.config['bandwidth_limit_kb'], self.config['job_bandwidth_limit_kb'])
+        self.scheduler.set_min_free(self.config['min_free_mb'])
+        if self.config['log_format'] != previous_format:
+            setup_logging(json_format=self.config['log_format'] == 'json')
         self.config_manager.save_config(self.config)
         messagebox.showinfo("Configuracion", "Configuracion guardada correctamente")
 
@@ -577,6 +734,20 @@ class EnhancedApp:
             self.skip_existing_var.set(defaults['skip_existing'])
             self.save_cover_var.set(defaults['save_cover_art'])
             self.cover_format_var.set(defaults['cover_format'])
+            self.cover_size_var.set(defaults['cover_size'])
+            self.playlist_mode_var.set(defaults['playlist_mode'])
+            self.playlist_items_var.set(defaults['playlist_items'])
+            self.queue_order_var.set(defaults['queue_order'])
+            self.dedup_action_var.set(defaults['dedup_action'])
+            self.loudness_mode_var.set(defaults['loudness_mode'])
+            self.loudness_target_var.set(defaults['loudness_target'])
+            self.log_max_lines_var.set(defaults['log_max_lines'])
+            self.log_format_var.set(defaults['log_format'])
+            self.metrics_port_var.set(defaults['metrics_port'])
+            self.bandwidth_limit_var.set(defaults['bandwidth_limit_kb'])
+            self.job_bandwidth_limit_var.set(defaults['job_bandwidth_limit_kb'])
+            self.staging_dir_var.set(defaults['staging_dir'])
+            self.min_free_var.set(defaults['min_free_mb'])
             messagebox.showinfo("Configuracion", "Configuracion restaurada")
 
     def _open_output_folder(self):
@@ -604,10 +775,128 @@ class EnhancedApp:
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo abrir la carpeta de configuracion: {e}")
 
+    def _start_metrics_server(self, port: int) -> Optional[MetricsServer]:
+        """Serve the metrics locally when a port is configured"""
+        if not port:
+            return None
+        try:
+            server = MetricsServer(self.scheduler.metrics, port)
+            server.start()
+            self.logger.info(f"Metrics endpoint on http://127.0.0.1:{server.port}/metrics")
+            return server
+        except OSError as e:
+            self.logger.error(f"Failed to start metrics endpoint on port {port}: {e}")
+            return None
+
+    def _refresh_stats(self):
+        """Redraw the stats tab while it is visible"""
+        if self.notebook.select() == str(self.stats_frame):
+            summary = self.scheduler.metrics.summary()
+            states = ", ".join(f"{state}: {count}" for state, count in summary['states'].items())
+            lines = [
+                f"Descargas: {summary['jobs']}" + (f" ({states})" if states else ""),
+                f"Datos: {self._format_bytes(summary['bytes'])} - Reintentos: {summary['retries']}",
+                f"Duplicados: {summary['duplicates']} ({self._format_bytes(summary['saved_bytes'])} ahorrados)",
+                f"Rendimiento: {summary['throughput_mbps']:.2f} MB/s global, "
+                f"{summary['transfer_mbps']:.2f} MB/s por transferencia, "
+                f"{summary['tracks_per_min']:.1f} pistas/min",
+                "",
+                f"{'Fase':<32}{'p50':>10}{'p95':>10}{'n':>7}",
+            ]
+            for name, stats in summary['phases'].items():
+                lines.append(f"{name:<32}{stats['p50']:>9.2f}s{stats['p95']:>9.2f}s{stats['count']:>7}")
+            self.stats_text.config(state=tk.NORMAL)
+            self.stats_text.delete("1.0", tk.END)
+            self.stats_text.insert("1.0", "\n".join(lines))
+            self.stats_text.config(state=tk.DISABLED)
+            
+            self.stats_tree.delete(*self.stats_tree.get_children())
+            for job in self.scheduler.metrics.recent(100):
+                self.stats_tree.insert("", tk.END, values=(
+                    job['url'], job['state'], f"{job['duration']:.1f}s",
+                    f"{job['phases'].get('download', 0):.1f}s", self._format_bytes(job['bytes']),
+                    self._format_speed(job['speed']), job['retries']
+                ))
+        self.root.after(2000, self._refresh_stats)
+
+    def _schedule_library_search(self):
+        """Search once typing pauses"""
+        if self._library_search_job is not None:
+            self.root.after_cancel(self._library_search_job)
+        self._library_search_job = self.root.after(150, self._search_library)
+
+    def _search_library(self):
+        """Show the tracks matching the search box"""
+        self._library_search_job = None
+        self.library_tree.delete(*self.library_tree.get_children())
+        for track in self.library.search(self.library_search_var.get()):
+            duration = time.strftime('%M:%S', time.gmtime(track['duration'])) if track['duration'] else ""
+            fmt = track['format'] or ""
+            if track['bitrate']:
+                fmt += f" {track['bitrate']}k"
+            self.library_tree.insert("", tk.END, values=(
+                track['artist'] or "", track['title'] or "", duration, fmt,
+                self._format_bytes(track['size']), track['path']
+            ))
+        self.lbl_library.config(text=f"Pistas en la biblioteca: {self.library.count()}")
+
+    def _open_library_track(self):
+        """Open the folder of the selected library track"""
+        selection = self.library_tree.selection()
+        if not selection:
+            return
+        folder = os.path.dirname(self.library_tree.set(selection[0], "ruta"))
+        if not os.path.exists(folder):
+            messagebox.showwarning("Carpeta no encontrada", "La carpeta de esta pista ya no existe")
+            return
+        try:
+            if os.name == 'nt':  # Windows
+                os.startfile(folder)
+            elif os.name == 'posix':  # macOS and Linux
+                os.system(f'open "{folder}"' if sys.platform == 'darwin' else f'xdg-open "{folder}"')
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo abrir la carpeta: {e}")
+
+    def _rescan_library(self):
+        """Sync the library index with the output folder in the background"""
+        folder = self.outdir_var.get()
+        
+        def scan():
+            try:
+                added, updated, removed = self.library.rescan(folder)
+                self.progress_queue.put((None, "status", f"Biblioteca actualizada: {added} nuevas, "
+                                                         f"{updated} modificadas, {removed} eliminadas"))
+            except Exception as e:
+                self.progress_queue.put((None, "status", f"Error al reescanear la biblioteca: {e}"))
+            self.root.after(0, self._search_library)
+        
+        self.lbl_library.config(text="Escaneando biblioteca...")
+        threading.Thread(target=scan, daemon=True).start()
+
+    def _scan_library(self, rebuild: bool):
+        """Fill the download archive from a library folder in the background"""
+        if rebuild and not messagebox.askyesno("Reconstruir historial", 
+                                               "¿Borrar el historial y reconstruirlo desde una carpeta?"):
+            return
+        folder = filedialog.askdirectory(title="Seleccionar carpeta de la biblioteca", 
+                                         initialdir=self.outdir_var.get())
+        if not folder:
+            return
+        
+        def scan():
+            try:
+                added = self.archive.rebuild(folder) if rebuild else self.archive.import_library(folder)
+                self.progress_queue.put((None, "status", f"Historial actualizado: {added} pistas desde {folder}"))
+            except Exception as e:
+                self.progress_queue.put((None, "status", f"Error al importar la biblioteca: {e}"))
+        
+        self.lbl_archive.config(text="Escaneando biblioteca...")
+        threading.Thread(target=scan, daemon=True).start()
+
     def _on_download(self):
-        """Start download process"""
-        url = self.url_var.get().strip()
-        if not url:
+        """Queue every URL in the entry for download"""
+        urls = self._parse_urls(self.url_var.get())
+        if not urls:
             messagebox.showwarning("URL vacia", "Ingresa una URL valida")
             return
         
@@ -617,92 +906,221 @@ class EnhancedApp:
             return
         
         # Update config with current values
-        self.config.update({
-            'output_dir': output_dir,
-            'bitrate': self.bitrate_var.get(),
-            'format': self.format_var.get(),
-            'create_artist_folders': self.artist_folder_var.get(),
-            'skip_existing': self.skip_existing_var.get(),
-            'save_cover_art': self.save_cover_var.get(),
-            'cover_format': self.cover_format_var.get()
-        })
-        
-        # Reset UI state
-        self.stop_event.clear()
-        self.progress['value'] = 0
-        self.progress_label.config(text="0%")
-        self.progress.config(mode='determinate')
-        self._clear_log()
-        self._update_info("")
-        self.lbl_status.config(text="Preparando descarga...")
+        settings = self._settings_from_ui()
+        if settings['playlist_mode']:
+            try:
+                parse_playlist_items(settings['playlist_items'])
+            except ValueError as e:
+                messagebox.showwarning("Rango invalido", str(e))
+                return
+        self.config.update(settings)
+        
+        # Reset UI state when starting a new batch
+        if self.scheduler.is_idle():
+            self.progress['value'] = 0
+            self.progress_label.config(text="0%")
+            self.progress.config(mode='determinate')
+            self._clear_log()
+            self._clear_queue()
+            self._update_info("")
+        self.lbl_status.config(text=f"Preparando {len(urls)} descarga(s)...")
         
         # Update buttons
-        self.btn_download.config(state=tk.DISABLED)
+        self.btn_pause.config(state=tk.NORMAL)
+        self.btn_resume.config(state=tk.NORMAL)
         self.btn_cancel.config(state=tk.NORMAL)
         
-        # Start worker
-        self.worker = DownloaderThread(
-            url=url,
-            config=self.config,
-            progress_queue=self.progress_queue,
-            stop_event=self.stop_event,
-            logger=self.logger
-        )
-        self.worker.start()
+        # Queue rows are added as the scheduler reports each job as queued
+        for url in urls:
+            if settings['playlist_mode']:
+                self.scheduler.submit_playlist(url, settings['playlist_items'])
+            else:
+                self.scheduler.submit(url)
+        self.url_var.set("")
+        self._poll_interval = Config.POLL_MIN_MS
+
+    def _offer_resume(self, count: int):
+        """Ask whether to resume the jobs journaled by the previous session"""
+        if not messagebox.askyesno("Descargas pendientes",
+                                   f"Hay {count} descarga(s) sin terminar de la sesion anterior.\n"
+                                   "¿Reanudarlas ahora?"):
+            self.journal.discard_unfinished()
+            return
+        self.btn_pause.config(state=tk.NORMAL)
+        self.btn_resume.config(state=tk.NORMAL)
+        self.btn_cancel.config(state=tk.NORMAL)
+        self.lbl_status.config(text=f"Reanudando {count} descarga(s)...")
+        self.scheduler.resume_journal()
+        self._poll_interval = Config.POLL_MIN_MS
+
+    def _parse_urls(self, text: str) -> List[str]:
+        """Split the URL entry into individual URLs"""
+        return [part for part in text.replace(',', ' ').split() if part]
+
+    def _selected_jobs(self) -> List[str]:
+        """Job ids selected in the queue view"""
+        rows = set(self.job_tree.selection())
+        return [job_id for job_id, row in self.job_rows.items() if row in rows]
+
+    def _on_pause(self):
+        """Pause the selected jobs (or all of them)"""
+        for job_id in self._selected_jobs() or list(self.job_rows):
+            self.scheduler.pause(job_id)
+
+    def _on_resume(self):
+        """Resume the selected jobs (or all of them)"""
+        for job_id in self._selected_jobs() or list(self.job_rows):
+            self.scheduler.resume(job_id)
 
     def _on_cancel(self):
-        """Cancel download"""
-        if messagebox.askyesno("Cancelar", "¿Cancelar la descarga actual?"):
-            self.stop_event.set()
+        """Cancel the selected jobs, or every job when nothing is selected"""
+        selected = self._selected_jobs()
+        question = "¿Cancelar las descargas seleccionadas?" if selected else "¿Cancelar todas las descargas?"
+        if messagebox.askyesno("Cancelar", question):
+            if selected:
+                for job_id in selected:
+                    self.scheduler.cancel(job_id)
+            else:
+                self.scheduler.cancel_all()
             self.lbl_status.config(text="Cancelando...")
 
     def _periodic_check(self):
-        """Periodic check for progress updates"""
-        try:
-            while True:
-                msg_type, payload = self.progress_queue.get_nowait()
-                self._handle_progress_message(msg_type, payload)
-        except queue.Empty:
-            pass
-        
-        # Check if worker finished
-        if self.worker and not self.worker.is_alive():
-            if self.btn_cancel['state'] == tk.NORMAL:
-                self._finish_download()
-        
-        self.root.after(200, self._periodic_check)
+        """Apply one batched UI update per tick, backing off while idle"""
+        # Sample idleness before draining so no final message is missed
+        idle = self.scheduler.is_idle()
+        events, progress = self.progress_queue.drain()
+        for job_id, msg_type, payload in events:
+            self._handle_progress_message(job_id, msg_type, payload)
+        if progress:
+            self._apply_progress(progress)
+        self._render_log()
+        self._update_bandwidth()
+        
+        # Check if the whole batch finished
+        if idle and self.btn_cancel['state'] == tk.NORMAL:
+            self._finish_download()
+        
+        if events or progress:
+            self._poll_interval = Config.POLL_MIN_MS
+        else:
+            self._poll_interval = min(Config.POLL_MAX_MS, self._poll_interval * 2)
+        self.root.after(self._poll_interval, self._periodic_check)
 
-    def _handle_progress_message(self, msg_type: str, payload: Any):
+    def _update_bandwidth(self):
+        """Show the aggregate throughput against the bandwidth budget"""
+        status = self.scheduler.bandwidth.status()
+        text = f"Ancho de banda: {self._format_speed(status['throughput']) or '0 B/s'}"
+        if status['limit']:
+            text += f" de {self._format_speed(status['limit'])}"
+        if status['active']:
+            text += f" - {status['active']} transferencias"
+            if status['job_rate']:
+                text += f" a {self._format_speed(status['job_rate'])} cada una"
+        batch = self.scheduler.batch_estimate()
+        if batch['remaining_bytes']:
+            text += f" | Lote: ~{self._format_bytes(batch['remaining_bytes'])} restantes"
+            if batch['eta']:
+                text += f", ETA {time.strftime('%H:%M:%S', time.gmtime(batch['eta']))}"
+            if batch['unknown']:
+                text += f" (+{batch['unknown']} sin estimar)"
+        self.lbl_bandwidth.config(text=text)
+
+    def _apply_progress(self, progress: Dict[Optional[str], Dict[str, Any]]):
+        """Apply the latest progress of every job in a single pass"""
+        for job_id, info in progress.items():
+            self._update_job_progress(job_id, info)
+        # A single status line update per tick, for the last job in the batch
+        self._update_progress(info)
+
+    def _handle_progress_message(self, job_id: Optional[str], msg_type: str, payload: Any):
         """Handle different types of progress messages"""
         if msg_type == "progress":
-            self._update_progress(payload)
+            self._apply_progress({job_id: payload})
+        elif msg_type == "state":
+            self._update_job_state(job_id, payload)
         elif msg_type == "status":
             self._append_log(payload)
             self.lbl_status.config(text=payload)
+            if job_id is None:
+                self.lbl_archive.config(text=f"Pistas en el historial: {self.archive.count()}")
         elif msg_type == "info":
             self._update_info_display(payload)
+            self._set_job_column(job_id, "titulo", f"{payload.get('artist', '')} - {payload.get('title', '')}")
+            if payload.get('duration') or payload.get('estimated_size'):
+                self._set_job_column(job_id, "estimado", self._format_estimate(payload))
         elif msg_type == "complete":
             self._append_log(f"✅ {payload}")
             self.lbl_status.config(text=f"✅ {payload}")
-            self.progress['value'] = 100
-            self.progress_label.config(text="100%")
-            self._finish_download(success=True)
+            self.job_percent[job_id] = 100.0
+            self._set_job_column(job_id, "progreso", "100%")
         elif msg_type == "error":
             self._append_log(f"❌ {payload}")
             self.lbl_status.config(text=f"❌ {payload}")
-            self._finish_download(success=False)
         elif msg_type == "canceled":
             self._append_log(f"⚠️ {payload}")
             self.lbl_status.config(text=f"⚠️ {payload}")
-            self._finish_download(success=False)
+        elif msg_type == "skipped":
+            self._append_log(f"⏭️ {payload}")
+            self.lbl_status.config(text=payload)
+
+    def _update_job_state(self, job_id: str, state: str):
+        """Reflect a job state change in the queue view"""
+        if job_id not in self.job_rows:
+            job = self.scheduler.jobs.get(job_id)
+            label = (job.title or job.url) if job else job_id
+            self.job_rows[job_id] = self.job_tree.insert("", tk.END, values=(label, "", "", "0%"))
+            self.job_percent[job_id] = 0.0
+        labels = {
+            JOB_QUEUED: "En cola", JOB_RUNNING: "Descargando", JOB_PAUSED: "En pausa",
+            JOB_CONVERTING: "Convirtiendo",
+            JOB_DONE: "Completado", JOB_ERROR: "Error", JOB_CANCELED: "Cancelado",
+            JOB_SKIPPED: "Omitido"
+        }
+        self._set_job_column(job_id, "estado", labels.get(state, state))
+        if state in FINISHED_STATES:
+            self.batch_results[job_id] = state
+            self._update_batch_progress()
+
+    def _update_job_progress(self, job_id: str, info: Dict[str, Any]):
+        """Update one job's row and the overall batch progress"""
+        percent = info.get('percent')
+        if percent is None:
+            return
+        self.job_percent[job_id] = max(0.0, min(100.0, percent))
+        self._set_job_column(job_id, "progreso", f"{self.job_percent[job_id]:.0f}%")
+
+    def _set_job_column(self, job_id: Optional[str], column: str, value: str):
+        """Set a single cell of a job row"""
+        row = self.job_rows.get(job_id)
+        if row is not None:
+            self.job_tree.set(row, column, value)
+
+    def _update_batch_progress(self):
+        """Overall progress across every job of the batch"""
+        if not self.job_percent:
+            return
+        done = sum(100.0 if job_id in self.batch_results else percent
+                   for job_id, percent in self.job_percent.items())
+        progress_val = done / len(self.job_percent)
+        self.progress['value'] = progress_val
+        self.progress_label.config(text=f"{progress_val:.0f}%")
+
+    def _clear_queue(self):
+        """Remove all rows from the queue view"""
+        self.job_tree.delete(*self.job_tree.get_children())
+        self.job_rows.clear()
+        self.job_percent.clear()
+        self.batch_results.clear()
 
     def _update_progress(self, info: Dict[str, Any]):
         """Update progress bar and status"""
         percent = info.get('percent')
         if percent is not None:
+            if self.progress['mode'] == 'indeterminate':
+                self.progress.stop()
+                self.progress.config(mode='determinate')
+            self._update_batch_progress()
             progress_val = max(0, min(100, percent))
-            self.progress['value'] = progress_val
-            self.progress_label.config(text=f"{progress_val:.0f}%")
             
             downloaded = self._format_bytes(info.get('downloaded', 0))
             total = self._format_bytes(info.get('total', 0))
@@ -733,12 +1151,22 @@ class EnhancedApp:
         self.download_info = info
         info_text = f"Titulo: {info.get('title', 'N/A')}\n"
         info_text += f"Artista: {info.get('artist', 'N/A')}\n"
-        if info.get('duration'):
-            duration = time.strftime('%M:%S', time.gmtime(info['duration']))
-            info_text += f"Duracion: {duration}"
+        if info.get('duration') or info.get('estimated_size'):
+            info_text += self._format_estimate(info, labels=True)
         
         self._update_info(info_text)
 
+    def _format_estimate(self, info: Dict[str, Any], labels: bool = False) -> str:
+        """Duration and estimated download size of a track"""
+        parts = []
+        if info.get('duration'):
+            duration = time.strftime('%M:%S', time.gmtime(info['duration']))
+            parts.append(f"Duracion: {duration}" if labels else duration)
+        if info.get('estimated_size'):
+            size = f"~{self._format_bytes(info['estimated_size'])}"
+            parts.append(f"Tamano estimado: {size}" if labels else size)
+        return " - ".join(parts)
+
     def _update_info(self, text: str):
         """Update info text widget"""
         self.info_text.config(state=tk.NORMAL)
@@ -747,41 +1175,85 @@ class EnhancedApp:
         self.info_text.config(state=tk.DISABLED)
 
     def _append_log(self, text: str):
-        """Append text to log"""
-        timestamp = time.strftime("%H:%M:%S")
+        """Append text to log (rendered on the next tick)"""
+        self.log_buffer.append(text)
+
+    def _render_log(self):
+        """Insert pending log lines in one batch and trim the widget to the cap"""
+        lines = self.log_buffer.take_pending()
+        if not lines:
+            return
+        # Only follow the tail if the user has not scrolled up
+        at_bottom = self.txt_log.yview()[1] >= 0.999
         self.txt_log.config(state=tk.NORMAL)
-        self.txt_log.insert(tk.END, f"[{timestamp}] {text}\n")
-        self.txt_log.see(tk.END)
+        self.txt_log.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.txt_log.index("end-1c").split('.')[0]) - 1
+        excess = line_count - self.log_buffer.max_lines
+        if excess > 0:
+            self.txt_log.delete("1.0", f"{excess + 1}.0")
+        if at_bottom:
+            self.txt_log.see(tk.END)
         self.txt_log.config(state=tk.DISABLED)
 
     def _clear_log(self):
         """Clear log text"""
+        self.log_buffer.clear()
         self.txt_log.config(state=tk.NORMAL)
         self.txt_log.delete("1.0", tk.END)
         self.txt_log.config(state=tk.DISABLED)
 
-    def _finish_download(self, success: bool = False):
-        """Finish download and reset UI"""
+    def _search_log(self):
+        """Show the session log lines matching the search term"""
+        term = self.log_search_var.get().strip()
+        if not term:
+            return
+        matches = self.log_buffer.search(term)
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Log: '{term}' ({len(matches)} resultados)")
+        window.geometry("700x400")
+        results = tk.Text(window, wrap='word', font=('Consolas', 8), bg='#f8f9fa', fg='#495057')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=results.yview)
+        results.configure(yscrollcommand=scrollbar.set)
+        results.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        results.insert("1.0", "\n".join(matches) if matches else "Sin resultados")
+        results.config(state=tk.DISABLED)
+
+    def _finish_download(self):
+        """Finish the batch and reset UI"""
         # Stop indeterminate progress
         if self.progress['mode'] == 'indeterminate':
             self.progress.stop()
             self.progress.config(mode='determinate')
         
+        completed = sum(1 for state in self.batch_results.values() if state == JOB_DONE)
+        skipped = sum(1 for state in self.batch_results.values() if state == JOB_SKIPPED)
+        total = len(self.job_rows)
+        success = completed + skipped > 0
+        
         if not success:
             self.progress['value'] = 0
             self.progress_label.config(text="0%")
         
         # Reset buttons
         self.btn_download.config(state=tk.NORMAL)
+        self.btn_pause.config(state=tk.DISABLED)
+        self.btn_resume.config(state=tk.DISABLED)
         self.btn_cancel.config(state=tk.DISABLED)
         
         if success:
             # Show success notification
-            if self.download_info:
+            if total == 1 and completed == 1 and self.download_info:
                 title = self.download_info.get('title', 'Audio')
                 artist = self.download_info.get('artist', 'Artista desconocido')
                 messagebox.showinfo("Descarga Completada", 
                                   f"'{title}' de {artist}\n\nAudio descargado, Agradece a Alonso cada descarga\nCaratula procesada\nMetadatos embebidos")
+            else:
+                messagebox.showinfo("Descargas Completadas",
+                                  f"{completed} de {total} descargas completadas"
+                                  f"{f' ({skipped} ya descargadas)' if skipped else ''}"
+                                  f"\n\nAgradece a Alonso cada descarga")
             
             # Update status
             self.lbl_status.config(text="Descarga completada - Listo para nueva descarga")
@@ -805,18 +1277,24 @@ class EnhancedApp:
 
     def _on_closing(self):
         """Handle application closing"""
-        if self.worker and self.worker.is_alive():
-            if messagebox.askyesno("Salir", "¿Cancelar descarga y salir?"):
-                self.stop_event.set()
-                self.root.after(100, self._force_close)
+        if not self.scheduler.is_idle() and not messagebox.askyesno(
+                "Salir", "Hay descargas en curso. Podras reanudarlas la proxima vez "
+                         "que abras la aplicacion.\n¿Salir ahora?"):
             return
-        self.root.destroy()
+        self._force_close()
 
     def _force_close(self):
-        """Force close after worker cleanup"""
+        """Close after worker cleanup (idle workers, playlist listings and the FFmpeg stage too)"""
         try:
-            if self.worker and self.worker.is_alive():
-                self.worker.join(timeout=1.0)
+            # Bounded in total: FFmpeg children are killed, transfers stop on their next block
+            if self.scheduler.shutdown(timeout=1.0):
+                self.archive.close()
+                self.journal.close()
+                self.library.close()
+            # Otherwise leave the databases to a worker still stopping; every write is already committed
+            self.log_buffer.close()
+            if self.metrics_server:
+                self.metrics_server.stop()
         except:
             pass
         self.root.destroy()
@@ -826,10 +1304,8 @@ class EnhancedApp:
 # ---------------------------
 def main():
     """Main application entry point"""
-    try:
-        # Check for required dependencies
-        import yt_dlp
-    except ImportError:
+    # Check for required dependencies (without paying for the import yet)
+    if not yt_dlp_available():
         print("Error: yt-dlp no esta instalado. Instala con: pip install yt-dlp")
         sys.exit(1)
     
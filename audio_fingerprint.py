@@ -0,0 +1,220 @@
+"""
+audio_fingerprint.py
+Deteccion de pistas duplicadas aunque lleguen desde otra URL u otra
+plataforma: hash del archivo (copias exactas) y una huella acustica ligera
+calculada con NumPy sobre el audio decodificado por FFmpeg en bloques, con
+memoria acotada sea cual sea la duracion de la pista. Las huellas se guardan
+en un indice SQLite persistente.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from typing import Optional, Tuple
+
+from child_processes import tracked
+from library_index import HASH_CHUNK
+
+np = None  # Imported on first use by the dedup stage: it would add ~80 ms to every startup
+
+SAMPLE_RATE = 5512  # Mono PCM rate the fingerprint is computed at
+FRAME = 2048  # Samples per fingerprint frame (~0.37 s)
+HOP = 256  # Frames overlap so two copies are never misaligned by more than half a hop (~23 ms)
+READ_SAMPLES = 64 * 1024  # PCM samples decoded per block: bounds memory to a few MB
+MAX_FRAMES = 8192  # Frames kept per track (~6 min); the rest only counts towards the duration
+BANDS = 33  # Log-spaced energy bands between MIN_FREQ and MAX_FREQ: 32 bits per frame
+MIN_FREQ = 150.0
+MAX_FREQ = 2000.0
+MAX_SHIFT = 64  # Frames of offset tried when comparing (~3 s of leading silence or intro)
+COMPARE_FRAMES = 1024  # Frames compared at each offset (~48 s)
+MIN_OVERLAP = 128  # Frames two tracks must share to be compared (~6 s)
+MAX_BIT_ERROR = 0.2  # Fraction of differing bits up to which two tracks are the same recording
+DURATION_TOLERANCE = 3.0  # Seconds two copies of a track may differ in length
+
+
+def _load_numpy() -> bool:
+    """Import NumPy the first time it is needed; False if it is not installed"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Without NumPy only byte-identical copies are detected
+            return False
+        np = numpy
+    return True
+
+
+def _band_edges():
+    """FFT bin index at each band edge"""
+    freqs = np.geomspace(MIN_FREQ, MAX_FREQ, BANDS + 1)
+    return np.round(freqs * FRAME / SAMPLE_RATE).astype(int)
+
+
+def fingerprint_frames(samples, previous=None):
+    """32-bit sub-fingerprints of the frames starting every ``HOP`` samples (Haitsma-Kalker style).
+
+    Each bit is the sign of the change, from one frame to the next, of the
+    energy difference between two adjacent bands: robust to re-encoding,
+    volume and bitrate changes. Returns the words and the last frame's band
+    energies to carry over to the next block.
+    """
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::HOP].astype(np.float32)
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME).astype(np.float32), axis=1)) ** 2
+    edges = _band_edges()
+    energies = np.add.reduceat(spectrum, edges[:-1], axis=1)[:, :BANDS]
+    if previous is not None:
+        energies = np.vstack([previous[None, :], energies])
+    if len(energies) < 2:
+        return np.zeros(0, dtype=np.uint32), energies[-1] if len(energies) else previous
+    deltas = np.diff(energies, axis=1)  # Adjacent bands
+    bits = (deltas[1:] - deltas[:-1]) > 0  # Frame to frame
+    words = np.packbits(bits, axis=1, bitorder="little").view(np.uint32).ravel()
+    return words, energies[-1]
+
+
+def analyze(path: Path, owner: Optional[str] = None) -> Tuple[str, Optional[float], Optional[bytes]]:
+    """Content hash, decoded duration and acoustic fingerprint of an audio file.
+
+    The file is hashed in fixed-size chunks and decoded by FFmpeg to
+    low-rate mono PCM that is read one block at a time, so memory stays
+    bounded for tracks of any length. Without FFmpeg or NumPy the duration
+    and fingerprint are None.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or not _load_numpy():
+        return digest.hexdigest(), None, None
+
+    words = []
+    kept = 0
+    samples = 0
+    previous = None
+    leftover = np.zeros(0, dtype=np.int16)
+    # Registered under the job, so canceling it stops the decode
+    with tracked([ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", str(path), "-vn",
+                  "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-"], owner=owner,
+                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        for chunk in iter(lambda: process.stdout.read(READ_SAMPLES * 2), b""):
+            pcm = np.frombuffer(chunk[:len(chunk) // 2 * 2], dtype="<i2")
+            samples += len(pcm)
+            if kept >= MAX_FRAMES:
+                continue  # Keep draining for the duration
+            pcm = np.concatenate([leftover, pcm])
+            if len(pcm) < FRAME:
+                leftover = pcm
+                continue
+            count = (len(pcm) - FRAME) // HOP + 1
+            # The next block starts at the first frame not taken here
+            leftover = pcm[count * HOP:]
+            new, previous = fingerprint_frames(pcm[:(count - 1) * HOP + FRAME], previous)
+            words.append(new[:MAX_FRAMES - kept])
+            kept += len(words[-1])
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0 or not samples:
+        return digest.hexdigest(), None, None
+    fingerprint = np.concatenate(words).astype("<u4").tobytes() if words else b""
+    return digest.hexdigest(), samples / SAMPLE_RATE, fingerprint
+
+
+def bit_error_rate(a: bytes, b: bytes) -> float:
+    """Smallest fraction of differing bits between two fingerprints over the tried offsets"""
+    first = np.frombuffer(a, dtype="<u4")
+    second = np.frombuffer(b, dtype="<u4")
+    best = 1.0
+    for shift in range(-MAX_SHIFT, MAX_SHIFT + 1):
+        x = first[max(0, shift):][:COMPARE_FRAMES]
+        y = second[max(0, -shift):][:COMPARE_FRAMES]
+        overlap = min(len(x), len(y))
+        if overlap < MIN_OVERLAP:
+            continue
+        differing = np.unpackbits((x[:overlap] ^ y[:overlap]).view(np.uint8)).sum()
+        best = min(best, differing / (overlap * 32))
+    return best
+
+
+class DuplicateIndex:
+    """Persistent index of finished tracks by content hash and fingerprint.
+
+    A track is a duplicate of an indexed file with the same hash, or of one
+    of similar duration whose fingerprint is within ``MAX_BIT_ERROR``.
+    Entries whose file is gone are dropped when they come up.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                duration REAL,
+                fingerprint BLOB,
+                added REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_hash ON tracks(hash);
+            CREATE INDEX IF NOT EXISTS tracks_duration ON tracks(duration);
+            CREATE TABLE IF NOT EXISTS savings (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                duplicates INTEGER NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO savings VALUES (1, 0, 0);
+        """)
+        self._conn.commit()
+
+    def find(self, digest: str, duration: Optional[float], fingerprint: Optional[bytes],
+             exclude: Optional[str] = None) -> Optional[str]:
+        """Path of an indexed copy of the track, if any"""
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM tracks WHERE hash = ? AND path != ?",
+                                      (digest, exclude or "")).fetchall()
+            if not rows and duration is not None and fingerprint and _load_numpy():
+                rows = [row for row in self._conn.execute(
+                    "SELECT path, fingerprint FROM tracks WHERE duration BETWEEN ? AND ? AND path != ? "
+                    "AND fingerprint IS NOT NULL", (duration - DURATION_TOLERANCE, duration + DURATION_TOLERANCE,
+                                                    exclude or ""))
+                        if bit_error_rate(fingerprint, row[1]) <= MAX_BIT_ERROR]
+            found = next((row[0] for row in rows if os.path.exists(row[0])), None)
+            missing = [(row[0],) for row in rows if row[0] != found and not os.path.exists(row[0])]
+            if missing:
+                self._conn.executemany("DELETE FROM tracks WHERE path = ?", missing)
+                self._conn.commit()
+        return found
+
+    def add(self, path: Path, digest: str, duration: Optional[float], fingerprint: Optional[bytes]):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)",
+                               (str(path), digest, duration, fingerprint, time.time()))
+            self._conn.commit()
+
+    def record_saving(self, size: int):
+        """Count a duplicate that was dropped or hardlinked"""
+        with self._lock:
+            self._conn.execute("UPDATE savings SET duplicates = duplicates + 1, bytes = bytes + ? WHERE id = 1",
+                               (size,))
+            self._conn.commit()
+
+    def savings(self) -> Tuple[int, int]:
+        """Duplicates found and bytes saved over every session"""
+        with self._lock:
+            return tuple(self._conn.execute("SELECT duplicates, bytes FROM savings WHERE id = 1").fetchone())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def link_duplicate(original: str, duplicate: Path):
+    """Replace ``duplicate`` with a hardlink to ``original`` (atomic; raises OSError across volumes)"""
+    temp = duplicate.with_name(f"{duplicate.stem}.temp{duplicate.suffix}")
+    temp.unlink(missing_ok=True)
+    os.link(original, temp)
+    os.replace(temp, duplicate)
@@ -0,0 +1,346 @@
+"""
+audio_pipeline.py
+Etapa de conversion de audio separada de la descarga: los hilos de descarga
+bajan el stream original (bestaudio) y lo entregan a esta etapa, que ejecuta
+FFmpeg con tantos procesos simultaneos como CPUs, con su propia cola y
+contrapresion. La medicion de sonoridad (ReplayGain o normalizacion) se hace
+aqui, antes de la unica codificacion de cada pista.
+"""
+
+import os
+import time
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from cover_cache import CoverCache
+from child_processes import tracked
+from loudness import LoudnessCache, measure, normalization_gain, replaygain_tags
+
+# Encoder arguments per output format
+CODEC_ARGS = {
+    "mp3": ["-c:a", "libmp3lame"],
+    "m4a": ["-c:a", "aac"],
+    "flac": ["-c:a", "flac", "-sample_fmt", "s16"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+LOSSY_FORMATS = ("mp3", "m4a")  # Formats encoded at the chosen bitrate
+# Source codecs that can be copied into each output format without re-encoding
+COPY_CODECS = {
+    "mp3": ("mp3",),
+    "m4a": ("mp4a", "aac"),
+    "flac": ("flac",),
+    "wav": ("pcm_s16le",),
+}
+# Fallback when the extractor does not report the codec
+EXTENSION_CODECS = {"mp3": "mp3", "m4a": "aac", "aac": "aac", "flac": "flac"}
+BITRATE_TOLERANCE = 0.95  # Reported abr is often slightly under the nominal rate (127.9 for 128)
+EMBED_COVER_FORMATS = ("mp3", "m4a", "flac")  # Containers that can carry an attached picture
+REPLAYGAIN_FORMATS = ("mp3", "m4a", "flac")  # Containers that can carry ReplayGain tags
+LOUDNESS_MODES = ("off", "replaygain", "normalize")
+
+
+def format_selector(audio_format: str) -> str:
+    """yt-dlp format spec that prefers a stream already in the target codec"""
+    if audio_format == "m4a":
+        return "bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best"
+    if audio_format in COPY_CODECS:
+        return f"bestaudio[ext={audio_format}]/bestaudio[acodec={COPY_CODECS[audio_format][0]}]/bestaudio/best"
+    return "bestaudio/best"
+
+
+def source_codec(download: Dict[str, Any]) -> Optional[str]:
+    """Audio codec of a downloaded format, from the codec field or the extension"""
+    acodec = (download.get("acodec") or "").lower()
+    if acodec and acodec != "none":
+        return acodec.split(".")[0]
+    return EXTENSION_CODECS.get((download.get("ext") or "").lower())
+
+
+def can_copy_audio(audio_format: str, codec: Optional[str], abr: Optional[float],
+                   bitrate: str) -> Tuple[bool, str]:
+    """Decide whether the source stream can be copied instead of re-encoded.
+
+    Returns the decision and a short reason for the log.
+    """
+    if not codec or not codec.startswith(COPY_CODECS.get(audio_format, ())):
+        target = f"{audio_format} {bitrate}k" if audio_format in LOSSY_FORMATS else audio_format
+        return False, f"re-encode {codec or 'unknown codec'} to {target}"
+    # An AAC source is kept at any rate; re-encoding it to AAC only loses quality
+    if audio_format == "mp3" and abr and abr < float(bitrate) * BITRATE_TOLERANCE:
+        return False, f"re-encode {codec} {abr:.0f}k to {bitrate}k (source below the chosen bitrate)"
+    return True, f"copy {codec} {f'{abr:.0f}k ' if abr else ''}stream without re-encoding"
+
+
+class TranscodeError(Exception):
+    """FFmpeg is missing or failed to convert a file"""
+
+
+class TranscodeCancelled(Exception):
+    """The job was canceled while waiting for or running its conversion"""
+
+
+class TranscodeSkipped(Exception):
+    """The target appeared while converting and the task keeps existing files"""
+    def __init__(self, path: Path):
+        super().__init__(str(path))
+        self.path = path
+
+
+class TranscodeTask:
+    """A downloaded file waiting to be converted and tagged"""
+    def __init__(self, job_id: Optional[str], source: Path, target: Path, audio_format: str,
+                 bitrate: str, metadata: Dict[str, str], stop_event: Optional[threading.Event] = None,
+                 metrics: Any = None, copy_audio: bool = False, cover_cache: Optional[CoverCache] = None,
+                 cover_digest: Optional[str] = None, cover_output: Optional[Path] = None,
+                 cover_size: Optional[int] = None, loudness_mode: str = "off",
+                 loudness_target: float = -18.0, loudness_key: Optional[str] = None,
+                 loudness_cache: Optional[LoudnessCache] = None, keep_existing: bool = False):
+        self.job_id = job_id
+        self.source = source
+        self.target = target
+        self.audio_format = audio_format
+        self.bitrate = bitrate
+        self.metadata = metadata
+        self.stop_event = stop_event
+        self.metrics = metrics  # JobMetrics of the job, if any
+        self.copy_audio = copy_audio  # Source already fits: remux, no re-encode
+        self.cover_cache = cover_cache
+        self.cover_digest = cover_digest  # Cache key of the track's artwork
+        self.cover_output = cover_output  # Separate cover file to write next to the track
+        self.cover_size = cover_size  # Longest cover side in pixels, None keeps the original
+        self.loudness_mode = loudness_mode  # "replaygain" writes tags, "normalize" applies gain
+        self.loudness_target = loudness_target  # LUFS for "normalize"
+        self.loudness_key = loudness_key  # Cache key of the measurement (extractor and id)
+        self.loudness_cache = loudness_cache
+        self.keep_existing = keep_existing  # Leave a track already at the target untouched
+        # Resolved from the cache by the stage
+        self.cover: Optional[Path] = None  # Image to embed
+        self.cover_file: Optional[Path] = None  # Variant copied to cover_output
+        self.cover_error: Optional[str] = None
+        # Set by the stage once the source is measured
+        self.loudness: Optional[Tuple[float, float]] = None  # Integrated LUFS, sample peak
+        self.gain: Optional[float] = None  # dB applied while encoding
+
+    @property
+    def canceled(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    @property
+    def embeds_cover(self) -> bool:
+        return self.cover is not None and self.audio_format in EMBED_COVER_FORMATS
+
+
+def temp_path(path: Path) -> Path:
+    """Name FFmpeg writes to before the result is moved into place"""
+    return path.with_name(f"{path.stem}.temp{path.suffix}")
+
+
+def build_ffmpeg_command(task: TranscodeTask, ffmpeg: str = "ffmpeg") -> List[str]:
+    """One FFmpeg run for the whole track: audio, tags and embedded cover.
+
+    The cover comes ready from the cache (already JPEG/PNG at the chosen
+    size), so it is only copied into the container.
+    """
+    cmd = [ffmpeg, "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-i", str(task.source)]
+    if task.embeds_cover:
+        cmd += ["-i", str(task.cover)]
+    cmd += ["-map", "0:a:0"]
+    if task.copy_audio:
+        cmd += ["-c:a", "copy"]
+    else:
+        if task.gain is not None:
+            cmd += ["-af", f"volume={task.gain:.2f}dB"]
+        cmd += CODEC_ARGS[task.audio_format]
+        if task.audio_format in LOSSY_FORMATS:
+            cmd += ["-b:a", f"{task.bitrate}k"]
+    if task.embeds_cover:
+        cmd += ["-map", "1:v:0", "-c:v", "copy", "-disposition:v:0", "attached_pic",
+                "-metadata:s:v", "title=Album cover", "-metadata:s:v", "comment=Cover (front)"]
+    if task.audio_format == "mp3":
+        cmd += ["-id3v2_version", "3"]
+    elif task.audio_format == "m4a" and "replaygain_track_gain" in task.metadata:
+        cmd += ["-movflags", "use_metadata_tags"]  # Keep the freeform ReplayGain atoms
+    for key, value in task.metadata.items():
+        cmd += ["-metadata", f"{key}={value}"]
+    cmd.append(str(temp_path(task.target)))
+    return cmd
+
+
+def resolve_covers(task: TranscodeTask):
+    """Take the cover variants this track needs from the cache (converted once per image).
+
+    They stay pinned in the cache until ``release_covers``, so another
+    track's eviction cannot delete them while FFmpeg reads them.
+    """
+    if task.cover_cache is None or task.cover_digest is None:
+        return
+    try:
+        if task.audio_format in EMBED_COVER_FORMATS:
+            task.cover = task.cover_cache.embeddable(task.cover_digest, task.cover_size, pin=True)
+        if task.cover_output is not None:
+            task.cover_file = task.cover_cache.variant(task.cover_digest, task.cover_output.suffix[1:],
+                                                       task.cover_size, pin=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        # A broken thumbnail must not cost the track
+        task.cover_error = str(e)
+
+
+def release_covers(task: TranscodeTask):
+    """Unpin the cover variants taken by ``resolve_covers``"""
+    for path in (task.cover, task.cover_file):
+        if path is not None:
+            task.cover_cache.release(path)
+
+
+def resolve_loudness(task: TranscodeTask):
+    """Measure the source (or reuse a cached measurement) and turn it into tags or gain"""
+    if task.loudness_mode not in ("replaygain", "normalize"):
+        return
+    if task.loudness_mode == "replaygain" and task.audio_format not in REPLAYGAIN_FORMATS:
+        return
+    cached = None
+    if task.loudness_cache is not None and task.loudness_key:
+        cached = task.loudness_cache.get(task.loudness_key)
+    if cached is None:
+        if task.metrics is not None:
+            with task.metrics.phase("loudness"):
+                cached = measure(task.source, task.stop_event, owner=task.job_id)
+        else:
+            cached = measure(task.source, task.stop_event, owner=task.job_id)
+        if task.canceled:
+            raise TranscodeCancelled()
+        if cached is None:
+            return  # Silent, too short or no FFmpeg/NumPy: leave the track as it is
+        if task.loudness_cache is not None and task.loudness_key:
+            task.loudness_cache.put(task.loudness_key, *cached)
+    task.loudness = cached
+    if task.loudness_mode == "replaygain":
+        task.metadata = {**task.metadata, **replaygain_tags(*cached)}
+    elif not task.copy_audio:
+        task.gain = normalization_gain(*cached, task.loudness_target)
+
+
+def run_transcode(task: TranscodeTask) -> Path:
+    """Convert ``task.source`` into ``task.target`` and remove the intermediate files.
+
+    FFmpeg writes to a temporary name that is renamed on success, so a
+    failed or canceled conversion never leaves a truncated track behind.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise TranscodeError("FFmpeg no encontrado")
+    resolve_covers(task)
+    try:
+        return _encode(task, ffmpeg)
+    finally:
+        release_covers(task)
+
+
+def _encode(task: TranscodeTask, ffmpeg: str) -> Path:
+    resolve_loudness(task)
+    temp = temp_path(task.target)
+    # Registered so a cancel kills FFmpeg at once instead of waiting for the next poll
+    with tracked(build_ffmpeg_command(task, ffmpeg), owner=task.job_id,
+                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as process:
+        while True:
+            try:
+                _, stderr = process.communicate(timeout=0.1)
+                break
+            except subprocess.TimeoutExpired:
+                if task.canceled:
+                    process.kill()
+                    process.communicate()
+                    break
+    if task.canceled:
+        temp.unlink(missing_ok=True)
+        raise TranscodeCancelled()
+    if process.returncode != 0:
+        temp.unlink(missing_ok=True)
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise TranscodeError(f"FFmpeg fallo ({process.returncode}): {lines[-1] if lines else 'sin detalles'}")
+
+    # Another job may have written the same name since the download started
+    if task.keep_existing and task.source != task.target and task.target.exists():
+        temp.unlink(missing_ok=True)
+        task.source.unlink(missing_ok=True)
+        raise TranscodeSkipped(task.target)
+    os.replace(temp, task.target)
+    if task.source != task.target:
+        task.source.unlink(missing_ok=True)
+    if task.cover_file is not None:
+        cover_temp = temp_path(task.cover_output)
+        shutil.copyfile(task.cover_file, cover_temp)
+        os.replace(cover_temp, task.cover_output)
+    return task.target
+
+
+class TranscodeStage:
+    """CPU stage of the pipeline: up to ``workers`` FFmpeg conversions at once.
+
+    ``submit`` blocks while ``max_pending`` conversions are already queued or
+    running, so download workers slow down instead of piling up raw files
+    when encoding falls behind.
+    """
+    def __init__(self, workers: int = 0, max_pending: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        self._slots = threading.Semaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # Notified as conversions finish
+        self._pending = 0
+        # Each conversion is its own ffmpeg process; the pool threads only wait on it
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcode")
+
+    @property
+    def pending(self) -> int:
+        """Conversions queued or running"""
+        with self._lock:
+            return self._pending
+
+    def submit(self, task: TranscodeTask) -> Future:
+        """Queue a conversion, waiting for a free slot (raises if canceled meanwhile)"""
+        while not self._slots.acquire(timeout=0.2):
+            if task.canceled:
+                raise TranscodeCancelled()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._run, task)
+        except RuntimeError:
+            self._release(None)
+            raise TranscodeCancelled()
+        future.add_done_callback(self._release)
+        return future
+
+    def shutdown(self, timeout: float = 0.0) -> bool:
+        """Drop queued conversions and wait up to ``timeout`` for running ones to stop.
+
+        Running conversions stop through their job's cancel (which kills
+        FFmpeg). Returns True if the stage is idle.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            while self._pending and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            return not self._pending
+
+    def _run(self, task: TranscodeTask) -> Path:
+        if task.metrics is not None:
+            task.metrics.end_phase("transcode_wait")
+        if task.canceled:
+            raise TranscodeCancelled()
+        if task.metrics is None:
+            return run_transcode(task)
+        with task.metrics.phase("transcode"):
+            return run_transcode(task)
+
+    def _release(self, future: Optional[Future]):
+        with self._lock:
+            self._pending -= 1
+            self._idle.notify_all()
+        self._slots.release()
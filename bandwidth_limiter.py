@@ -0,0 +1,153 @@
+"""
+bandwidth_limiter.py
+Limite global de ancho de banda para las descargas. El presupuesto total se
+reparte a partes iguales entre las transferencias activas (cubeta de tokens
+por descarga), con un tope opcional por descarga. Los limites se pueden
+cambiar en caliente sin reiniciar las descargas.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Optional, Dict, Any
+
+BURST_SECONDS = 0.5  # Bucket depth in seconds of the job's rate
+MIN_BURST = 64 * 1024
+THROUGHPUT_WINDOW = 2.0  # Seconds averaged for the aggregate throughput
+
+
+class TokenBucket:
+    """Token bucket for one transfer; a rate of 0 means unlimited"""
+    def __init__(self, rate: float = 0.0):
+        self.rate = rate
+        self.tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return max(MIN_BURST, self.rate * BURST_SECONDS)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.tokens = min(self.tokens, self.capacity)
+
+    def consume(self, amount: int, stop_event: Optional[threading.Event] = None):
+        """Take ``amount`` bytes, sleeping until the bucket covers them.
+
+        The bucket may go into debt, so a large block is let through and
+        paid back by waiting. The rate is re-read while waiting, so a new
+        limit applies to a transfer that is already throttled.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+        while True:
+            with self._lock:
+                self._refill()
+                if self.rate <= 0:
+                    self.tokens = self.capacity
+                    return
+                if self.tokens >= 0:
+                    return
+                wait = -self.tokens / self.rate
+            # Short slices keep cancel and limit changes responsive
+            if stop_event is not None:
+                if stop_event.wait(min(wait, 0.2)):
+                    return
+            else:
+                time.sleep(min(wait, 0.2))
+
+    def _refill(self):
+        """Add the tokens earned since the last call (lock held)"""
+        now = time.monotonic()
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+
+class BandwidthLimiter:
+    """Global bandwidth budget split evenly across the active transfers.
+
+    Each transfer gets a bucket at ``min(per_job, limit / active)`` bytes/s,
+    recomputed whenever a transfer starts or ends or the limits change.
+    Limits are in bytes per second; 0 disables them.
+    """
+    def __init__(self, limit: float = 0.0, per_job: float = 0.0):
+        self.limit = limit
+        self.per_job = per_job
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._samples = deque()  # (monotonic time, bytes) for the throughput window
+        self._lock = threading.Lock()
+
+    def set_limits(self, limit: float, per_job: float):
+        """Change the budget; running transfers pick it up on their next block"""
+        with self._lock:
+            self.limit = limit
+            self.per_job = per_job
+            self._rebalance()
+
+    def open(self, key: str) -> TokenBucket:
+        """Register an active transfer and return its bucket"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket()
+                self._rebalance()
+            return bucket
+
+    def close(self, key: str):
+        """Unregister a transfer; its share goes to the others"""
+        with self._lock:
+            if self._buckets.pop(key, None) is not None:
+                self._rebalance()
+
+    def consume(self, key: str, amount: int, stop_event: Optional[threading.Event] = None):
+        """Account ``amount`` bytes received by transfer ``key``, throttling it if needed"""
+        if amount <= 0:
+            return
+        bucket = self.open(key)
+        with self._lock:
+            now = time.monotonic()
+            self._samples.append((now, amount))
+            self._trim(now)  # Bounded even when nobody reads the throughput (CLI)
+        bucket.consume(amount, stop_event)
+
+    def throughput(self) -> float:
+        """Aggregate bytes/s over the last few seconds"""
+        with self._lock:
+            self._trim(time.monotonic())
+            return sum(amount for _, amount in self._samples) / THROUGHPUT_WINDOW
+
+    def status(self) -> Dict[str, Any]:
+        """Budget, per-job rate, active transfers and measured throughput"""
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "limit": self.limit,
+                "per_job": self.per_job,
+                "active": len(self._buckets),
+                "job_rate": self._share(),
+                "throughput": sum(amount for _, amount in self._samples) / THROUGHPUT_WINDOW,
+            }
+
+    def _share(self) -> float:
+        """Fair per-transfer rate (lock held)"""
+        rates = []
+        if self.limit > 0:
+            rates.append(self.limit / max(1, len(self._buckets)))
+        if self.per_job > 0:
+            rates.append(self.per_job)
+        return min(rates) if rates else 0.0
+
+    def _rebalance(self):
+        """Apply the fair share to every bucket (lock held)"""
+        rate = self._share()
+        for bucket in self._buckets.values():
+            bucket.set_rate(rate)
+
+    def _trim(self, now: float):
+        while self._samples and self._samples[0][0] < now - THROUGHPUT_WINDOW:
+            self._samples.popleft()
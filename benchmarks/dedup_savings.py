@@ -0,0 +1,110 @@
+"""
+dedup_savings.py
+Benchmark de la deduplicacion: el planificador real descarga de un servidor
+HTTP local una coleccion de pistas distintas y despues la misma musica otra
+vez (copias exactas con otro nombre y reediciones recodificadas a otra tasa
+de bits), con dedup_action en off, skip y hardlink. Informa los duplicados
+detectados, los GB ahorrados segun metrics.summary(), el espacio que ocupa
+de verdad la carpeta de salida y lo que cuesta la fase de dedup por pista.
+
+Uso: python benchmarks/dedup_savings.py [--tracks N] [--seconds S]
+"""
+
+import os
+import sys
+import time
+import queue
+import subprocess
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from downloader_engine import ConfigManager, DownloadScheduler, FINISHED_STATES  # noqa: E402
+from tests.stand_in import StandIn  # noqa: E402
+
+
+def make_song(path: Path, seconds: float, seed: int, bitrate: str):
+    """Seeded pink noise with a slow tremolo: a tone is too flat for the acoustic fingerprint"""
+    subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i",
+                    f"anoisesrc=color=pink:seed={seed}:duration={seconds}:amplitude=0.3",
+                    "-af", "tremolo=f=2:d=0.6", "-ac", "2", "-b:a", bitrate, str(path)], check=True)
+
+
+def disk_usage(folder: Path) -> int:
+    """Bytes the folder really takes: a hardlinked file is counted once"""
+    seen, total = set(), 0
+    for path in folder.rglob("*"):
+        stat = path.stat()
+        if path.is_file() and stat.st_ino not in seen:
+            seen.add(stat.st_ino)
+            total += stat.st_size
+    return total
+
+
+def download_all(scheduler: DownloadScheduler, urls: List[str]):
+    ids = [scheduler.submit(url) for url in urls]
+    while not all(scheduler.jobs[job_id].state in FINISHED_STATES for job_id in ids):
+        time.sleep(0.02)
+
+
+def run(action: str, server: StandIn, originals: List[str], copies: List[str], work: Path):
+    work.mkdir()
+    os.chdir(work)  # The fingerprint index lives in the working directory: one per run
+    config = ConfigManager().default_config.copy()
+    config.update(output_dir=str(work / "out"), skip_existing=False, prefetch_workers=0, save_cover_art=False,
+                  format="mp3", bitrate="192", dedup_action=action)
+    scheduler = DownloadScheduler(config, queue.Queue(), logging.getLogger("bench"))
+    scheduler.start()
+    try:
+        # The originals first, so every copy finds its original already indexed
+        download_all(scheduler, [server.url(name) for name in originals])
+        download_all(scheduler, [server.url(name) for name in copies])
+    finally:
+        scheduler.shutdown(timeout=10.0)
+    summary = scheduler.metrics.summary()
+    dedup = summary["phases"].get("dedup", {}).get("p50", 0.0)
+    print(f"{action:9} duplicados {summary['duplicates']:3}  ahorrado {summary['saved_bytes'] / 1e9:7.3f} GB  "
+          f"en disco {disk_usage(work / 'out') / 1e9:7.3f} GB  dedup por pista p50 {dedup * 1000:6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=180.0)
+    args = parser.parse_args()
+    if not shutil.which("ffmpeg"):
+        sys.exit("FFmpeg no encontrado")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media = tmp / "media"
+        media.mkdir()
+        originals, copies = [], []
+        for i in range(args.tracks):
+            name = f"pista{i}.mp3"
+            make_song(media / name, args.seconds, i + 1, "192k")
+            originals.append(name)
+            # Every other track comes back byte for byte, the rest as a re-encode at another bitrate
+            if i % 2:
+                shutil.copyfile(media / name, media / f"copia{i}.mp3")
+                copies.append(f"copia{i}.mp3")
+            else:
+                make_song(media / f"reedicion{i}.mp3", args.seconds, i + 1, "128k")
+                copies.append(f"reedicion{i}.mp3")
+        server = StandIn(media)
+        try:
+            for action in ("off", "skip", "hardlink"):
+                run(action, server, originals, copies, tmp / action)
+        finally:
+            os.chdir(cwd)
+            server.close()
+
+
+if __name__ == "__main__":
+    main()
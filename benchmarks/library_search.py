@@ -0,0 +1,86 @@
+"""
+library_search.py
+Benchmark de la busqueda de la biblioteca: llena un indice con N pistas
+(100.000 por defecto) y mide cada consulta con la ordenacion de antes
+(por fecha, que ordena todas las coincidencias antes del LIMIT) y con la
+de ahora (por rowid, que lee del indice y se detiene en el LIMIT).
+
+Uso: python benchmarks/library_search.py [--tracks N] [--limit L] [--runs R]
+"""
+
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from library_index import COLUMNS, LibraryIndex, fts_query  # noqa: E402
+
+WORDS = ("amor", "noche", "cancion", "vida", "luna", "sol", "mar", "corazon", "fuego", "tiempo", "cielo", "baile")
+QUERIES = ("cancion", "a", "amor noche", "artista 7", "ninguna")
+TARGET_MS = 50.0
+
+# The FTS branch before: every match joined and sorted by date before the LIMIT
+BY_DATE = ("SELECT {columns} FROM tracks_fts JOIN tracks ON tracks.id = tracks_fts.rowid "
+           "WHERE tracks_fts MATCH ? ORDER BY tracks.added DESC, tracks.id DESC LIMIT ?")
+
+
+def fill(index: LibraryIndex, tracks: int):
+    """Insert ``tracks`` rows in one transaction (the triggers keep the FTS table in step)"""
+    rnd = random.Random(1)
+    now = time.time()
+    rows = []
+    for i in range(tracks):
+        title = " ".join(rnd.choice(WORDS) for _ in range(3)) + f" {i}"
+        artist = f"Artista {i % 500}"
+        rows.append({"path": f"/musica/{artist}/{artist} - {title}.mp3", "title": title, "artist": artist,
+                     "duration": 200.0, "webpage_url": None, "format": "mp3", "bitrate": 192, "size": 4800000,
+                     "mtime": now, "hash": f"{i:064x}", "added": now + i})
+    index._conn.executemany(f"INSERT INTO tracks ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)})",
+                            [[row[column] for column in COLUMNS] for row in rows])
+    index._conn.commit()
+
+
+def best_of(runs: int, search) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        search()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LibraryIndex(str(Path(tmp) / "library.db"))
+        if not index.fts:
+            sys.exit("SQLite sin FTS5")
+        start = time.perf_counter()
+        fill(index, args.tracks)
+        print(f"{args.tracks} pistas indexadas en {time.perf_counter() - start:.1f} s")
+        columns = ", ".join(f"tracks.{column}" for column in COLUMNS)
+        by_date = BY_DATE.format(columns=columns)
+        worst = 0.0
+        for text in QUERIES:
+            found = len(index.search(text, args.limit))
+            before = best_of(args.runs, lambda: index._conn.execute(
+                by_date, (fts_query(text), args.limit)).fetchall())
+            now = best_of(args.runs, lambda: index.search(text, args.limit))
+            worst = max(worst, now)
+            print(f"{text!r:14} {found:4} resultados  antes {before:7.1f} ms  ahora {now:7.1f} ms")
+        index.close()
+    print(f"peor consulta: {worst:.1f} ms ({'dentro' if worst < TARGET_MS else 'fuera'} "
+          f"del objetivo de {TARGET_MS:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+startup.py
+Benchmark de arranque: tiempo de importacion del motor y de la linea de
+comandos segun ``python -X importtime``, tiempo hasta tener yt-dlp cargado
+(motor listo) y, si hay pantalla, tiempo hasta la primera ventana.
+Cada medida se toma en un proceso nuevo y se informa la mediana.
+
+Uso: python benchmarks/startup.py [--runs N]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+ENGINE_READY = """
+import time
+start = time.perf_counter()
+import downloader_engine
+downloader_engine.load_yt_dlp()
+print(time.perf_counter() - start)
+"""
+
+# Builds the window and paints it once, without entering the main loop
+FIRST_WINDOW = """
+import os, time
+start = time.perf_counter()
+import tkinter as tk
+import app4
+root = tk.Tk()
+app = app4.EnhancedApp(root)
+root.update()
+print(time.perf_counter() - start)
+os._exit(0)
+"""
+
+
+def run_python(args, cwd: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    return subprocess.run([sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def import_time(module: str, cwd: str) -> float:
+    """Cumulative import time of ``module`` in seconds, from -X importtime"""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"], cwd)
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(result.stderr.strip() or f"{module} not found in -X importtime output")
+
+
+def timed_script(script: str, cwd: str) -> float:
+    result = run_python(["-c", script], cwd)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    # The GUI creates its databases in the working directory
+    cwd = tempfile.mkdtemp(prefix="startup-")
+    run_python(["-c", "import app4, downloader_cli"], str(ROOT))  # Warm the .pyc files
+
+    measures = {
+        "import downloader_engine": lambda: import_time("downloader_engine", cwd),
+        "import downloader_cli": lambda: import_time("downloader_cli", cwd),
+        "motor listo (yt-dlp cargado)": lambda: timed_script(ENGINE_READY, cwd),
+        "primera ventana": lambda: timed_script(FIRST_WINDOW, cwd),
+    }
+    for name, measure in measures.items():
+        try:
+            samples = [measure() for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{name:32} no disponible ({e})")
+            continue
+        print(f"{name:32} mediana {statistics.median(samples) * 1000:7.1f} ms   "
+              f"min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
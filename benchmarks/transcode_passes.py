@@ -0,0 +1,146 @@
+"""
+transcode_passes.py
+Benchmark de la conversion por pista: bytes escritos en disco y tiempo de
+reloj de la cadena de antes (extraer y codificar el audio, reescribir el
+archivo para las etiquetas, convertir la miniatura a JPEG y reescribir el
+archivo otra vez para incrustarla, como hacian los postprocesadores de
+yt-dlp) frente a la pasada unica de FFmpeg de run_transcode con la portada
+sacada de CoverCache.
+
+Las pistas son tonos AAC generados con FFmpeg y las miniaturas WebP se
+sirven desde un servidor HTTP local, asi que ambas cadenas descargan la
+imagen por red igual que con una plataforma real.
+
+Uso: python benchmarks/transcode_passes.py [--tracks N] [--seconds S] [--format mp3|m4a|flac]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+from typing import List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio_pipeline import CODEC_ARGS, LOSSY_FORMATS, TranscodeTask, run_transcode, temp_path  # noqa: E402
+from cover_cache import CoverCache  # noqa: E402
+from tests.stand_in import StandIn, make_track  # noqa: E402
+
+BITRATE = "192"
+
+
+def ffmpeg(*args: str):
+    subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", *args], check=True)
+
+
+def metadata_args(index: int) -> List[str]:
+    args = []
+    for key, value in (("title", f"Pista {index}"), ("artist", "Banco de pruebas"), ("album", "Mediciones")):
+        args += ["-metadata", f"{key}={value}"]
+    return args
+
+
+def old_chain(source: Path, thumbnail_url: str, work: Path, audio_format: str, index: int) -> int:
+    """The postprocessor chain before the single pass; returns the bytes it wrote"""
+    written = 0
+    target = work / f"pista{index}.{audio_format}"
+    # ExtractAudio: decode and encode into a new file
+    codec = CODEC_ARGS[audio_format] + (["-b:a", f"{BITRATE}k"] if audio_format in LOSSY_FORMATS else [])
+    ffmpeg("-i", str(source), "-vn", *codec, str(target))
+    written += target.stat().st_size
+    source.unlink()
+    # FFmpegMetadata: rewrite the whole file to add the tags
+    temp = temp_path(target)
+    ffmpeg("-i", str(target), "-map", "0", "-c", "copy", *metadata_args(index), str(temp))
+    written += temp.stat().st_size
+    os.replace(temp, target)
+    # Thumbnail: download, convert to JPEG, rewrite the whole file again to embed it
+    thumbnail = work / f"pista{index}.webp"
+    urllib.request.urlretrieve(thumbnail_url, thumbnail)
+    written += thumbnail.stat().st_size
+    jpeg = thumbnail.with_suffix(".jpg")
+    ffmpeg("-i", str(thumbnail), str(jpeg))
+    written += jpeg.stat().st_size
+    embed = ["-id3v2_version", "3"] if audio_format == "mp3" else []
+    ffmpeg("-i", str(target), "-i", str(jpeg), "-map", "0", "-map", "1", "-c", "copy",
+           "-disposition:v:0", "attached_pic", *embed, str(temp))
+    written += temp.stat().st_size
+    os.replace(temp, target)
+    thumbnail.unlink()
+    jpeg.unlink()
+    return written
+
+
+def new_pass(source: Path, thumbnail_url: str, work: Path, audio_format: str, index: int,
+             cache: CoverCache) -> int:
+    """Cover from the cache and one FFmpeg run for audio, tags and cover; returns the bytes it wrote"""
+    cached = cache.total_bytes
+    digest = cache.fetch(thumbnail_url)
+    target = work / f"pista{index}.{audio_format}"
+    metadata = {"title": f"Pista {index}", "artist": "Banco de pruebas", "album": "Mediciones"}
+    run_transcode(TranscodeTask(None, source, target, audio_format, BITRATE, metadata,
+                                cover_cache=cache, cover_digest=digest))
+    return cache.total_bytes - cached + target.stat().st_size
+
+
+def measure(name: str, runs: List[Tuple[float, int]]):
+    seconds = [run[0] for run in runs]
+    written = [run[1] for run in runs]
+    print(f"{name:22} por pista: {statistics.median(seconds) * 1000:8.1f} ms  "
+          f"{statistics.mean(written) / 1e6:7.2f} MB escritos")
+    return statistics.median(seconds), statistics.mean(written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=240.0)
+    parser.add_argument("--format", default="mp3", choices=("mp3", "m4a", "flac"))
+    args = parser.parse_args()
+    if not shutil.which("ffmpeg"):
+        sys.exit("FFmpeg no encontrado")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media, work = tmp / "media", tmp / "work"
+        media.mkdir()
+        work.mkdir()
+        for i in range(args.tracks):
+            make_track(media / f"pista{i}.m4a", args.seconds, frequency=220 + 110 * i,
+                       args=["-c:a", "aac", "-b:a", "128k"])
+            # A distinct 1280x720 thumbnail per track, as a platform serves them
+            ffmpeg("-f", "lavfi", "-i", f"testsrc2=size=1280x720:duration=1:rate=1,hue=h={i * 40}",
+                   "-frames:v", "1", str(media / f"pista{i}.webp"))
+        server = StandIn(media)
+        cache = CoverCache(str(tmp / "covers"), 100 * 1024 * 1024)
+        try:
+            results = {}
+            for name, run in (("cadena de antes", old_chain), ("pasada unica (ahora)", new_pass)):
+                runs = []
+                for i in range(args.tracks):
+                    source = work / f"fuente{i}.m4a"
+                    shutil.copyfile(media / f"pista{i}.m4a", source)  # The downloaded stream
+                    extra = (cache,) if run is new_pass else ()
+                    start = time.perf_counter()
+                    written = run(source, server.url(f"pista{i}.webp"), work, args.format, i, *extra)
+                    runs.append((time.perf_counter() - start, written))
+                results[name] = measure(name, runs)
+                for path in work.iterdir():
+                    path.unlink()
+        finally:
+            cache.close()
+            server.close()
+
+    (old_time, old_bytes), (new_time, new_bytes) = results.values()
+    print(f"ahorro por pista: {(1 - new_time / old_time) * 100:.0f}% del tiempo, "
+          f"{(old_bytes - new_bytes) / 1e6:.2f} MB menos escritos ({old_bytes / new_bytes:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
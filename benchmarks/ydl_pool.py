@@ -0,0 +1,88 @@
+"""
+ydl_pool.py
+Benchmark del pool de YoutubeDL: descarga N pistas cortas de un servidor
+HTTP local con el planificador real, primero con una instancia nueva por
+trabajo (como antes) y despues con el pool compartido, e informa el tiempo
+por pista y cuantas instancias se crearon y reutilizaron.
+
+Con pistas cortas domina el coste fijo por trabajo (crear YoutubeDL, cargar
+los extractores, abrir conexiones), que es lo que el pool ahorra.
+
+Uso: python benchmarks/ydl_pool.py [--tracks N] [--workers W]
+"""
+
+import os
+import sys
+import time
+import queue
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from downloader_engine import (ConfigManager, DownloadScheduler, FINISHED_STATES, JOB_DONE,  # noqa: E402
+                               YdlPool, load_yt_dlp)
+from tests.stand_in import StandIn, make_track  # noqa: E402
+
+
+def run(name: Optional[str], server: StandIn, tracks: int, workers: int, work: Path, pooled: bool):
+    work.mkdir()
+    os.chdir(work)  # The scheduler keeps its caches in the working directory: cold ones for every run
+    config = ConfigManager().default_config.copy()
+    config.update(output_dir=str(work / "out"), skip_existing=False, prefetch_workers=0, save_cover_art=False,
+                  max_concurrent=workers, format="mp3", bitrate="128")  # Same codec: remux, no encode
+    scheduler = DownloadScheduler(config, queue.Queue(), logging.getLogger("bench"))
+    if not pooled:
+        scheduler.ydl_pool = YdlPool(max_idle=0)  # Every checkout builds a new instance
+    scheduler.start()
+    start = time.perf_counter()
+    try:
+        ids = [scheduler.submit(server.url(f"pista{i}.mp3")) for i in range(tracks)]
+        while not all(scheduler.jobs[job_id].state in FINISHED_STATES for job_id in ids):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        done = sum(scheduler.jobs[job_id].state == JOB_DONE for job_id in ids)
+    finally:
+        scheduler.shutdown(timeout=10.0)
+    pool = scheduler.ydl_pool
+    if name is None:
+        return elapsed
+    print(f"{name:24} {done}/{tracks} completadas  total {elapsed:6.2f} s  "
+          f"por pista {elapsed / tracks * 1000:7.1f} ms  instancias creadas {pool.created:3}  "
+          f"reutilizadas {pool.reused:3}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--tracks", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    if not shutil.which("ffmpeg"):
+        sys.exit("FFmpeg no encontrado")
+    load_yt_dlp()  # Loaded once up front so neither run pays the import
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        media = tmp / "media"
+        media.mkdir()
+        for i in range(args.tracks):
+            make_track(media / f"pista{i}.mp3", 2, frequency=220 + 10 * i, args=["-b:a", "128k"])
+        server = StandIn(media)
+        try:
+            run(None, server, 1, 1, tmp / "calentamiento", pooled=True)  # First-use costs of the extractors
+            fresh = run("instancia por trabajo", server, args.tracks, args.workers, tmp / "antes", pooled=False)
+            pooled = run("pool compartido (ahora)", server, args.tracks, args.workers, tmp / "ahora", pooled=True)
+        finally:
+            os.chdir(cwd)
+            server.close()
+    print(f"ahorro: {(1 - pooled / fresh) * 100:.0f}% del tiempo total")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+child_processes.py
+Registro de los procesos FFmpeg lanzados por las descargas (conversion,
+medicion de sonoridad, huellas). Al cancelar un trabajo se terminan sus
+procesos al momento, y al cerrar la aplicacion todos, sin dejar procesos
+huerfanos.
+"""
+
+import atexit
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple
+
+_lock = threading.Lock()
+_processes: Dict[int, Tuple[subprocess.Popen, Optional[str]]] = {}  # pid -> (process, job id)
+
+
+@contextmanager
+def tracked(cmd: List[str], owner: Optional[str] = None, **kwargs):
+    """Run ``cmd`` as a registered child of job ``owner``; it is killed if still running on exit"""
+    process = subprocess.Popen(cmd, **kwargs)
+    with _lock:
+        _processes[process.pid] = (process, owner)
+    try:
+        yield process
+    finally:
+        with _lock:
+            _processes.pop(process.pid, None)
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def kill(owner: Optional[str] = None) -> int:
+    """Kill the running children of job ``owner`` (every child when None); returns how many"""
+    with _lock:
+        targets = [process for process, job_id in _processes.values() if owner is None or job_id == owner]
+    for process in targets:
+        try:
+            process.kill()
+        except OSError:
+            pass  # Already gone
+    return len(targets)
+
+
+atexit.register(kill)
@@ -0,0 +1,250 @@
+"""
+cover_cache.py
+Cache en disco de caratulas compartido entre pistas. Cada imagen se guarda
+una vez por contenido (sha256), aunque llegue desde varias URLs, junto con
+sus variantes convertidas (formato y tamano). Se descartan las menos usadas
+al superar el limite de tamano.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, List
+
+# Encoder arguments per cover image format
+IMAGE_CODEC_ARGS = {
+    "jpg": ["-c:v", "mjpeg", "-q:v", "2", "-pix_fmt", "yuvj420p"],
+    "png": ["-c:v", "png"],
+    "webp": ["-c:v", "libwebp", "-quality", "90"],
+}
+EMBEDDABLE_FORMATS = ("jpg", "png")  # Picture formats every audio container accepts
+FETCH_TIMEOUT = 30
+USER_AGENT = "Mozilla/5.0"
+
+
+def sniff_image_format(data: bytes) -> str:
+    """Image format from the file signature ("img" when unknown)"""
+    if data.startswith(b"\xff\xd8"):
+        return "jpg"
+    if data.startswith(b"\x89PNG"):
+        return "png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "img"
+
+
+def convert_image(source: Path, target: Path, image_format: str, size: Optional[int] = None):
+    """Convert/resize one image with FFmpeg (``size`` bounds the longest side)"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise OSError("FFmpeg no encontrado")
+    cmd = [ffmpeg, "-y", "-nostdin", "-hide_banner", "-loglevel", "error", "-i", str(source)]
+    if size:
+        cmd += ["-vf", f"scale='min({size},iw)':'min({size},ih)':force_original_aspect_ratio=decrease"]
+    cmd += IMAGE_CODEC_ARGS[image_format] + ["-frames:v", "1", "-update", "1", "-f", "image2", str(target)]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=60)
+    if result.returncode != 0:
+        raise OSError(f"No se pudo convertir la caratula: {result.stderr.decode('utf-8', 'replace').strip()}")
+
+
+class CoverCache:
+    """Content-addressed cover store with LRU eviction under ``max_bytes``.
+
+    ``fetch`` maps a thumbnail URL to the sha256 of its content, downloading
+    it only the first time; ``variant`` returns the image converted to a
+    format and size, converting it only the first time. Concurrent requests
+    for the same URL or variant wait for a single fetch/conversion. A file
+    handed out with ``pin=True`` is not evicted until it is ``release``d.
+    """
+    INDEX_FILE = "index.db"
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, List] = {}  # key -> [lock, threads using it]
+        self._pins: Dict[str, int] = {}  # name -> holders of a pinned file
+        self._conn = sqlite3.connect(str(self.directory / self.INDEX_FILE), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._urls = dict(self._conn.execute("SELECT url, digest FROM urls"))
+        # name -> size, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._originals: Dict[str, str] = {}  # digest -> file name of the fetched image
+        self.total_bytes = 0
+        for name, digest, size in self._conn.execute("SELECT name, digest, size FROM files ORDER BY last_used"):
+            if (self.directory / name).exists():
+                self._remember(name, digest, size)
+
+    def fetch(self, url: str) -> Optional[str]:
+        """Content hash of the image at ``url``, downloading it if not cached"""
+        with self._key_lock(url):
+            with self._lock:
+                digest = self._urls.get(url)
+            if digest and self._original_name(digest):
+                self._count(hit=True)
+                return digest
+
+            import urllib.request  # Deferred: it pulls in http.client, ssl and email at startup
+            request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+            with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+                data = response.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if self._original_name(digest):
+                self._count(hit=True)  # Same picture already cached from another URL
+            else:
+                self._count(hit=False)
+                self._store(f"{digest}.{sniff_image_format(data)}", digest, data)
+            with self._lock:
+                self._urls[url] = digest
+                self._conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?)", (url, digest))
+                self._conn.commit()
+            return digest
+
+    def variant(self, digest: str, image_format: str, size: Optional[int] = None,
+                pin: bool = False) -> Optional[Path]:
+        """Cached image in ``image_format`` bounded to ``size`` pixels, converting it once"""
+        original = self._original_name(digest)
+        if size is None and original and original.endswith(f".{image_format}"):
+            return self._touch(original, pin)
+        name = f"{digest}-{size or 'original'}.{image_format}"
+        with self._key_lock(name):
+            path = self._touch(name, pin)
+            if path is not None:
+                self._count(hit=True)
+                return path
+            # Pinned while it is converted, so another track's eviction cannot pull it away
+            if original is None or self._touch(original, pin=True) is None:
+                return None
+            self._count(hit=False)
+            temp = self.directory / f"{name}.temp"
+            try:
+                convert_image(self.directory / original, temp, image_format, size)
+                data_size = temp.stat().st_size
+                os.replace(temp, self.directory / name)
+            finally:
+                temp.unlink(missing_ok=True)
+                self.release(self.directory / original)
+            self._add(name, digest, data_size, pin)
+            return self.directory / name
+
+    def embeddable(self, digest: str, size: Optional[int] = None, pin: bool = False) -> Optional[Path]:
+        """Variant suitable for embedding: the original if it is JPEG/PNG, else JPEG"""
+        original = self._original_name(digest)
+        if original is None:
+            return None
+        image_format = original.rsplit(".", 1)[-1]
+        return self.variant(digest, image_format if image_format in EMBEDDABLE_FORMATS else "jpg", size, pin)
+
+    def release(self, path: Path):
+        """Let a file handed out with ``pin=True`` be evicted again"""
+        with self._lock:
+            holders = self._pins.get(path.name, 0) - 1
+            if holders > 0:
+                self._pins[path.name] = holders
+                return
+            self._pins.pop(path.name, None)
+            self._evict()  # The cap may have been passed while it was pinned
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        """Serialize work on one URL or variant; the lock is dropped once nobody waits on it"""
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _original_name(self, digest: str) -> Optional[str]:
+        with self._lock:
+            return self._originals.get(digest)
+
+    def _touch(self, name: str, pin: bool = False) -> Optional[Path]:
+        """Mark an entry as just used (and pin it); None if it is not cached"""
+        with self._lock:
+            if name not in self._files:
+                return None
+            self._files.move_to_end(name)
+            if pin:
+                self._pins[name] = self._pins.get(name, 0) + 1
+            self._conn.execute("UPDATE files SET last_used = ? WHERE name = ?", (time.time(), name))
+            self._conn.commit()
+        return self.directory / name
+
+    def _store(self, name: str, digest: str, data: bytes):
+        temp = self.directory / f"{name}.temp"
+        temp.write_bytes(data)
+        os.replace(temp, self.directory / name)
+        self._add(name, digest, len(data))
+
+    def _remember(self, name: str, digest: str, size: int):
+        """Track a file as most recently used (lock held)"""
+        if name in self._files:
+            self.total_bytes -= self._files[name]
+        self._files[name] = size
+        self._files.move_to_end(name)
+        self.total_bytes += size
+        if name.startswith(f"{digest}."):
+            self._originals[digest] = name
+
+    def _add(self, name: str, digest: str, size: int, pin: bool = False):
+        with self._lock:
+            self._remember(name, digest, size)
+            if pin:
+                self._pins[name] = self._pins.get(name, 0) + 1
+            self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                               (name, digest, size, time.time()))
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used files until under the cap, skipping pinned ones (lock held)"""
+        # The most recent file is always kept: it was just added or handed out
+        for name in [name for name in list(self._files)[:-1] if name not in self._pins]:
+            if self.total_bytes <= self.max_bytes:
+                break
+            size = self._files.pop(name)
+            self.total_bytes -= size
+            digest = name.split(".", 1)[0]
+            if self._originals.get(digest) == name:
+                del self._originals[digest]
+            (self.directory / name).unlink(missing_ok=True)
+            self._conn.execute("DELETE FROM files WHERE name = ?", (name,))
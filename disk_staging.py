@@ -0,0 +1,98 @@
+"""
+disk_staging.py
+Carpeta temporal local para las descargas: el audio en bruto, los archivos
+intermedios de FFmpeg y la caratula se escriben alli y la pista terminada se
+mueve a la carpeta de salida en un solo paso atomico (o una copia seguida de
+un renombrado si esta en otro disco). Incluye el control de espacio libre con
+el que el planificador no arranca un trabajo que no cabe en disco.
+"""
+
+import os
+import shutil
+from pathlib import Path
+from typing import Optional, Dict, Tuple
+
+UNKNOWN_SIZE = 20 * 1024 * 1024  # Bytes assumed for a download the extractor gave no size for
+# Average rate of the lossless outputs (kbps); lossy ones are written at the chosen bitrate
+LOSSLESS_KBPS = {"flac": 1000, "wav": 1411}
+
+
+def estimate_output(duration: Optional[float], audio_format: str, bitrate: str) -> Optional[int]:
+    """Approximate size of the converted track; None without a duration"""
+    if not duration:
+        return None
+    kbps = LOSSLESS_KBPS.get(audio_format) or int(bitrate)
+    return int(duration * kbps * 1000 / 8)
+
+
+def existing_parent(path: Path) -> Path:
+    """``path`` or its nearest ancestor that exists (folders are created later)"""
+    path = Path(path).absolute()
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return path
+
+
+def publish(path: Path, folder: Path) -> Path:
+    """Move a finished file into ``folder`` and return its new path.
+
+    Within a volume this is a single rename. Across volumes the file is
+    copied next to its destination under a temporary name and renamed over
+    it, so the output folder never holds a half-written track.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    target = folder / path.name
+    try:
+        os.replace(path, target)
+    except OSError:
+        temp = target.with_name(f"{target.stem}.temp{target.suffix}")
+        try:
+            shutil.copyfile(path, temp)
+            os.replace(temp, target)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        path.unlink()
+    return target
+
+
+class DiskBudget:
+    """Free-space admission control for the jobs the scheduler starts.
+
+    Each started job reserves the bytes it will write on every volume it
+    touches; a job is admitted only while the free space minus the running
+    jobs' reservations stays above ``margin`` bytes. Callers serialize
+    access (the scheduler holds its lock).
+    """
+    def __init__(self, margin: int):
+        self.margin = max(0, margin)
+        self._reserved: Dict[int, int] = {}  # st_dev -> bytes reserved by running jobs
+        self._jobs: Dict[str, Dict[int, int]] = {}
+
+    def check(self, needs: Dict[Path, int]) -> Tuple[Dict[int, int], Optional[Path]]:
+        """Bytes needed per volume and the first folder short of space (None if they all fit)"""
+        volumes: Dict[int, int] = {}
+        short = None
+        for folder, size in needs.items():
+            parent = existing_parent(folder)
+            device = parent.stat().st_dev
+            volumes[device] = volumes.get(device, 0) + size
+            free = shutil.disk_usage(parent).free - self._reserved.get(device, 0) - self.margin
+            if short is None and volumes[device] > free:
+                short = folder
+        return volumes, short
+
+    def reserve(self, job_id: str, volumes: Dict[int, int]):
+        self._jobs[job_id] = volumes
+        for device, size in volumes.items():
+            self._reserved[device] = self._reserved.get(device, 0) + size
+
+    def release(self, job_id: str):
+        for device, size in self._jobs.pop(job_id, {}).items():
+            self._reserved[device] -= size
+            if not self._reserved[device]:
+                del self._reserved[device]
+
+    def reserved(self) -> int:
+        """Bytes currently reserved on all volumes"""
+        return sum(self._reserved.values())
@@ -0,0 +1,260 @@
+"""
+downloader_cli.py
+Linea de comandos sin interfaz grafica para el descargador (servidores, cron,
+contenedores). Usa el mismo motor que la GUI y no importa tkinter.
+
+Uso:
+    python -m downloader_cli URL [URL ...]
+    python -m downloader_cli -i urls.txt
+    cat urls.txt | python -m downloader_cli -i -
+    python -m downloader_cli --resume
+    python -m downloader_cli --search "artista titulo"
+
+El progreso se escribe en stdout como JSON, un objeto por linea.
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Optional, Dict, Any, List
+
+from downloader_metrics import MetricsServer
+from downloader_engine import (
+    Config, ConfigManager, DownloadArchive, DownloadScheduler, JobJournal, LibraryIndex, ProgressAggregator,
+    parse_playlist_items, setup_logging,
+    JOB_DONE, JOB_SKIPPED, FINISHED_STATES
+)
+
+# Exit status codes
+EXIT_OK = 0
+EXIT_FAILED = 1  # At least one job failed or was canceled
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+# A cancel stops transfers and FFmpeg in well under a second; the rest is margin for a slow disk
+SHUTDOWN_TIMEOUT = 10.0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="downloader_cli",
+        description="Descarga audio con yt-dlp sin interfaz grafica. "
+                    "El progreso se emite como JSON por linea en stdout."
+    )
+    parser.add_argument("urls", nargs="*", help="URLs a descargar")
+    parser.add_argument("-i", "--input", metavar="FILE",
+                        help="Archivo con una URL por linea ('-' para stdin)")
+    parser.add_argument("-o", "--output", metavar="DIR", help="Carpeta de salida")
+    parser.add_argument("-f", "--format", choices=Config.SUPPORTED_FORMATS, help="Formato de audio")
+    parser.add_argument("-b", "--bitrate", choices=Config.BITRATE_OPTIONS, help="Calidad en kbps")
+    parser.add_argument("-j", "--concurrent", type=int, metavar="N", help="Descargas simultaneas")
+    parser.add_argument("--artist-folders", action="store_true", default=None,
+                        help="Crear carpetas por artista")
+    parser.add_argument("--no-skip-existing", dest="skip_existing", action="store_false", default=None,
+                        help="No omitir pistas ya descargadas")
+    parser.add_argument("--playlist", action="store_true", default=None,
+                        help="Descargar listas, sets y paginas de artista completas")
+    parser.add_argument("--items", metavar="SPEC", help="Rango de pistas de la lista (ej. 1-50,75)")
+    parser.add_argument("--shortest-first", dest="queue_order", action="store_const", const="shortest",
+                        help="Empezar por las pistas mas cortas (segun la duracion obtenida de antemano)")
+    parser.add_argument("--limit-rate", type=int, metavar="KB",
+                        help="Limite total de ancho de banda en KB/s, repartido entre las descargas activas")
+    parser.add_argument("--job-limit-rate", type=int, metavar="KB",
+                        help="Limite de ancho de banda de cada descarga en KB/s")
+    parser.add_argument("--loudness", dest="loudness_mode", choices=Config.LOUDNESS_MODES,
+                        help="Medir la sonoridad (EBU R128): etiquetas ReplayGain o normalizar al convertir")
+    parser.add_argument("--loudness-target", type=float, metavar="LUFS",
+                        help="Sonoridad objetivo al normalizar (por defecto -18)")
+    parser.add_argument("--dedup", dest="dedup_action", choices=Config.DEDUP_ACTIONS,
+                        help="Pistas ya descargadas desde otra URL: omitirlas o enlazarlas (hardlink)")
+    parser.add_argument("--staging-dir", metavar="DIR",
+                        help="Carpeta local rapida para los archivos intermedios; la pista terminada "
+                             "se mueve despues a la carpeta de salida")
+    parser.add_argument("--min-free", dest="min_free_mb", type=int, metavar="MB",
+                        help="Espacio libre que se deja en cada disco; las descargas que no caben esperan")
+    parser.add_argument("--retries", type=int, metavar="N",
+                        help="Reintentos de una descarga tras un error de red pasajero")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reanudar las descargas que quedaron sin terminar en la ejecucion anterior")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Servir metricas en http://127.0.0.1:PORT/metrics (y /metrics.json)")
+    parser.add_argument("--archive-import", metavar="DIR",
+                        help="Importar una biblioteca existente al historial y salir")
+    parser.add_argument("--archive-rebuild", metavar="DIR",
+                        help="Reconstruir el historial desde una biblioteca y salir")
+    parser.add_argument("--search", metavar="TEXTO",
+                        help="Buscar en la biblioteca descargada (una linea JSON por pista) y salir")
+    parser.add_argument("--library-rescan", metavar="DIR",
+                        help="Sincronizar el indice de la biblioteca con una carpeta y salir")
+    return parser
+
+
+def read_urls(args: argparse.Namespace) -> List[str]:
+    """Collect URLs from the arguments and the optional input file/stdin"""
+    urls = list(args.urls)
+    source = args.input
+    if source is None and not urls and not sys.stdin.isatty():
+        source = "-"
+    if source:
+        stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+        with stream:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    urls.append(line)
+    return urls
+
+
+def apply_overrides(config: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    """Apply command line options on top of the saved configuration"""
+    overrides = {
+        'output_dir': args.output,
+        'format': args.format,
+        'bitrate': args.bitrate,
+        'max_concurrent': args.concurrent,
+        'max_retries': args.retries,
+        'bandwidth_limit_kb': args.limit_rate,
+        'job_bandwidth_limit_kb': args.job_limit_rate,
+        'create_artist_folders': args.artist_folders,
+        'skip_existing': args.skip_existing,
+        'playlist_mode': args.playlist,
+        'playlist_items': args.items,
+        'queue_order': args.queue_order,
+        'dedup_action': args.dedup_action,
+        'loudness_mode': args.loudness_mode,
+        'loudness_target': args.loudness_target,
+        'staging_dir': args.staging_dir,
+        'min_free_mb': args.min_free_mb,
+        'metrics_port': args.metrics_port,
+    }
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def emit(job_id: Optional[str], msg_type: str, payload: Any):
+    """Write one progress event as a JSON line"""
+    event = {"time": round(time.time(), 3), "job": job_id, "type": msg_type, "payload": payload}
+    sys.stdout.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+
+def run(urls: List[str], config: Dict[str, Any], scheduler: DownloadScheduler,
+        progress_queue: ProgressAggregator, logger, resume: bool = False) -> int:
+    """Download every URL (plus unfinished journal jobs with ``resume``) and return the exit status.
+
+    The caller shuts the scheduler down afterwards, also after an interrupt.
+    """
+    scheduler.start()
+    if resume:
+        scheduler.resume_journal()
+    metrics_server = None
+    if config.get('metrics_port'):
+        try:
+            metrics_server = MetricsServer(scheduler.metrics, config['metrics_port'])
+            metrics_server.start()
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint on port {config['metrics_port']}: {e}")
+    for url in urls:
+        if config.get('playlist_mode'):
+            scheduler.submit_playlist(url, config.get('playlist_items', ""))
+        else:
+            scheduler.submit(url)
+
+    results: Dict[str, str] = {}
+    listing_failed = False
+    try:
+        while True:
+            idle = scheduler.is_idle()
+            progress_queue.wait(timeout=0.2)
+            events, progress = progress_queue.drain()
+            for job_id, msg_type, payload in events:
+                emit(job_id, msg_type, payload)
+                if msg_type == "state" and payload in FINISHED_STATES:
+                    results[job_id] = payload
+                elif msg_type == "error" and job_id and job_id.startswith("playlist-"):
+                    listing_failed = True
+            for job_id, payload in progress.items():
+                emit(job_id, "progress", payload)
+            if idle and progress_queue.empty():
+                break
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        emit(None, "canceled", "Interrumpido por el usuario")
+        return EXIT_INTERRUPTED
+    finally:
+        if metrics_server:
+            metrics_server.stop()
+
+    ok = sum(1 for state in results.values() if state in (JOB_DONE, JOB_SKIPPED))
+    emit(None, "summary", {
+        "total": len(results),
+        "done": sum(1 for state in results.values() if state == JOB_DONE),
+        "skipped": sum(1 for state in results.values() if state == JOB_SKIPPED),
+        "failed": len(results) - ok,
+        "metrics": scheduler.metrics.summary(),
+    })
+    return EXIT_OK if ok == len(results) and not listing_failed else EXIT_FAILED
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    config = apply_overrides(ConfigManager().load_config(), args)
+    # Logs go to stderr so stdout stays pure JSON lines
+    logger = setup_logging(stream=sys.stderr, json_format=config.get('log_format') == 'json')
+    archive = DownloadArchive(Config.ARCHIVE_FILE)
+    journal = JobJournal(Config.JOURNAL_FILE)
+    library = LibraryIndex(Config.LIBRARY_FILE)
+    scheduler = None
+
+    try:
+        if args.archive_import or args.archive_rebuild:
+            folder = args.archive_rebuild or args.archive_import
+            added = archive.rebuild(folder) if args.archive_rebuild else archive.import_library(folder)
+            emit(None, "archive", {"folder": folder, "added": added, "total": archive.count()})
+            return EXIT_OK
+        if args.search is not None:
+            for track in library.search(args.search):
+                emit(None, "track", track)
+            return EXIT_OK
+        if args.library_rescan:
+            added, updated, removed = library.rescan(args.library_rescan)
+            emit(None, "library", {"folder": args.library_rescan, "added": added, "updated": updated,
+                                   "removed": removed, "total": library.count()})
+            return EXIT_OK
+
+        try:
+            urls = read_urls(args)
+            if config.get('playlist_mode'):
+                parse_playlist_items(config.get('playlist_items', ""))
+        except (OSError, ValueError) as e:
+            parser.print_usage(sys.stderr)
+            print(f"{parser.prog}: error: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        unfinished = len(journal.unfinished())
+        if not urls and not (args.resume and unfinished):
+            parser.print_usage(sys.stderr)
+            print(f"{parser.prog}: error: no se indicaron URLs", file=sys.stderr)
+            return EXIT_USAGE
+        if unfinished and not args.resume:
+            logger.info(f"{unfinished} unfinished job(s) from a previous run; use --resume to continue them")
+
+        # Progress is coalesced per job, so at most one line per job and tick
+        progress_queue = ProgressAggregator()
+        scheduler = DownloadScheduler(config, progress_queue, logger, archive=archive, journal=journal,
+                                      library=library)
+        return run(urls, config, scheduler, progress_queue, logger, resume=args.resume)
+    finally:
+        # Workers, listings and conversions are joined before the databases they write to are closed
+        if scheduler is None or scheduler.shutdown(timeout=SHUTDOWN_TIMEOUT):
+            archive.close()
+            journal.close()
+            library.close()
+        # Otherwise leave the databases to a worker still stopping; every write is already committed
+
+
+if __name__ == "__main__":
+    sys.exit(main())
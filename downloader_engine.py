@@ -0,0 +1,1918 @@
+"""
+downloader_engine.py
+Motor de descarga (yt-dlp) sin dependencias de interfaz: configuracion,
+historial, planificador de descargas e hilo de descarga. Lo usan la GUI
+(app4.py) y la linea de comandos (downloader_cli.py).
+"""
+
+import sys
+import threading
+import queue
+import time
+import shutil
+import json
+import atexit
+import logging
+import logging.handlers
+import itertools
+import importlib.util
+import sqlite3
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from downloader_metrics import JobMetrics, MetricsRegistry
+from cover_cache import CoverCache
+from retry_policy import HostGate, RetryPolicy, classify_error
+from bandwidth_limiter import BandwidthLimiter
+from metadata_cache import MetadataCache, streams_fresh
+from library_index import AUDIO_EXTENSIONS, LibraryIndex, read_tags, source_url
+from audio_fingerprint import DuplicateIndex, analyze, link_duplicate
+from loudness import LoudnessCache
+import child_processes
+from disk_staging import UNKNOWN_SIZE, DiskBudget, estimate_output, publish
+from audio_pipeline import (
+    EMBED_COVER_FORMATS, LOSSY_FORMATS, LOUDNESS_MODES, TranscodeSkipped, TranscodeStage, TranscodeTask, can_copy_audio,
+    format_selector, run_transcode, source_codec, temp_path
+)
+
+# ---------------------------
+# Configuration & Constants
+# ---------------------------
+class Config:
+    DEFAULT_BITRATE = "192"
+    SUPPORTED_FORMATS = ["mp3", "m4a", "flac", "wav"]
+    BITRATE_OPTIONS = ["320", "256", "192", "128", "96"]
+    COVER_FORMATS = ["jpg", "png", "webp"]
+    COVER_SIZES = ["original", "1000", "500", "300"]  # Longest side in pixels
+    QUEUE_ORDERS = ["fifo", "shortest"]  # Order in which queued jobs start
+    DEDUP_ACTIONS = ["off", "skip", "hardlink"]  # What to do with a track already in the library
+    LOUDNESS_MODES = list(LOUDNESS_MODES)  # ReplayGain tags or gain applied while encoding
+    DEFAULT_OUT_TEMPLATE = "%(artist)s - %(title).200s.%(ext)s"
+    FALLBACK_TEMPLATE = "%(uploader)s - %(title).200s.%(ext)s"
+    CONFIG_FILE = "downloader_config.json"
+    LOG_FILE = "downloader.log"
+    SESSION_LOG_FILE = "downloader_session.log"  # Full UI log of the current session
+    ARCHIVE_FILE = "download_archive.db"
+    COVER_CACHE_DIR = "cover_cache"
+    JOURNAL_FILE = "download_journal.db"  # Unfinished jobs, resumed after a restart or crash
+    METADATA_CACHE_FILE = "metadata_cache.db"  # extract_info results by normalized URL
+    LIBRARY_FILE = "library.db"  # Searchable index of downloaded tracks
+    FINGERPRINT_FILE = "fingerprints.db"  # Content hashes and acoustic fingerprints for dedup
+    LOUDNESS_CACHE_FILE = "loudness.db"  # EBU R128 measurements by track
+    AUDIO_EXTENSIONS = AUDIO_EXTENSIONS
+    MAX_LOG_SIZE = 1024 * 1024  # 1MB
+    LOG_BACKUP_COUNT = 3  # Rotated files kept (downloader.log.1 ... .3)
+    LOG_FORMATS = ["text", "json"]
+    POLL_MIN_MS = 50  # UI refresh interval while messages are flowing
+    POLL_MAX_MS = 500  # Upper bound for the back-off when idle
+
+# Job states shared by the scheduler and the UI
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_CONVERTING = "converting"  # Downloaded, waiting for or running the FFmpeg stage
+JOB_DONE = "done"
+JOB_ERROR = "error"
+JOB_CANCELED = "canceled"
+JOB_SKIPPED = "skipped"
+FINISHED_STATES = (JOB_DONE, JOB_ERROR, JOB_CANCELED, JOB_SKIPPED)
+JOB_RETRY = "retry"  # Worker outcome only: the scheduler requeues the job as queued
+DISK_RECHECK = 5.0  # Seconds between free-space checks while a job waits for room on disk
+
+# ---------------------------
+# Lazy yt-dlp Loading
+# ---------------------------
+# Importing yt_dlp loads hundreds of extractor modules, so it is deferred
+# until the first download (or preloaded in the background by the GUI).
+_yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+
+def load_yt_dlp():
+    """Import yt_dlp on first use and return the module"""
+    global _yt_dlp
+    if _yt_dlp is None:
+        with _yt_dlp_lock:
+            if _yt_dlp is None:
+                import yt_dlp
+                _yt_dlp = yt_dlp
+    return _yt_dlp
+
+
+def preload_yt_dlp() -> threading.Thread:
+    """Start importing yt_dlp on a background thread"""
+    loader = threading.Thread(target=load_yt_dlp, name="yt-dlp-preload", daemon=True)
+    loader.start()
+    return loader
+
+
+def yt_dlp_available() -> bool:
+    """Check that yt_dlp is installed without importing it"""
+    return importlib.util.find_spec("yt_dlp") is not None
+
+# ---------------------------
+# Logging Setup
+# ---------------------------
+TEXT_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line, including job ids and timings passed as ``extra``"""
+    EXTRA_FIELDS = ("job_id", "url", "state", "phase", "phases", "duration", "bytes", "speed", "retries")
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        if record.exc_info:
+            event["exception"] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+def setup_logging(stream=None, json_format: bool = False):
+    """Configure non-blocking logging with size-based rotation.
+
+    Threads only put records on an in-memory queue; a QueueListener thread
+    writes them to the rotating file (``MAX_LOG_SIZE``) and the console.
+    Calling it again replaces the previous setup.
+    """
+    global _log_listener
+    stop_logging()
+    
+    file_handler = logging.handlers.RotatingFileHandler(
+        Config.LOG_FILE, maxBytes=Config.MAX_LOG_SIZE, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonLinesFormatter() if json_format else logging.Formatter(TEXT_LOG_FORMAT))
+    console_handler = logging.StreamHandler(stream or sys.stdout)
+    console_handler.setFormatter(logging.Formatter(TEXT_LOG_FORMAT))
+    
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))  # Listener handlers do the real formatting
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler], force=True)
+    
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    _log_listener.start()
+    return logging.getLogger(__name__)
+
+
+def stop_logging():
+    """Flush pending records and stop the listener thread"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+
+
+atexit.register(stop_logging)
+
+# ---------------------------
+# Configuration Manager
+# ---------------------------
+class ConfigManager:
+    def __init__(self):
+        self.config_path = Path(Config.CONFIG_FILE)
+        self.default_config = {
+            "output_dir": str(Path.home() / "Downloads"),
+            "bitrate": Config.DEFAULT_BITRATE,
+            "format": "mp3",
+            "template": Config.DEFAULT_OUT_TEMPLATE,
+            "create_artist_folders": False,
+            "skip_existing": True,
+            "max_concurrent": 3,
+            "prefetch_workers": 2,  # Metadata lookups ahead of the download slots, 0 = off
+            "queue_order": "fifo",
+            "transcode_workers": 0,  # 0 = one FFmpeg conversion per CPU
+            "max_retries": 5,  # Requeues of a job after a transient network error
+            "per_host_limit": 0,  # Simultaneous downloads per server, 0 = max_concurrent
+            "socket_timeout": 15,
+            "bandwidth_limit_kb": 0,  # KB/s shared by all downloads, 0 = unlimited
+            "job_bandwidth_limit_kb": 0,  # KB/s cap of a single download, 0 = unlimited
+            "playlist_mode": False,
+            "playlist_items": "",
+            "log_max_lines": 1000,
+            "log_format": "text",
+            "metrics_port": 0,  # 0 disables the local metrics endpoint
+            "save_cover_art": True,
+            "cover_format": "jpg",
+            "cover_size": "original",
+            "cover_cache_mb": 200,  # Size cap of the shared cover cache
+            "metadata_cache_days": 7,  # How long extracted metadata is reused
+            "metadata_cache_mb": 50,
+            "dedup_action": "off",  # skip or hardlink tracks that are already downloaded
+            "loudness_mode": "off",  # replaygain tags or normalize while encoding
+            "loudness_target": -18.0,  # LUFS a normalized track is brought to
+            "staging_dir": "",  # Local folder for intermediate files, "" = the output folder itself
+            "min_free_mb": 500  # Free space kept on each disk; jobs that would go below it wait
+        }
+    
+    def load_config(self) -> Dict[str, Any]:
+        """Load configuration from file"""
+        try:
+            if self.config_path.exists():
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                    # Merge with defaults for missing keys
+                    return {**self.default_config, **config}
+        except Exception as e:
+            logging.warning(f"Failed to load config: {e}")
+        return self.default_config.copy()
+    
+    def save_config(self, config: Dict[str, Any]):
+        """Save configuration to file"""
+        try:
+            with open(self.config_path, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            logging.error(f"Failed to save config: {e}")
+
+# ---------------------------
+# Download Archive
+# ---------------------------
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {"si", "in", "ref", "utm_source", "utm_medium", "utm_campaign",
+                   "utm_content", "utm_term", "feature", "p", "c"}
+
+
+def normalize_url(url: str) -> str:
+    """Reduce a URL to a stable key: no scheme, www/m prefix, fragment or tracking params"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    query = sorted((k, v) for k, v in parse_qsl(parts.query) if k.lower() not in TRACKING_PARAMS)
+    key = host + parts.path.rstrip('/')
+    if query:
+        key += "?" + urlencode(query)
+    return key
+
+
+class DownloadArchive:
+    """Persistent record of finished downloads keyed by extractor + id.
+
+    The SQLite file is only read once at startup; every lookup afterwards
+    hits in-memory sets, so already-downloaded URLs are skipped before any
+    network request.
+    """
+    def __init__(self, path: str = Config.ARCHIVE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS archive (
+                extractor TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                filepath TEXT,
+                added REAL,
+                PRIMARY KEY (extractor, video_id)
+            );
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                archive_key TEXT
+            );
+        """)
+        self._keys = {f"{row[0]} {row[1]}" for row in self._conn.execute("SELECT extractor, video_id FROM archive")}
+        self._urls = {row[0] for row in self._conn.execute("SELECT url FROM urls")}
+
+    @staticmethod
+    def make_key(extractor: str, video_id: str) -> str:
+        """Archive key in yt-dlp's ``--download-archive`` format"""
+        return f"{extractor.lower()} {video_id}"
+
+    def count(self) -> int:
+        """Number of archived tracks and URLs"""
+        with self._lock:
+            return len(self._keys | self._urls)
+
+    def contains_url(self, url: str) -> bool:
+        """True if this URL (after normalization) was already downloaded"""
+        key = normalize_url(url)
+        with self._lock:
+            return key in self._urls
+
+    def contains(self, extractor: str, video_id: str) -> bool:
+        """True if this extractor + id pair was already downloaded"""
+        key = self.make_key(extractor, video_id)
+        with self._lock:
+            return key in self._keys
+
+    def add(self, extractor: Optional[str], video_id: Optional[str], urls: List[str],
+            filepath: Optional[str] = None):
+        """Record a finished download and every URL that points to it"""
+        key = self.make_key(extractor, video_id) if extractor and video_id else None
+        url_keys = {normalize_url(url) for url in urls if url}
+        with self._lock:
+            if key:
+                self._conn.execute("INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?)",
+                                   (extractor.lower(), video_id, filepath, time.time()))
+                self._keys.add(key)
+            self._conn.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?)",
+                                   [(url_key, key) for url_key in url_keys])
+            self._urls.update(url_keys)
+            self._conn.commit()
+
+    def import_library(self, folder: str) -> int:
+        """Scan an existing library folder and archive the source URL of every track.
+
+        yt-dlp's FFmpegMetadata stores the page URL in the ``purl``/``comment``
+        tags, which survive renames and reorganizing. Returns the number of
+        tracks added.
+        """
+        added = 0
+        for path in Path(folder).rglob("*"):
+            if path.suffix.lower() not in Config.AUDIO_EXTENSIONS:
+                continue
+            url = self._read_source_url(path)
+            if url:
+                self.add(None, None, [url], str(path))
+                added += 1
+        return added
+
+    def rebuild(self, folder: str) -> int:
+        """Forget everything and rebuild the archive from a library folder"""
+        with self._lock:
+            self._conn.execute("DELETE FROM archive")
+            self._conn.execute("DELETE FROM urls")
+            self._conn.commit()
+            self._keys.clear()
+            self._urls.clear()
+        return self.import_library(folder)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _read_source_url(self, path: Path) -> Optional[str]:
+        """Read the source page URL embedded in an audio file's tags"""
+        return source_url(read_tags(path))
+
+# ---------------------------
+# Job Journal
+# ---------------------------
+class JournalEntry:
+    """An unfinished job read back from the journal"""
+    def __init__(self, entry_id: int, url: str, title: Optional[str], config: Dict[str, Any],
+                 state: str, handoff: Optional[Dict[str, Any]]):
+        self.entry_id = entry_id
+        self.url = url
+        self.title = title
+        self.config = config
+        self.state = state
+        self.handoff = handoff  # Set once the raw file is fully downloaded
+
+
+class JobJournal:
+    """Crash-safe record of every job until it finishes.
+
+    Each state change is committed immediately, so after closing the app
+    mid-batch (or a crash) the unfinished jobs can be queued again. Jobs
+    whose download already finished keep a ``handoff`` with everything the
+    transcode stage needs, so they skip the network on resume; partial
+    downloads continue from their ``.part`` file. The files a job writes are
+    recorded too, so discarding it removes them.
+    """
+    def __init__(self, path: str = Config.JOURNAL_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._closed = False  # Workers may still report after the app closed the journal
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                title TEXT,
+                config TEXT NOT NULL,
+                state TEXT NOT NULL,
+                handoff TEXT,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS partials (
+                entry_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                PRIMARY KEY (entry_id, path)
+            );
+        """)
+        # Finished jobs from earlier sessions are no longer needed
+        self._conn.execute(f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(FINISHED_STATES))})",
+                           FINISHED_STATES)
+        self._conn.execute("DELETE FROM partials WHERE entry_id NOT IN (SELECT entry_id FROM jobs)")
+        self._conn.commit()
+
+    def add(self, url: str, title: Optional[str], config: Dict[str, Any]) -> int:
+        """Record a newly queued job and return its entry id"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, title, config, state, updated) VALUES (?, ?, ?, ?, ?)",
+                (url, title, json.dumps(config, ensure_ascii=False), JOB_QUEUED, time.time()))
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def set_state(self, entry_id: int, state: str):
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("UPDATE jobs SET state = ?, updated = ? WHERE entry_id = ?",
+                               (state, time.time(), entry_id))
+            self._conn.commit()
+
+    def set_handoff(self, entry_id: int, handoff: Dict[str, Any]):
+        """Mark the download stage as done; a resume goes straight to transcoding"""
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.execute("UPDATE jobs SET handoff = ?, updated = ? WHERE entry_id = ?",
+                               (json.dumps(handoff, ensure_ascii=False, default=str), time.time(), entry_id))
+            self._conn.commit()
+
+    def add_partial(self, entry_id: int, paths: List[str]):
+        """Record files a job is writing (.part, raw stream), to delete if it is discarded"""
+        with self._lock:
+            if self._closed:
+                return
+            self._conn.executemany("INSERT OR IGNORE INTO partials VALUES (?, ?)",
+                                   [(entry_id, path) for path in paths])
+            self._conn.commit()
+
+    def unfinished(self) -> List[JournalEntry]:
+        """Jobs that were queued or in progress when the last session ended"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT entry_id, url, title, config, state, handoff FROM jobs "
+                f"WHERE state NOT IN ({','.join('?' * len(FINISHED_STATES))}) ORDER BY entry_id",
+                FINISHED_STATES).fetchall()
+        return [JournalEntry(entry_id, url, title, json.loads(config), state, json.loads(handoff) if handoff else None)
+                for entry_id, url, title, config, state, handoff in rows]
+
+    def discard_unfinished(self):
+        """Forget the unfinished jobs instead of resuming them, deleting what they left on disk"""
+        for entry in self.unfinished():
+            with self._lock:
+                paths = [row[0] for row in self._conn.execute("SELECT path FROM partials WHERE entry_id = ?",
+                                                              (entry.entry_id,))]
+            if entry.handoff:
+                source = Path(entry.handoff['filepath'])
+                paths += [str(source), str(temp_path(source.with_suffix(f".{entry.config.get('format', 'mp3')}")))]
+            for path in paths:
+                for leftover in (Path(path), Path(f"{path}.ytdl")):
+                    try:
+                        leftover.unlink(missing_ok=True)
+                    except OSError:
+                        pass  # In use or already gone: not worth keeping the entry for
+            if entry.config.get('staging_dir'):
+                # Same name DownloaderThread._staging_folder gives the job's folder
+                shutil.rmtree(Path(entry.config['staging_dir']) / f"entry-{entry.entry_id}", ignore_errors=True)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET state = ? WHERE state NOT IN ({','.join('?' * len(FINISHED_STATES))})",
+                (JOB_CANCELED, *FINISHED_STATES))
+            self._conn.execute("DELETE FROM partials")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+# ---------------------------
+# Enhanced Downloader Thread
+# ---------------------------
+class _YdlLogger:
+    """Routes yt-dlp output to our logger and counts retries"""
+    def __init__(self, thread: 'DownloaderThread'):
+        self.thread = thread
+
+    def debug(self, msg: str):
+        pass
+
+    def info(self, msg: str):
+        pass
+
+    def warning(self, msg: str):
+        if "Retrying" in msg:
+            self.thread.metrics.retries += 1
+        self.thread.logger.warning(f"yt-dlp: {msg}", extra=self.thread._log_extra())
+
+    def error(self, msg: str):
+        # Errors are raised as exceptions and logged by DownloaderThread.run
+        self.thread.logger.debug(f"yt-dlp: {msg}", extra=self.thread._log_extra())
+
+
+class _YdlSlot:
+    """Hooks and logger of a pooled YoutubeDL, pointed at the job currently using it"""
+    def __init__(self):
+        self.thread: Optional['DownloaderThread'] = None
+        self.logger: Optional[_YdlLogger] = None
+
+    def attach(self, thread: Optional['DownloaderThread']):
+        self.thread = thread
+        self.logger = _YdlLogger(thread) if thread is not None else None
+
+    def progress(self, d):
+        thread = self.thread
+        if thread is not None:
+            thread._progress_hook(d)
+
+    def debug(self, msg: str):
+        pass
+
+    def info(self, msg: str):
+        pass
+
+    def warning(self, msg: str):
+        if self.logger is not None:
+            self.logger.warning(msg)
+        else:
+            logging.getLogger(__name__).warning(f"yt-dlp: {msg}")
+
+    def error(self, msg: str):
+        if self.logger is not None:
+            self.logger.error(msg)
+
+
+class YdlPool:
+    """Long-lived YoutubeDL instances shared by jobs with the same options.
+
+    A pooled instance keeps its HTTP connections (keep-alive), cookies and
+    extractor objects, so tokens such as SoundCloud's client_id are looked
+    up once instead of once per track. Each instance is checked out by one
+    job at a time; hooks and logging go through a per-instance slot that
+    points at that job, and ``paths`` is reset on every checkout.
+    """
+    def __init__(self, max_idle: int = 8):
+        self.max_idle = max_idle  # Idle instances kept per option set
+        self.created = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[tuple]] = {}
+        self._closed = False
+
+    @staticmethod
+    def key(opts: Dict[str, Any]) -> str:
+        """Option-set key (callables are not allowed in ``opts``).
+
+        ``paths`` is left out: it is set on every checkout, and with a
+        staging dir it names a per-job folder that would never match.
+        """
+        return json.dumps({name: value for name, value in opts.items() if name != 'paths'},
+                          sort_keys=True, default=repr)
+
+    @contextmanager
+    def acquire(self, opts: Dict[str, Any], thread: Optional['DownloaderThread'] = None):
+        """Check out an instance configured with ``opts`` for the duration of the block"""
+        key = self.key(opts)
+        with self._lock:
+            entries = self._idle.get(key)
+            entry = entries.pop() if entries else None
+            if entry is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if entry is None:
+            slot = _YdlSlot()
+            params = dict(opts, progress_hooks=[slot.progress], logger=slot)
+            entry = (load_yt_dlp().YoutubeDL(params), slot)
+        ydl, slot = entry
+        ydl.params['paths'] = dict(opts.get('paths') or {})
+        slot.attach(thread)
+        try:
+            yield ydl
+        finally:
+            slot.attach(None)
+            self._release(key, entry)
+
+    def close(self):
+        """Close every idle instance; instances in use are closed when returned"""
+        with self._lock:
+            self._closed = True
+            entries = [entry for entries in self._idle.values() for entry in entries]
+            self._idle.clear()
+        for ydl, _ in entries:
+            ydl.close()
+
+    def _release(self, key: str, entry: tuple):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and len(idle) < self.max_idle:
+                idle.append(entry)
+                return
+        entry[0].close()
+
+
+class DownloaderThread(threading.Thread):
+    def __init__(self, url: str, config: Dict[str, Any], progress_queue: queue.Queue, 
+                 stop_event: threading.Event, logger: logging.Logger,
+                 job_id: Optional[str] = None, resume_event: Optional[threading.Event] = None,
+                 archive: Optional[DownloadArchive] = None,
+                 transcode_stage: Optional[TranscodeStage] = None,
+                 cover_cache: Optional[CoverCache] = None, ydl_pool: Optional[YdlPool] = None,
+                 journal: Optional[JobJournal] = None, entry_id: Optional[int] = None,
+                 handoff: Optional[Dict[str, Any]] = None, retry_policy: Optional[RetryPolicy] = None,
+                 attempt: int = 0, bandwidth: Optional[BandwidthLimiter] = None,
+                 info: Optional[Dict[str, Any]] = None, metadata_cache: Optional[MetadataCache] = None,
+                 library: Optional[LibraryIndex] = None, duplicates: Optional[DuplicateIndex] = None,
+                 loudness_cache: Optional[LoudnessCache] = None):
+        super().__init__(daemon=True)
+        self.url = url
+        self.config = config
+        self.progress_queue = progress_queue
+        self.stop_event = stop_event
+        self.logger = logger
+        self.job_id = job_id
+        self.resume_event = resume_event  # Cleared while the job is paused
+        self.archive = archive
+        self.download_info = {}
+        self.extract_calls = 0  # Extractor round trips made by this job
+        self.state = JOB_RUNNING
+        self.metrics = JobMetrics(job_id, url)
+        # Without a stage the conversion runs inline on this thread
+        self.transcode_stage = transcode_stage
+        self.pending_transcode: Optional[Future] = None  # Set while the FFmpeg stage owns the job
+        self.cover_cache = cover_cache
+        # A private pool with no idle slots behaves like a one-off YoutubeDL
+        self.ydl_pool = ydl_pool or YdlPool(max_idle=0)
+        self.journal = journal
+        self.entry_id = entry_id
+        self.handoff = handoff  # From the journal: the download stage already finished
+        self.retry_policy = retry_policy  # Without one every error fails the job
+        self.attempt = attempt  # Earlier requeues of this job
+        self.retry_delay: Optional[float] = None  # Set with JOB_RETRY
+        self.transient_error = False  # Failed on the network rather than on the track
+        self.bandwidth = bandwidth  # Shared budget; the progress hook throttles against it
+        self._received = 0  # Bytes of the current file already accounted to the limiter
+        self.prefetched_info = info  # Extracted ahead of time by the scheduler's prefetch stage
+        self.downloaded = 0  # Bytes received by the current transfer
+        self.metadata_cache = metadata_cache
+        self.library = library
+        self.duplicates = duplicates
+        self.loudness_cache = loudness_cache
+        self._output_hash: Optional[str] = None  # Computed by the dedup stage, reused by the library
+        self._output_bitrate: Optional[int] = None  # kbps written, for the library index
+        self._archive_entry: Optional[tuple] = None
+        self._transcode_task: Optional[TranscodeTask] = None
+        self.keep_files = False  # Set by a shutdown: partial files stay for resuming
+        self._partial_files = set()  # .part, raw stream and temp files to delete on cancel
+        self._work_dir: Optional[Path] = None  # This job's folder under the staging dir
+        self._destination: Optional[Path] = None  # Output folder the finished track is moved to
+        
+    def run(self):
+        try:
+            self._download()
+        except TranscodeSkipped as e:
+            self._skip(f"Ya existe, omitido: {e.path.name}")
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._release_bandwidth()
+        if self.pending_transcode is None:
+            self._finish()
+
+    def finish_transcode(self, future: Future):
+        """Complete the job once the FFmpeg stage is done with it"""
+        try:
+            self._complete(future.result())
+        except TranscodeSkipped as e:
+            self._skip(f"Ya existe, omitido: {e.path.name}")
+        except Exception as e:
+            self._fail(e)
+        self.pending_transcode = None
+        self._finish()
+
+    def _fail(self, error: Exception):
+        if self.stop_event.is_set():
+            self.state = JOB_CANCELED
+            self._emit("canceled", "Descarga cancelada por usuario")
+            return
+        delay, reason = None, None
+        # Only the network stage is retried; a failed conversion would fail again
+        if self.retry_policy is not None and self._transcode_task is None:
+            delay, reason = self.retry_policy.decide(error, self.attempt)
+            self.transient_error = classify_error(error)[0]
+        if delay is not None:
+            # Transient failure: the scheduler puts the job back in the queue
+            self.state = JOB_RETRY
+            self.retry_delay = delay
+            self.logger.warning(f"Transient error ({reason}), retry {self.attempt + 1}/"
+                                f"{self.retry_policy.max_attempts} in {delay:.1f}s: {error}",
+                                extra=self._log_extra())
+            self._emit("status", f"Error temporal ({reason}), reintento {self.attempt + 1}/"
+                                 f"{self.retry_policy.max_attempts} en {delay:.0f} s")
+        else:
+            self.state = JOB_ERROR
+            self.logger.error(f"Download error: {error}", extra=self._log_extra())
+            self._emit("error", f"Error: {str(error)}")
+
+    def _finish(self):
+        """Settle the final state and log the job's timings"""
+        if self.state == JOB_RUNNING:
+            self.state = JOB_CANCELED if self.stop_event.is_set() else JOB_DONE
+        if self.state == JOB_CANCELED and not self.keep_files:
+            self._discard_partial()
+        self._remove_work_dir()
+        self.metrics.finish(self.state)
+        self.logger.info(f"Job {self.state}: {self.url}",
+                         extra=self._log_extra(state=self.state, duration=round(self.metrics.duration, 3),
+                                               bytes=self.metrics.bytes, speed=round(self.metrics.speed),
+                                               retries=self.metrics.retries,
+                                               phases=self.metrics.to_dict()['phases']))
+
+    def _discard_partial(self):
+        """Delete what a canceled job left on disk (it will not be resumed)"""
+        for name in self._partial_files:
+            for path in (Path(name), Path(f"{name}.ytdl")):
+                try:
+                    path.unlink(missing_ok=True)
+                except OSError as e:
+                    self.logger.warning(f"Could not remove {path}: {e}", extra=self._log_extra())
+        self._partial_files.clear()
+
+    def _remove_work_dir(self):
+        """Drop the job's staging folder if nothing is left in it for a later resume"""
+        if self._work_dir is not None:
+            try:
+                self._work_dir.rmdir()
+            except OSError:
+                pass  # Not empty (kept for resuming) or already gone
+
+    def _log_extra(self, **fields) -> Dict[str, Any]:
+        """Structured fields attached to this job's log records"""
+        return {'job_id': self.job_id, 'url': self.url, **fields}
+
+    def _emit(self, msg_type: str, payload: Any):
+        """Send a message to the UI tagged with this job's id"""
+        self.progress_queue.put((self.job_id, msg_type, payload))
+
+    def _download(self):
+        """Main download logic with enhanced options"""
+        if self.stop_event.is_set():
+            return  # Canceled while waiting for the prefetch
+        output_dir = Path(self.config['output_dir'])
+        skip_existing = self.config.get('skip_existing', True)
+        
+        # Resumed from the journal with the download already complete
+        if self.handoff and Path(self.handoff['filepath']).exists():
+            self.download_info = self.handoff.get('info') or {}
+            self._emit("info", self.download_info)
+            self._emit("status", "Reanudando: el audio ya estaba descargado")
+            self._transcode(self.handoff)
+            return
+        
+        # Archive lookup is in-memory: no network request for known URLs
+        if skip_existing and self.archive and self.archive.contains_url(self.url):
+            self._skip(f"Ya descargado, omitido: {self.url}")
+            return
+        
+        # Build output template (the folder is resolved after extraction)
+        template = self.config.get('template', Config.DEFAULT_OUT_TEMPLATE)
+        
+        audio_format = self.config.get('format', 'mp3')
+        
+        # Enhanced yt-dlp options
+        ydl_opts = {
+            # Prefer a stream already in the target codec so it can be copied
+            'format': format_selector(audio_format),
+            'outtmpl': template,
+            'paths': {'home': str(self._staging_folder(output_dir))},
+            'noplaylist': True,
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,  # Progress goes through the hooks, not stdout
+            'extract_flat': False,
+            'writethumbnail': False,  # Artwork comes from the shared cover cache
+            'writeinfojson': False,  # Skip JSON metadata
+            'restrictfilenames': False,
+            'nocheckcertificate': True,
+            # Short timeout and few in-request retries: longer outages are
+            # handled by requeueing the job with backoff (RetryPolicy)
+            'socket_timeout': int(self.config.get('socket_timeout', 15)),
+            'retries': 3,
+            'fragment_retries': 3,
+            'continuedl': True,  # Continue a .part file left by an interrupted session
+            'skip_download': False,
+        }
+        
+        # Skip if file exists
+        if skip_existing:
+            ydl_opts['overwrites'] = False
+        if self.retry_policy is not None:
+            # Jittered sleeps between yt-dlp's own retries (shared policy, so the pool key is stable)
+            ydl_opts['retry_sleep_functions'] = {'http': self.retry_policy.ydl_sleep,
+                                                 'fragment': self.retry_policy.ydl_sleep}
+        
+        # No FFmpeg postprocessors here: the raw stream goes to the transcode stage
+        # so this network slot is free as soon as the transfer ends
+        
+        self._emit("status", "Extrayendo información...")
+        
+        # Hooks and logger are attached by the pool; pooled instances keep
+        # connections and extractor state from earlier jobs
+        with self.ydl_pool.acquire(ydl_opts, thread=self) as ydl:
+            # Single extraction: the same info dict feeds the artist folder,
+            # the info panel and the download itself
+            info = self.prefetched_info or self._cached_info()
+            reused = info is not None
+            if info is None:
+                with self.metrics.phase("extract"):
+                    info = self._extract_info(ydl)
+            if self.stop_event.is_set():
+                return  # Canceled during the extraction: do not start the transfer
+            artist = info.get('artist') or info.get('uploader') or 'Unknown'
+            extractor = info.get('extractor_key') or info.get('ie_key')
+            
+            # Same track reached through a different URL
+            if (skip_existing and self.archive and extractor and info.get('id')
+                    and self.archive.contains(extractor, info['id'])):
+                self.archive.add(extractor, info['id'], [self.url])
+                self._skip(f"Ya descargado, omitido: {info.get('title', self.url)}")
+                return
+            
+            # Create artist subfolder if enabled
+            if self.config.get('create_artist_folders', False):
+                output_dir = output_dir / self._sanitize_filename(artist)
+                ydl.params['paths'] = {'home': str(self._staging_folder(output_dir))}
+            
+            # Finished track already in the output folder (also without the archive)
+            if skip_existing:
+                existing = self._final_path(ydl.prepare_filename(info), output_dir, audio_format)
+                if existing.exists():
+                    self._skip(f"Ya existe, omitido: {existing.name}")
+                    return
+            
+            # With a staging dir the output folder is only created when the track is published
+            work_dir = self._staging_folder(output_dir)
+            if work_dir != output_dir:
+                self._work_dir = work_dir
+            work_dir.mkdir(parents=True, exist_ok=True)
+            
+            # ALONSO AGRADECE CADA DESCARGA
+            self.download_info = {
+                'title': info.get('title', 'Unknown'),
+                'artist': artist,
+                'duration': info.get('duration'),
+                'description': info.get('description', ''),
+                'webpage_url': info.get('webpage_url', self.url)
+            }
+            
+            self._emit("info", self.download_info)
+            self._emit("status", "Iniciando descarga...")
+            
+            # Download from the already extracted info (no second page request).
+            # "prepare" covers format selection and the thumbnail fetch
+            self.metrics.start_phase("prepare")
+            try:
+                result = ydl.process_ie_result(info, download=True)
+            except load_yt_dlp().utils.DownloadError:
+                if not reused or self.stop_event.is_set():
+                    raise
+                # Stream URLs from the cache/prefetch went stale early: extract them again
+                self.logger.info(f"Reused stream URLs failed, extracting again: {self.url}",
+                                 extra=self._log_extra())
+                if self.metadata_cache is not None:
+                    self.metadata_cache.invalidate(normalize_url(self.url))
+                with self.metrics.phase("extract"):
+                    info = self._extract_info(ydl)
+                result = ydl.process_ie_result(info, download=True)
+            
+        if self.stop_event.is_set():
+            return
+        downloads = result.get('requested_downloads') or [{}]
+        if not downloads[0].get('filepath'):
+            raise RuntimeError("No se obtuvo el archivo descargado")
+        # Everything the transcode stage needs, journaled so a restart skips the download
+        handoff = {
+            'filepath': downloads[0]['filepath'],
+            'codec': source_codec(downloads[0]) or source_codec(result),
+            'abr': downloads[0].get('abr') or result.get('abr'),
+            'metadata': self._tag_metadata(result),
+            'thumbnail': result.get('thumbnail') or next(
+                (thumb['url'] for thumb in reversed(result.get('thumbnails') or []) if thumb.get('url')), None),
+            'archive': [extractor, info.get('id'), [self.url, info.get('webpage_url')]],
+            'info': self.download_info,
+            'destination': str(output_dir),
+        }
+        if self.journal is not None and self.entry_id is not None:
+            self.journal.set_handoff(self.entry_id, handoff)
+        self._transcode(handoff)
+
+    def _transcode(self, handoff: Dict[str, Any]):
+        """Hand the raw download to the FFmpeg stage (or convert inline without one)"""
+        self.metrics.end_phase("prepare")
+        self._archive_entry = tuple(handoff['archive'])
+        audio_format = self.config.get('format', 'mp3')
+        bitrate = self.config.get('bitrate', Config.DEFAULT_BITRATE)
+        source = Path(handoff['filepath'])
+        target = source.with_suffix(f".{audio_format}")
+        destination = Path(handoff.get('destination') or source.parent)
+        if destination != source.parent:
+            self._work_dir, self._destination = source.parent, destination
+        self._partial_files.update((str(source), str(temp_path(target))))
+        cover_format = self.config.get('cover_format', 'jpg')
+        cover_size = self.config.get('cover_size', 'original')
+        save_cover = self.config.get('save_cover_art', False)
+        cover_digest = None
+        if audio_format in EMBED_COVER_FORMATS or save_cover:
+            cover_digest = self._fetch_cover(handoff.get('thumbnail'))
+        copy_audio, reason = can_copy_audio(audio_format, handoff.get('codec'), handoff.get('abr'), bitrate)
+        loudness_mode = self.config.get('loudness_mode', 'off')
+        if loudness_mode == "normalize" and copy_audio:
+            # The gain is applied by the encode, so the stream cannot be copied
+            copy_audio, reason = False, f"re-encode {handoff.get('codec')} to normalize loudness"
+        extractor, video_id = handoff['archive'][:2]
+        if audio_format in LOSSY_FORMATS:
+            abr = handoff.get('abr')
+            self._output_bitrate = round(abr) if copy_audio and abr else int(bitrate)
+        self.logger.info(f"Audio: {reason} ({source.name})", extra=self._log_extra(phase="transcode"))
+        task = TranscodeTask(
+            job_id=self.job_id,
+            source=source,
+            target=target,
+            audio_format=audio_format,
+            bitrate=bitrate,
+            metadata=handoff['metadata'],
+            stop_event=self.stop_event,
+            metrics=self.metrics,
+            copy_audio=copy_audio,
+            cover_cache=self.cover_cache,
+            cover_digest=cover_digest,
+            cover_output=target.with_suffix(f".{cover_format}") if save_cover else None,
+            cover_size=int(cover_size) if str(cover_size).isdigit() else None,
+            loudness_mode=loudness_mode,
+            loudness_target=float(self.config.get('loudness_target', -18.0)),
+            loudness_key=f"{extractor}:{video_id}" if extractor and video_id else None,
+            loudness_cache=self.loudness_cache,
+            keep_existing=self.config.get('skip_existing', True)
+        )
+        self._transcode_task = task
+        if self.transcode_stage is None:
+            self._emit("status", "Procesando audio..." if not copy_audio else "Copiando audio sin recodificar...")
+            with self.metrics.phase("transcode"):
+                output = run_transcode(task)
+            self._complete(output)
+            return
+        self._emit("status", "En cola de conversion...")
+        self.metrics.start_phase("transcode_wait")
+        # Blocks while the stage is full: backpressure on the download slots
+        self.pending_transcode = self.transcode_stage.submit(task)
+
+    def _complete(self, output: Path):
+        """Record the finished track and notify the UI.
+
+        The conversion already consumed the raw stream, so from here on a
+        cancel no longer applies: the track is published and recorded.
+        """
+        self.state = JOB_DONE
+        self._partial_files.clear()  # Nothing left for a late cancel to delete
+        output = self._publish(output)
+        if self._transcode_task and self._transcode_task.cover_error:
+            self.logger.warning(f"Cover skipped: {self._transcode_task.cover_error}", extra=self._log_extra())
+        if self._transcode_task and self._transcode_task.loudness:
+            integrated, peak = self._transcode_task.loudness
+            gain = self._transcode_task.gain
+            self.logger.info(f"Loudness {integrated:.1f} LUFS, peak {peak:.3f}"
+                             + (f", gain {gain:+.1f} dB applied" if gain is not None else ""),
+                             extra=self._log_extra(phase="loudness"))
+        original = self._deduplicate(output)
+        if self.archive and self._archive_entry:
+            extractor, video_id, urls = self._archive_entry
+            self.archive.add(extractor, video_id, urls, str(original or output))
+        if original is not None and not output.exists():
+            self._skip(f"Duplicado de {Path(original).name}, omitido")
+            return
+        if self.library is not None:
+            try:
+                self.library.add(output, self.download_info, self.config.get('format'), self._output_bitrate,
+                                 digest=self._output_hash)
+            except Exception as e:
+                # The track is fine; a rescan can index it later
+                self.logger.warning(f"Library index update failed: {e}", extra=self._log_extra())
+        self._emit("complete", "Descarga completada exitosamente")
+
+    def _publish(self, output: Path) -> Path:
+        """Move the converted track (and its cover) from the staging dir to the output folder"""
+        if self._destination is None:
+            return output
+        with self.metrics.phase("publish"):
+            cover = self._transcode_task.cover_output if self._transcode_task else None
+            if self._transcode_task and self._transcode_task.keep_existing \
+                    and (self._destination / output.name).exists():
+                # Written by another job while this one was converting
+                for path in (output, cover):
+                    if path is not None:
+                        path.unlink(missing_ok=True)
+                raise TranscodeSkipped(self._destination / output.name)
+            if cover is not None and cover.exists():
+                publish(cover, self._destination)
+            # The audio goes last: once it is in place the job is complete
+            output = publish(output, self._destination)
+        return output
+
+    def _final_path(self, filename: str, output_dir: Path, audio_format: str) -> Path:
+        """Where the converted track of a yt-dlp filename ends up"""
+        target = Path(filename).with_suffix(f".{audio_format}")
+        if self._staging_folder(output_dir) != output_dir:
+            return output_dir / target.name  # Published out of the job's staging folder
+        return target
+
+    def _staging_folder(self, output_dir: Path) -> Path:
+        """Folder yt-dlp and FFmpeg write to: a per-job folder under the staging dir, if set"""
+        staging = self.config.get('staging_dir')
+        if not staging:
+            return output_dir
+        # Named after the journal entry so a resumed job finds its .part file again
+        name = f"entry-{self.entry_id}" if self.entry_id is not None else self.job_id or "job"
+        return Path(staging) / name
+
+    def _deduplicate(self, output: Path) -> Optional[str]:
+        """Look the finished track up in the duplicate index; the existing copy if it was one"""
+        action = self.config.get('dedup_action', 'off')
+        if self.duplicates is None or action not in ("skip", "hardlink"):
+            return None
+        try:
+            with self.metrics.phase("dedup"):
+                digest, duration, fingerprint = analyze(output, owner=self.job_id)
+                if self.stop_event.is_set():
+                    return None
+                original = self.duplicates.find(digest, duration, fingerprint, exclude=str(output))
+        except Exception as e:
+            self.logger.warning(f"Duplicate check failed: {e}", extra=self._log_extra())
+            return None
+        if original is None:
+            self._output_hash = digest
+            self.duplicates.add(output, digest, duration, fingerprint)
+            return None
+        size = output.stat().st_size
+        if action == "hardlink":
+            try:
+                if Path(original).suffix.lower() != output.suffix.lower():
+                    raise OSError("different audio format")  # A link would put the wrong container here
+                link_duplicate(original, output)
+            except OSError as e:
+                # Different volume, format or no hardlink support: keep both copies
+                self.logger.warning(f"Hardlink to {original} failed: {e}", extra=self._log_extra())
+                self._output_hash = digest
+                self.duplicates.add(output, digest, duration, fingerprint)
+                return None
+            self._emit("status", f"Duplicado de {Path(original).name}: enlazado sin ocupar espacio")
+        else:
+            output.unlink(missing_ok=True)
+        self.logger.info(f"Duplicate of {original} ({action}, {size} bytes saved)",
+                         extra=self._log_extra(phase="dedup", saved_bytes=size))
+        self.metrics.saved_bytes = size
+        self.duplicates.record_saving(size)
+        return original
+
+    def _tag_metadata(self, info: Dict[str, Any]) -> Dict[str, str]:
+        """Tags written during conversion (the fields yt-dlp's FFmpegMetadata used)"""
+        tags = {
+            'title': info.get('track') or info.get('title'),
+            'artist': info.get('artist') or info.get('creator') or info.get('uploader'),
+            'album': info.get('album'),
+            'album_artist': info.get('album_artist'),
+            'track': info.get('track_number'),
+            'genre': info.get('genre'),
+            'date': info.get('release_date') or info.get('upload_date'),
+            'description': info.get('description'),
+            # Source page URL; DownloadArchive.import_library reads it back
+            'comment': info.get('webpage_url'),
+            'purl': info.get('webpage_url'),
+        }
+        return {key: str(value) for key, value in tags.items() if value}
+
+    def _fetch_cover(self, url: Optional[str]) -> Optional[str]:
+        """Fetch the artwork through the cover cache; returns its cache key"""
+        if not url or self.cover_cache is None:
+            return None
+        try:
+            with self.metrics.phase("cover"):
+                return self.cover_cache.fetch(url)
+        except Exception as e:
+            self.logger.warning(f"Cover fetch failed: {e}", extra=self._log_extra())
+            return None
+
+    def _skip(self, message: str):
+        """Finish the job without downloading anything"""
+        self.state = JOB_SKIPPED
+        self._emit("skipped", message)
+
+    def _extract_info(self, ydl) -> Dict[str, Any]:
+        """Run the extractor once for this job and count the call"""
+        self.extract_calls += 1
+        info = ydl.extract_info(self.url, download=False, process=False)
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(normalize_url(self.url), info)
+        return info
+
+    def _cached_info(self) -> Optional[Dict[str, Any]]:
+        """Cached extraction of this URL if its stream URLs are still valid"""
+        if self.metadata_cache is None:
+            return None
+        cached = self.metadata_cache.get(normalize_url(self.url))
+        if cached is None or not streams_fresh(*cached):
+            return None
+        return cached[0]
+
+    def _progress_hook(self, d):
+        """Enhanced progress hook with better error handling"""
+        self._wait_if_paused()
+        if self.stop_event.is_set():
+            raise load_yt_dlp().utils.DownloadError("User cancelled")
+        
+        status = d.get('status')
+        
+        if status == 'downloading':
+            names = {name for name in (d.get('tmpfilename'), d.get('filename')) if name}
+            if not names <= self._partial_files:
+                self._partial_files.update(names)
+                if self.journal is not None and self.entry_id is not None:
+                    self.journal.add_partial(self.entry_id, sorted(names))
+            if not self.metrics.seen("download"):
+                self.metrics.end_phase("prepare")
+                self.metrics.start_phase("download")
+            self._handle_download_progress(d)
+            self._throttle(d)
+            if self.stop_event.is_set():
+                # Canceled while held back by the limiter: abort before the next block is read
+                raise load_yt_dlp().utils.DownloadError("User cancelled")
+        elif status == 'finished':
+            self._release_bandwidth()
+            self.metrics.end_phase("download")
+            self.metrics.bytes += d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            filename = Path(d.get('filename', '')).name
+            self._emit("status", f"Descarga finalizada: {filename}")
+        elif status == 'error':
+            error_msg = d.get('error', 'Unknown error')
+            self._emit("error", f"Error en descarga: {error_msg}")
+
+    def _throttle(self, d):
+        """Hold the transfer back to its share of the bandwidth budget"""
+        if self.bandwidth is None:
+            return
+        downloaded = d.get('downloaded_bytes') or 0
+        if downloaded < self._received:
+            self._received = 0  # A new file or a restarted transfer
+        self.bandwidth.consume(self.job_id or self.url, downloaded - self._received, self.stop_event)
+        self._received = downloaded
+
+    def _release_bandwidth(self):
+        """Give this job's bandwidth share back to the other transfers"""
+        if self.bandwidth is not None:
+            self.bandwidth.close(self.job_id or self.url)
+        self._received = 0
+
+    def _wait_if_paused(self):
+        """Block the transfer while the job is paused (until resume or cancel)"""
+        if self.resume_event is None or self.resume_event.is_set():
+            return
+        if self.bandwidth is not None:
+            self.bandwidth.close(self.job_id or self.url)  # A paused job needs no share
+        self._emit("status", "Descarga en pausa")
+        while not self.resume_event.wait(0.2):
+            if self.stop_event.is_set():
+                return
+        self._emit("status", "Descarga reanudada")
+
+    def _handle_download_progress(self, d):
+        """Handle download progress with detailed information"""
+        downloaded = d.get('downloaded_bytes', 0)
+        self.downloaded = downloaded
+        total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+        speed = d.get('speed', 0)
+        eta = d.get('eta', 0)
+        filename = Path(d.get('filename', '')).name
+        
+        percent = None
+        if total > 0:
+            percent = min(100.0, (downloaded / total) * 100.0)
+        
+        progress_info = {
+            'percent': percent,
+            'downloaded': downloaded,
+            'total': total,
+            'speed': speed,
+            'eta': eta,
+            'filename': filename
+        }
+        
+        self._emit("progress", progress_info)
+
+    def _sanitize_filename(self, filename: str) -> str:
+        """Sanitize filename for filesystem compatibility"""
+        invalid_chars = '<>:"/\\|?*'
+        for char in invalid_chars:
+            filename = filename.replace(char, '')
+        return filename.strip()
+
+# ---------------------------
+# Playlist Helpers
+# ---------------------------
+def parse_playlist_items(spec: str) -> List[tuple]:
+    """Parse a 1-based range spec like ``1-50,75,100-`` into (start, end) pairs.
+
+    ``end`` is None for open ranges. An empty spec selects everything.
+    """
+    ranges = []
+    for part in spec.replace(' ', '').split(','):
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start else 1
+                end = int(end) if end else None
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Rango de pistas invalido: {part}")
+        if start < 1 or (end is not None and end < start):
+            raise ValueError(f"Rango de pistas invalido: {part}")
+        ranges.append((start, end))
+    return ranges
+
+
+def in_playlist_items(index: int, ranges: List[tuple]) -> bool:
+    """True if the 1-based ``index`` is selected by ``ranges``"""
+    if not ranges:
+        return True
+    return any(start <= index and (end is None or index <= end) for start, end in ranges)
+
+
+def playlist_items_exhausted(index: int, ranges: List[tuple]) -> bool:
+    """True once ``index`` is past every selected range (listing can stop)"""
+    if not ranges or any(end is None for _, end in ranges):
+        return False
+    return index > max(end for _, end in ranges)
+
+# ---------------------------
+# Metadata Prefetch
+# ---------------------------
+def estimate_download(info: Dict[str, Any]) -> Tuple[Optional[float], Optional[int]]:
+    """Duration and approximate download size of an unprocessed info dict.
+
+    The size comes from the best audio-only format (reported size, or
+    duration times bitrate); None when the extractor gives neither.
+    """
+    duration = info.get('duration')
+    formats = info.get('formats') or [info]
+    audio = [f for f in formats if f.get('vcodec') in (None, 'none')] or formats
+    best = max(audio, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+    size = best.get('filesize') or best.get('filesize_approx')
+    rate = best.get('abr') or best.get('tbr')
+    if not size and duration and rate:
+        size = int(duration * rate * 1000 / 8)
+    return duration, size
+
+# ---------------------------
+# Progress Aggregation
+# ---------------------------
+# Messages after which a job sends no more progress
+TERMINAL_MESSAGES = ("complete", "error", "canceled", "skipped")
+
+
+class ProgressAggregator:
+    """Drop-in replacement for ``progress_queue`` that coalesces progress.
+
+    ``put`` takes the same ``(job_id, msg_type, payload)`` tuples. For each
+    job only the latest "progress" payload is kept; every other message is
+    delivered exactly once and in order. A pending progress snapshot is
+    flushed ahead of the next ordered message of the same job, so a status
+    line is never overwritten by older progress.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._events = deque()
+        self._progress: Dict[Optional[str], Any] = {}
+        self.received = 0
+        self.coalesced = 0
+
+    def put(self, item: tuple, block: bool = True, timeout: Optional[float] = None):
+        job_id, msg_type, payload = item
+        with self._cond:
+            self.received += 1
+            if msg_type == "progress":
+                if job_id in self._progress:
+                    self.coalesced += 1
+                self._progress[job_id] = payload
+            else:
+                pending = self._progress.pop(job_id, None)
+                if pending is not None and msg_type not in TERMINAL_MESSAGES:
+                    self._events.append((job_id, "progress", pending))
+                self._events.append(item)
+            self._cond.notify_all()
+
+    def put_nowait(self, item: tuple):
+        self.put(item)
+
+    def empty(self) -> bool:
+        with self._cond:
+            return not self._events and not self._progress
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until something is pending; returns False on timeout"""
+        with self._cond:
+            if not self._events and not self._progress:
+                self._cond.wait(timeout)
+            return bool(self._events or self._progress)
+
+    def drain(self) -> Tuple[List[tuple], Dict[Optional[str], Any]]:
+        """Take every ordered message plus the latest progress of each job"""
+        with self._cond:
+            events = list(self._events)
+            self._events.clear()
+            progress, self._progress = self._progress, {}
+        return events, progress
+
+# ---------------------------
+# Download Scheduler
+# ---------------------------
+class DownloadJob:
+    """A single queued URL with its own cancel/pause controls"""
+    def __init__(self, job_id: str, url: str, config: Dict[str, Any]):
+        self.job_id = job_id
+        self.url = url
+        self.config = config
+        self.title: Optional[str] = None  # Known early for playlist entries
+        self.playlist_id: Optional[str] = None
+        self.state = JOB_QUEUED
+        self.stop_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+        self.worker: Optional[DownloaderThread] = None
+        self.entry_id: Optional[int] = None  # Row in the job journal
+        self.handoff: Optional[Dict[str, Any]] = None  # Journaled result of a finished download
+        self.host = urlsplit(url).hostname or ""
+        self.attempts = 0  # Times the job was requeued after a transient error
+        self.not_before = 0.0  # Monotonic time before which a requeued job may not start
+        # Filled by the prefetch stage
+        self.info: Optional[Dict[str, Any]] = None
+        self.info_time = 0.0  # Unix time the info was extracted (it may come from the cache)
+        self.duration: Optional[float] = None
+        self.estimated_size: Optional[int] = None
+        self.prefetching = False
+        self.prefetched = threading.Event()  # Set once a started prefetch is over
+        self.keep_files = False  # Canceled by a shutdown: leave the partial files for resuming
+
+
+class DownloadScheduler:
+    """Bounded worker pool running up to ``max_concurrent`` downloads at once.
+
+    Every message a job produces is put on ``progress_queue`` as
+    ``(job_id, msg_type, payload)``; state changes are sent as
+    ``(job_id, "state", state)``.
+    """
+    def __init__(self, config: Dict[str, Any], progress_queue: queue.Queue, logger: logging.Logger,
+                 archive: Optional[DownloadArchive] = None, journal: Optional[JobJournal] = None,
+                 library: Optional[LibraryIndex] = None):
+        self.config = config
+        self.progress_queue = progress_queue
+        self.logger = logger
+        self.archive = archive
+        self.library = library
+        self.journal = journal
+        self.metrics = MetricsRegistry()
+        self.max_concurrent = max(1, int(config.get('max_concurrent', 3)))
+        # CPU stage: conversions run apart from the network slots above
+        self.transcode_stage = TranscodeStage(workers=int(config.get('transcode_workers', 0) or 0))
+        # YoutubeDL instances reused across jobs (warm connections and extractor tokens)
+        self.prefetch_workers = max(0, int(config.get('prefetch_workers', 2)))
+        self.ydl_pool = YdlPool(max_idle=self.max_concurrent + self.prefetch_workers)
+        # Extraction results reused across jobs and sessions
+        self.metadata_cache = MetadataCache(Config.METADATA_CACHE_FILE,
+                                            float(config.get('metadata_cache_days', 7)) * 86400,
+                                            int(config.get('metadata_cache_mb', 50)) * 1024 * 1024)
+        # Hashes and fingerprints of finished tracks, for the optional dedup stage
+        self.duplicates = DuplicateIndex(Config.FINGERPRINT_FILE)
+        # Loudness measurements, so a track is analyzed once however often it is converted
+        self.loudness_cache = LoudnessCache(Config.LOUDNESS_CACHE_FILE)
+        # Artwork shared by every job (one fetch/conversion per distinct image)
+        self.cover_cache = CoverCache(Config.COVER_CACHE_DIR, int(config.get('cover_cache_mb', 200)) * 1024 * 1024)
+        # Transient failures are requeued with backoff; hosts that keep failing are paused
+        self.retry_policy = RetryPolicy(max_attempts=int(config.get('max_retries', 5)))
+        self.host_gate = HostGate(int(config.get('per_host_limit', 0) or 0) or self.max_concurrent)
+        self.bandwidth = BandwidthLimiter()
+        self.set_bandwidth_limits(config.get('bandwidth_limit_kb', 0), config.get('job_bandwidth_limit_kb', 0))
+        # Jobs start only while their estimated files fit on disk with this margin left over
+        self.disk_budget = DiskBudget(max(0, int(config.get('min_free_mb', 500) or 0)) * 1024 * 1024)
+        self.jobs: Dict[str, DownloadJob] = {}
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._running = 0
+        self._converting = 0  # Jobs handed to the transcode stage
+        self._listings: Dict[str, threading.Event] = {}  # playlist id -> stop event
+        self._shutdown = False
+        self._workers: List[threading.Thread] = []
+        self._prefetch_queue: queue.Queue = queue.Queue()  # Jobs to look up; None stops a worker
+        
+    def start(self):
+        """Spawn the worker threads"""
+        for i in range(self.max_concurrent):
+            worker = threading.Thread(target=self._worker_loop, name=f"download-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        for i in range(self.prefetch_workers):
+            worker = threading.Thread(target=self._prefetch_loop, name=f"prefetch-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, url: str, title: Optional[str] = None, playlist_id: Optional[str] = None,
+               config: Optional[Dict[str, Any]] = None, entry: Optional[JournalEntry] = None) -> str:
+        """Queue a URL (or a journal entry being resumed) and return its job id"""
+        config = dict(config or self.config)
+        if entry is not None:
+            entry_id, handoff = entry.entry_id, entry.handoff
+        elif self.journal is not None:
+            entry_id, handoff = self.journal.add(url, title, config), None
+        else:
+            entry_id = handoff = None
+        with self._cond:
+            job_id = f"job-{next(self._ids)}"
+            job = DownloadJob(job_id, url, config)
+            job.title = title
+            job.playlist_id = playlist_id
+            job.entry_id = entry_id
+            job.handoff = handoff
+            self.jobs[job_id] = job
+            self._pending.append(job)
+            self._cond.notify()
+        self._set_state(job, JOB_QUEUED)
+        if self.prefetch_workers and handoff is None:
+            self._prefetch_queue.put(job)
+        return job_id
+
+    def submit_many(self, urls: List[str]) -> List[str]:
+        """Queue several URLs in order"""
+        return [self.submit(url) for url in urls]
+
+    def resume_journal(self) -> List[str]:
+        """Queue again every job left unfinished by the previous session"""
+        if self.journal is None:
+            return []
+        return [self.submit(entry.url, title=entry.title, config=entry.config, entry=entry)
+                for entry in self.journal.unfinished()]
+
+    def submit_playlist(self, url: str, items: str = "") -> str:
+        """List a playlist/set/artist page and queue its entries as they arrive.
+
+        The listing is a flat extraction (no per-track requests); every entry
+        becomes a regular job as soon as it is known, so downloads start while
+        the rest of the listing is still being fetched.
+        """
+        ranges = parse_playlist_items(items)
+        config = dict(self.config)
+        with self._cond:
+            playlist_id = f"playlist-{next(self._ids)}"
+            stop = threading.Event()
+            self._listings[playlist_id] = stop
+        listing = threading.Thread(target=self._list_playlist, name=f"list-{playlist_id}",
+                                   args=(playlist_id, url, ranges, config, stop), daemon=True)
+        listing.start()
+        with self._cond:
+            self._workers.append(listing)  # Joined by shutdown: it submits jobs to the journal
+        return playlist_id
+
+    def pause(self, job_id: str):
+        """Pause a queued or running job"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        # Under the lock so the worker starting the job sees either the pause or RUNNING
+        with self._cond:
+            if job.state in (JOB_QUEUED, JOB_RUNNING):
+                job.resume_event.clear()
+                self._set_state(job, JOB_PAUSED)
+
+    def resume(self, job_id: str):
+        """Resume a paused job"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        with self._cond:
+            if job.state == JOB_PAUSED:
+                job.resume_event.set()
+                self._set_state(job, JOB_QUEUED if job in self._pending else JOB_RUNNING)
+                self._cond.notify()
+
+    def cancel(self, job_id: str, keep_files: bool = False):
+        """Cancel a job; queued jobs are dropped, running ones are stopped.
+
+        A running job's FFmpeg processes are killed and a conversion still
+        waiting for the stage is withdrawn, so the job confirms within a
+        poll interval. Its partial files are deleted unless ``keep_files``.
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.state in FINISHED_STATES:
+            return
+        worker = job.worker
+        if worker is not None and worker.state == JOB_DONE:
+            return  # Converted and being published: too late to cancel
+        job.keep_files = keep_files
+        if worker is not None:
+            worker.keep_files = keep_files
+        job.stop_event.set()
+        job.resume_event.set()  # Wake a paused transfer so it can exit
+        child_processes.kill(job_id)
+        if worker is not None and worker.pending_transcode is not None:
+            worker.pending_transcode.cancel()  # Only succeeds while it is still queued
+        with self._cond:
+            if job in self._pending:
+                self._pending.remove(job)
+                dropped = True
+            else:
+                dropped = False
+        if dropped:
+            self._set_state(job, JOB_CANCELED)
+
+    def cancel_all(self, keep_files: bool = False):
+        """Cancel every unfinished job and stop pending playlist listings"""
+        with self._cond:
+            for stop in self._listings.values():
+                stop.set()
+        for job_id in list(self.jobs):
+            self.cancel(job_id, keep_files=keep_files)
+
+    def set_bandwidth_limits(self, limit_kb: float, per_job_kb: float):
+        """Change the bandwidth budget (KB/s, 0 = unlimited); applies to running downloads"""
+        self.bandwidth.set_limits(max(0.0, float(limit_kb or 0)) * 1024, max(0.0, float(per_job_kb or 0)) * 1024)
+
+    def set_min_free(self, mb: int):
+        """Change the free-space margin kept on each disk; queued jobs are checked against it"""
+        with self._cond:
+            self.disk_budget.margin = max(0, int(mb or 0)) * 1024 * 1024
+            self._cond.notify_all()
+
+    def batch_estimate(self) -> Dict[str, Any]:
+        """Bytes left to download in the unfinished jobs and the ETA at the current throughput"""
+        with self._cond:
+            jobs = [job for job in self.jobs.values() if job.state in (JOB_QUEUED, JOB_RUNNING, JOB_PAUSED)]
+        remaining = 0
+        unknown = 0
+        for job in jobs:
+            if job.estimated_size is None:
+                unknown += 1
+                continue
+            received = job.worker.downloaded if job.worker and job.state == JOB_RUNNING else 0
+            remaining += max(0, job.estimated_size - received)
+        rate = self.bandwidth.throughput()
+        return {
+            "jobs": len(jobs),
+            "unknown": unknown,  # Jobs without a size estimate yet
+            "remaining_bytes": remaining,
+            "eta": remaining / rate if rate and remaining else None,
+        }
+
+    def is_idle(self) -> bool:
+        """True when nothing is queued, running, converting or still being listed"""
+        with self._cond:
+            return (not self._pending and self._running == 0 and self._converting == 0
+                    and not self._listings)
+
+    def shutdown(self, timeout: float = 1.0) -> bool:
+        """Stop all jobs and wait up to ``timeout`` seconds in total for them to exit.
+
+        Jobs stopped here stay unfinished in the journal, and their partial
+        files stay on disk, so the next session can resume them. Every
+        FFmpeg child is killed. Returns True if all workers, playlist
+        listings and conversions stopped in time; only then are the caches
+        the scheduler owns closed, and the caller may close the archive,
+        journal and library it passed in.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._shutdown = True
+        self.cancel_all(keep_files=True)
+        child_processes.kill()
+        with self._cond:
+            self._cond.notify_all()
+        for _ in range(self.prefetch_workers):
+            self._prefetch_queue.put(None)
+        with self._cond:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+        stopped = self.transcode_stage.shutdown(timeout=max(0.0, deadline - time.monotonic()))
+        stopped = stopped and not any(worker.is_alive() for worker in workers)
+        self.ydl_pool.close()
+        if not stopped:
+            # Left open for the thread still stopping; every write is already committed
+            self.logger.warning("Some downloads were still stopping at shutdown")
+            return False
+        for store in (self.metadata_cache, self.duplicates, self.loudness_cache, self.cover_cache):
+            store.close()
+        return True
+
+    def _list_playlist(self, playlist_id: str, url: str, ranges: List[tuple],
+                       config: Dict[str, Any], stop: threading.Event):
+        """Stream playlist entries into the job queue"""
+        queued = 0
+        try:
+            self.progress_queue.put((playlist_id, "status", f"Listando pistas de {url}..."))
+            opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}
+            with self.ydl_pool.acquire(opts) as ydl:
+                result = ydl.extract_info(url, download=False, process=False)
+                if result.get('_type') not in ('playlist', 'multi_video'):
+                    # Not a playlist after all: download it as a single track
+                    self.submit(url, title=result.get('title'), config=config)
+                    queued = 1
+                    return
+                # 'entries' may be a lazy generator; consume it as it pages in
+                for index, entry in enumerate(result.get('entries') or [], start=1):
+                    if stop.is_set() or playlist_items_exhausted(index, ranges):
+                        break
+                    if not entry or not in_playlist_items(index, ranges):
+                        continue
+                    entry_url = entry.get('url') or entry.get('webpage_url')
+                    if not entry_url:
+                        continue
+                    job_id = self.submit(entry_url, title=entry.get('title'), playlist_id=playlist_id,
+                                         config=config)
+                    # Flat entries often carry the duration already (shortest-first ordering)
+                    job = self.jobs[job_id]
+                    job.duration = job.duration or entry.get('duration')
+                    queued += 1
+            self.progress_queue.put((playlist_id, "status",
+                                     f"Lista completa: {queued} pistas en cola ({result.get('title') or url})"))
+        except Exception as e:
+            self.logger.error(f"Playlist listing error: {e}")
+            self.progress_queue.put((playlist_id, "error", f"Error al listar {url}: {e}"))
+        finally:
+            with self._cond:
+                self._listings.pop(playlist_id, None)
+                self._cond.notify_all()
+
+    def _next_job(self) -> Optional[DownloadJob]:
+        """Block until a runnable job is available.
+
+        Skips paused jobs, jobs still in their retry backoff, jobs whose
+        host is at its concurrency limit or has an open circuit and jobs
+        whose files would not fit on disk. A job that does not fit even
+        with nothing else running fails instead of waiting forever.
+        """
+        while True:
+            too_big = []
+            with self._cond:
+                job = None
+                while not self._shutdown and job is None and not too_big:
+                    now = time.monotonic()
+                    job, wake_at = self._pick_job(now, too_big)
+                    if job is None and not too_big:
+                        self._cond.wait(None if wake_at is None else wake_at - now)
+            for rejected, folder in too_big:
+                self.logger.error(f"Not enough disk space in {folder} for {rejected.url}")
+                self.progress_queue.put((rejected.job_id, "error",
+                                         f"Error: espacio en disco insuficiente en {folder}"))
+                self._set_state(rejected, JOB_ERROR)
+            if job is not None or self._shutdown:
+                return job
+
+    def _pick_job(self, now: float, too_big: list) -> Tuple[Optional[DownloadJob], Optional[float]]:
+        """Start the first runnable job (lock held); otherwise when to look again"""
+        wake_at = None
+        for job in self._queue_order():
+            if not job.resume_event.is_set():
+                continue
+            ready_at = max(job.not_before, self.host_gate.blocked_until(job.host, now))
+            if ready_at > now:
+                wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                continue
+            if not self.host_gate.available(job.host, now):
+                continue
+            volumes, short = self.disk_budget.check(self._disk_needs(job))
+            if short is not None:
+                if self._running or self._converting:
+                    # Space comes back as running jobs finish; also recheck now
+                    # and then in case something else freed it
+                    ready_at = now + DISK_RECHECK
+                    wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                else:
+                    # Does not fit even with nothing else running: fail it
+                    self._pending.remove(job)
+                    too_big.append((job, short))
+                continue
+            self._pending.remove(job)
+            self.host_gate.acquire(job.host)
+            self.disk_budget.reserve(job.job_id, volumes)
+            self._running += 1
+            return job, None
+        return None, wake_at
+
+    def _disk_needs(self, job: DownloadJob) -> Dict[Path, int]:
+        """Bytes the job will write in each folder: raw stream and conversion, then the published track"""
+        raw = job.estimated_size or UNKNOWN_SIZE
+        output = estimate_output(job.duration, job.config.get('format', 'mp3'),
+                                 job.config.get('bitrate', Config.DEFAULT_BITRATE)) or raw
+        if job.handoff is not None:
+            raw = 0  # Resumed with the download already on disk
+        destination = Path(job.config['output_dir'])
+        staging = job.config.get('staging_dir')
+        if not staging:
+            return {destination: raw + output}
+        # Both folders may sit on the same volume: DiskBudget adds them up per device
+        return {Path(staging): raw + output, destination: output}
+
+    def _queue_order(self) -> List[DownloadJob]:
+        """Pending jobs in the order they should start (lock held)"""
+        if self.config.get('queue_order') != "shortest":
+            return list(self._pending)
+        # Shortest known duration first; jobs not looked up yet keep FIFO order after them
+        return sorted(self._pending, key=lambda job: (job.duration is None, job.duration or 0))
+
+    def _prefetch_loop(self):
+        while True:
+            job = self._prefetch_queue.get()
+            if job is None:
+                return
+            with self._cond:
+                if job not in self._pending or job.stop_event.is_set() or self._shutdown:
+                    continue  # Already started or gone
+                job.prefetching = True
+            try:
+                self._prefetch(job)
+            finally:
+                job.prefetched.set()
+
+    def _prefetch(self, job: DownloadJob):
+        """Resolve a queued job's metadata so its download starts with it"""
+        if self._archived(job):
+            return  # The worker skips it without extracting
+        key = normalize_url(job.url)
+        # Cached metadata fills the queue even when its stream URLs are stale
+        cached = self.metadata_cache.get(key)
+        if cached is not None:
+            info, extracted_at = cached
+        else:
+            opts = {'quiet': True, 'no_warnings': True, 'noplaylist': True,
+                    'socket_timeout': int(job.config.get('socket_timeout', 15))}
+            try:
+                with self.ydl_pool.acquire(opts) as ydl:
+                    info = ydl.extract_info(job.url, download=False, process=False)
+            except Exception as e:
+                # The download extracts again and reports the error itself
+                self.logger.debug(f"Prefetch failed for {job.url}: {e}")
+                return
+            extracted_at = time.time()
+            self.metadata_cache.put(key, info)
+        job.duration, job.estimated_size = estimate_download(info)
+        job.info, job.info_time = info, extracted_at
+        job.title = info.get('title') or job.title
+        self.progress_queue.put((job.job_id, "info", {
+            'title': info.get('title', 'Unknown'),
+            'artist': info.get('artist') or info.get('uploader') or 'Unknown',
+            'duration': job.duration,
+            'estimated_size': job.estimated_size,
+            'description': info.get('description', ''),
+            'webpage_url': info.get('webpage_url', job.url),
+        }))
+
+    def _archived(self, job: DownloadJob) -> bool:
+        """Whether the worker will skip the job on the archive's URL lookup alone"""
+        return (job.config.get('skip_existing', True) and self.archive is not None and not job.handoff
+                and self.archive.contains_url(job.url))
+
+    def _take_prefetched(self, job: DownloadJob) -> Optional[Dict[str, Any]]:
+        """The job's prefetched info if still fresh, waiting for a lookup in flight"""
+        if job.prefetching:
+            while not job.prefetched.wait(0.2):
+                if job.stop_event.is_set():
+                    return None
+        info, job.info = job.info, None  # Used once; a retry extracts fresh stream URLs
+        if info is None or not streams_fresh(info, job.info_time):
+            return None
+        return info
+
+    def _worker_loop(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._run_job(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _run_job(self, job: DownloadJob):
+        with self._cond:
+            # A pause() since the job left the queue stands; resume() moves it to RUNNING
+            if job.resume_event.is_set():
+                self._set_state(job, JOB_RUNNING)
+        # Checked first so an archived job does not wait for a lookup it will not use
+        info = None if self._archived(job) else self._take_prefetched(job)
+        job.worker = DownloaderThread(
+            url=job.url,
+            config=job.config,
+            progress_queue=self.progress_queue,
+            stop_event=job.stop_event,
+            logger=self.logger,
+            job_id=job.job_id,
+            resume_event=job.resume_event,
+            archive=self.archive,
+            transcode_stage=self.transcode_stage,
+            cover_cache=self.cover_cache,
+            ydl_pool=self.ydl_pool,
+            journal=self.journal,
+            entry_id=job.entry_id,
+            handoff=job.handoff,
+            retry_policy=self.retry_policy,
+            attempt=job.attempts,
+            bandwidth=self.bandwidth,
+            info=info,
+            metadata_cache=self.metadata_cache,
+            library=self.library,
+            duplicates=self.duplicates,
+            loudness_cache=self.loudness_cache
+        )
+        job.worker.metrics.retries += job.attempts
+        job.worker.keep_files = job.keep_files  # cancel() may have run before the worker existed
+        # The worker slot already is a thread; run the download inline
+        try:
+            job.worker.run()
+        finally:
+            self._release_host(job)
+        future = job.worker.pending_transcode
+        if future is None:
+            self._release_disk(job)  # A requeued job reserves again when it restarts
+        if job.worker.state == JOB_RETRY:
+            self._requeue(job)
+            return
+        if future is None:
+            self.metrics.record(job.worker.metrics)
+            self._set_state(job, job.worker.state)
+            return
+        # The network slot is released now; the stage finishes the job
+        with self._cond:
+            self._converting += 1
+        self._set_state(job, JOB_CONVERTING)
+        future.add_done_callback(lambda done, job=job: self._finish_conversion(job, done))
+
+    def _release_host(self, job: DownloadJob):
+        """Free the job's host slot and feed its outcome to the circuit breaker"""
+        worker = job.worker
+        if worker.state == JOB_RETRY or (worker.state == JOB_ERROR and worker.transient_error):
+            success = False
+        elif worker.state in (JOB_RUNNING, JOB_DONE) or worker.pending_transcode is not None:
+            success = True  # The transfer went through
+        else:
+            success = None  # Canceled, skipped or failed for reasons unrelated to the server
+        with self._cond:
+            cooldown = self.host_gate.release(job.host, success, time.monotonic())
+            self._cond.notify_all()
+        if cooldown is not None:
+            self.logger.warning(f"Circuit open for {job.host}: pausing its downloads for {cooldown:.0f}s")
+
+    def _release_disk(self, job: DownloadJob):
+        with self._cond:
+            self.disk_budget.release(job.job_id)
+            self._cond.notify_all()
+
+    def _requeue(self, job: DownloadJob):
+        """Put a job that hit a transient error back in the queue after its backoff"""
+        job.attempts += 1
+        with self._cond:
+            # cancel() sets the event before looking in the queue, so a cancel
+            # racing with this requeue is seen here or finds the job pending
+            canceled = job.stop_event.is_set()
+            if not canceled:
+                job.not_before = time.monotonic() + job.worker.retry_delay
+                self._pending.append(job)
+                self._cond.notify_all()
+            if canceled:
+                state = JOB_CANCELED
+            else:
+                # Paused before the error: it waits in the queue until resume()
+                state = JOB_QUEUED if job.resume_event.is_set() else JOB_PAUSED
+            self._set_state(job, state)
+
+    def _finish_conversion(self, job: DownloadJob, future: Future):
+        try:
+            job.worker.finish_transcode(future)
+            self.metrics.record(job.worker.metrics)
+            self._set_state(job, job.worker.state)
+        finally:
+            with self._cond:
+                self.disk_budget.release(job.job_id)
+                self._converting -= 1
+                self._cond.notify_all()
+
+    def _set_state(self, job: DownloadJob, state: str):
+        job.state = state
+        # A job stopped by shutdown keeps its last journaled state for resuming
+        if self.journal is not None and job.entry_id is not None and not (
+                state == JOB_CANCELED and self._shutdown):
+            self.journal.set_state(job.entry_id, state)
+        self.progress_queue.put((job.job_id, "state", state))
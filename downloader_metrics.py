@@ -0,0 +1,222 @@
+"""
+downloader_metrics.py
+Metricas por descarga: duracion de cada fase, bytes, velocidad y reintentos,
+con agregados (p50/p95, MB/s, pistas/min) y un endpoint HTTP local opcional
+en formato Prometheus o JSON.
+"""
+
+import json
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List
+
+
+class JobMetrics:
+    """Timing record of a single job"""
+    def __init__(self, job_id: Optional[str], url: str):
+        self.job_id = job_id
+        self.url = url
+        self.state: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self.phases: Dict[str, float] = {}  # phase name -> seconds
+        self.bytes = 0
+        self.retries = 0
+        self.saved_bytes = 0  # Size of the file dropped or hardlinked as a duplicate
+        self._open: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block of code as ``name``"""
+        self.start_phase(name)
+        try:
+            yield
+        finally:
+            self.end_phase(name)
+
+    def start_phase(self, name: str):
+        self._open[name] = time.monotonic()
+
+    def seen(self, name: str) -> bool:
+        """True once ``name`` has been started (open or finished)"""
+        return name in self._open or name in self.phases
+
+    def end_phase(self, name: str):
+        started = self._open.pop(name, None)
+        if started is not None:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - started
+
+    def finish(self, state: str):
+        """Close any phase still open and stamp the end time"""
+        for name in list(self._open):
+            self.end_phase(name)
+        self.state = state
+        self.finished = time.time()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def speed(self) -> float:
+        """Average transfer speed in bytes/s during the download phase"""
+        seconds = self.phases.get("download", 0.0)
+        return self.bytes / seconds if seconds > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "url": self.url,
+            "state": self.state,
+            "started": round(self.started, 3),
+            "duration": round(self.duration, 3),
+            "bytes": self.bytes,
+            "speed": round(self.speed, 1),
+            "retries": self.retries,
+            "saved_bytes": self.saved_bytes,
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class MetricsRegistry:
+    """Thread-safe store of finished job records and their aggregates"""
+    def __init__(self, history: int = 10000):
+        self._lock = threading.Lock()
+        self._jobs = deque(maxlen=history)
+        self.counts: Dict[str, int] = {}  # final state -> jobs (never trimmed)
+        self.total_bytes = 0
+
+    def record(self, metrics: JobMetrics):
+        with self._lock:
+            self._jobs.append(metrics)
+            self.counts[metrics.state] = self.counts.get(metrics.state, 0) + 1
+            self.total_bytes += metrics.bytes
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Latest job records, newest first"""
+        with self._lock:
+            jobs = list(self._jobs)[-limit:]
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def summary(self) -> Dict[str, Any]:
+        """Phase latencies (p50/p95) and throughput over the kept history"""
+        with self._lock:
+            jobs = list(self._jobs)
+            counts = dict(self.counts)
+            total_bytes = self.total_bytes
+
+        phases: Dict[str, List[float]] = {}
+        for job in jobs:
+            for name, seconds in job.phases.items():
+                phases.setdefault(name, []).append(seconds)
+            phases.setdefault("total", []).append(job.duration)
+
+        done = [job for job in jobs if job.state == "done"]
+        window = 0.0
+        if jobs:
+            window = max(job.finished or job.started for job in jobs) - min(job.started for job in jobs)
+        window_bytes = sum(job.bytes for job in jobs)
+        transfer_seconds = sum(job.phases.get("download", 0.0) for job in jobs)
+
+        return {
+            "jobs": sum(counts.values()),
+            "states": counts,
+            "bytes": total_bytes,
+            "retries": sum(job.retries for job in jobs),
+            "duplicates": sum(1 for job in jobs if job.saved_bytes),
+            "saved_bytes": sum(job.saved_bytes for job in jobs),
+            "throughput_mbps": round(window_bytes / window / 1e6, 3) if window > 0 else 0.0,
+            "transfer_mbps": round(window_bytes / transfer_seconds / 1e6, 3) if transfer_seconds > 0 else 0.0,
+            "tracks_per_min": round(len(done) / window * 60.0, 2) if window > 0 else 0.0,
+            "phases": {
+                name: {
+                    "count": len(values),
+                    "p50": round(percentile(values, 50), 3),
+                    "p95": round(percentile(values, 95), 3),
+                }
+                for name, values in sorted(phases.items())
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        """Summary in the Prometheus text exposition format"""
+        summary = self.summary()
+        lines = [
+            "# TYPE downloader_jobs_total counter",
+            *[f'downloader_jobs_total{{state="{state}"}} {count}' for state, count in summary["states"].items()],
+            "# TYPE downloader_bytes_total counter",
+            f"downloader_bytes_total {summary['bytes']}",
+            "# TYPE downloader_retries_total counter",
+            f"downloader_retries_total {summary['retries']}",
+            "# TYPE downloader_duplicates_total counter",
+            f"downloader_duplicates_total {summary['duplicates']}",
+            "# TYPE downloader_saved_bytes_total counter",
+            f"downloader_saved_bytes_total {summary['saved_bytes']}",
+            "# TYPE downloader_throughput_mbps gauge",
+            f"downloader_throughput_mbps {summary['throughput_mbps']}",
+            "# TYPE downloader_tracks_per_minute gauge",
+            f"downloader_tracks_per_minute {summary['tracks_per_min']}",
+            "# TYPE downloader_phase_seconds summary",
+        ]
+        for name, stats in summary["phases"].items():
+            lines.append(f'downloader_phase_seconds{{phase="{name}",quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'downloader_phase_seconds{{phase="{name}",quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'downloader_phase_seconds_count{{phase="{name}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Local HTTP endpoint: ``/metrics`` (Prometheus text) and ``/metrics.json``"""
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+        # Imported here: only needed when the endpoint is enabled, and it costs ~40 ms at startup
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        self.registry = registry
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') == "/metrics":
+                    body = registry_ref.to_prometheus().encode('utf-8')
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path.rstrip('/') == "/metrics.json":
+                    data = {"summary": registry_ref.summary(), "recent": registry_ref.recent()}
+                    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
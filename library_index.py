@@ -0,0 +1,236 @@
+"""
+library_index.py
+Indice local de la biblioteca descargada (SQLite con busqueda de texto
+completo FTS5). Cada descarga completada se anade al momento; el reescaneo
+de una carpeta solo vuelve a leer los archivos cuya fecha de modificacion o
+tamano cambiaron.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".flac", ".wav", ".opus", ".ogg", ".aac")
+HASH_CHUNK = 1024 * 1024
+COLUMNS = ("path", "title", "artist", "duration", "webpage_url", "format", "bitrate", "size", "mtime",
+           "hash", "added")
+
+
+def file_hash(path: Path) -> str:
+    """sha256 of a file, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_tags(path: Path) -> Dict[str, Any]:
+    """Container tags plus duration and bitrate of an audio file (via ffprobe)"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", str(path)],
+            capture_output=True, text=True, timeout=30
+        )
+        fmt = json.loads(result.stdout or "{}").get("format", {})
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return {}
+    tags = {k.lower(): v for k, v in fmt.get("tags", {}).items()}
+    tags["duration"] = fmt.get("duration")
+    tags["bit_rate"] = fmt.get("bit_rate")
+    return tags
+
+
+def source_url(tags: Dict[str, Any]) -> Optional[str]:
+    """Source page URL stored in the tags (``purl``/``comment`` as written on conversion)"""
+    for name in ("purl", "comment", "url", "website"):
+        value = (tags.get(name) or "").strip()
+        if value.startswith(("http://", "https://")):
+            return value
+    return None
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class LibraryIndex:
+    """Searchable index of downloaded tracks.
+
+    Uses an FTS5 table over title, artist and path when SQLite provides it
+    and falls back to LIKE queries otherwise.
+    """
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                title TEXT,
+                artist TEXT,
+                duration REAL,
+                webpage_url TEXT,
+                format TEXT,
+                bitrate INTEGER,
+                size INTEGER,
+                mtime REAL,
+                hash TEXT,
+                added REAL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_added ON tracks(added);
+        """)
+        try:
+            self._conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+                    title, artist, path, content='tracks', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+                    INSERT INTO tracks_fts(rowid, title, artist, path)
+                    VALUES (new.id, new.title, new.artist, new.path);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+                    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist, path)
+                    VALUES ('delete', old.id, old.title, old.artist, old.path);
+                END;
+                CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE ON tracks BEGIN
+                    INSERT INTO tracks_fts(tracks_fts, rowid, title, artist, path)
+                    VALUES ('delete', old.id, old.title, old.artist, old.path);
+                    INSERT INTO tracks_fts(rowid, title, artist, path)
+                    VALUES (new.id, new.title, new.artist, new.path);
+                END;
+            """)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search with LIKE instead
+            self.fts = False
+        self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def add(self, path: Path, info: Dict[str, Any], audio_format: Optional[str] = None,
+            bitrate: Optional[int] = None, digest: Optional[str] = None):
+        """Index a finished download (called as each job completes); ``digest`` skips re-hashing"""
+        stat = path.stat()
+        self._upsert({
+            "path": str(path.resolve()),
+            "title": info.get('title'),
+            "artist": info.get('artist'),
+            "duration": info.get('duration'),
+            "webpage_url": info.get('webpage_url'),
+            "format": audio_format or path.suffix[1:].lower(),
+            "bitrate": bitrate,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": digest or file_hash(path),
+        })
+
+    def rescan(self, folder: str) -> Tuple[int, int, int]:
+        """Bring the index in line with a folder; returns (added, updated, removed).
+
+        Only files whose mtime or size differ from the index are hashed and
+        probed again; the rest cost a single ``stat`` from the directory walk.
+        """
+        root = str(Path(folder).resolve())
+        prefix = root.rstrip(os.sep) + os.sep
+        with self._lock:
+            known = {row["path"]: (row["mtime"], row["size"]) for row in self._conn.execute(
+                "SELECT path, mtime, size FROM tracks WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+        added = updated = 0
+        seen = set()
+        for entry in self._walk(root):
+            seen.add(entry.path)
+            stat = entry.stat()
+            if known.get(entry.path) == (stat.st_mtime, stat.st_size):
+                continue
+            path = Path(entry.path)
+            tags = read_tags(path)
+            self._upsert({
+                "path": entry.path,
+                "title": tags.get("title") or path.stem,
+                "artist": tags.get("artist") or tags.get("album_artist"),
+                "duration": float(tags["duration"]) if tags.get("duration") else None,
+                "webpage_url": source_url(tags),
+                "format": path.suffix[1:].lower(),
+                "bitrate": int(tags["bit_rate"]) // 1000 if tags.get("bit_rate") else None,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "hash": file_hash(path),
+            })
+            if entry.path in known:
+                updated += 1
+            else:
+                added += 1
+        missing = [path for path in known if path not in seen]
+        with self._lock:
+            self._conn.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path in missing])
+            self._conn.commit()
+        return added, updated, len(missing)
+
+    def search(self, text: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """Tracks matching every word of ``text``, most recently indexed first.
+
+        The row id follows the order tracks were first indexed (an upsert
+        keeps it, like ``added``), so every branch reads newest first from
+        the primary key or the FTS doclist and stops at ``limit`` instead of
+        sorting all the matches.
+        """
+        columns = ", ".join(f"tracks.{column}" for column in COLUMNS)
+        query = fts_query(text)
+        with self._lock:
+            if not query:
+                rows = self._conn.execute(f"SELECT {columns} FROM tracks ORDER BY id DESC LIMIT ?",
+                                         (limit,))
+            elif self.fts:
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM tracks_fts JOIN tracks ON tracks.id = tracks_fts.rowid "
+                    f"WHERE tracks_fts MATCH ? ORDER BY tracks_fts.rowid DESC LIMIT ?", (query, limit))
+            else:
+                words = re.findall(r"\w+", text, flags=re.UNICODE)
+                where = " AND ".join("(title LIKE ? OR artist LIKE ? OR path LIKE ?)" for _ in words)
+                params = [f"%{word}%" for word in words for _ in range(3)]
+                rows = self._conn.execute(f"SELECT {columns} FROM tracks WHERE {where} "
+                                          f"ORDER BY id DESC LIMIT ?", params + [limit])
+            return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _upsert(self, record: Dict[str, Any]):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS if column not in ("path", "added"))
+        with self._lock:
+            # Stamped under the lock so ``added`` grows with the row id
+            record = {**record, "added": time.time()}
+            self._conn.execute(
+                f"INSERT INTO tracks ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}", [record[column] for column in COLUMNS])
+            self._conn.commit()
+
+    def _walk(self, folder: str):
+        """Audio files under ``folder`` as ``os.DirEntry`` (stat comes with the listing on most systems)"""
+        stack = [folder]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and ".temp." not in entry.name:
+                            yield entry
+            except OSError:
+                continue
@@ -0,0 +1,198 @@
+"""
+loudness.py
+Medicion de sonoridad EBU R128 / ITU-R BS.1770 en una sola pasada: FFmpeg
+aplica el filtro de ponderacion K y entrega PCM en bloques; NumPy calcula la
+energia por bloque y el doble umbral (absoluto y relativo) con un histograma
+de tamano fijo, asi que la memoria no depende de la duracion. Los resultados
+se guardan en cache para no volver a analizar una pista ya medida.
+"""
+
+import math
+import time
+import shutil
+import sqlite3
+import threading
+import subprocess
+from pathlib import Path
+from typing import Optional, Dict, Tuple
+
+from child_processes import tracked
+
+np = None  # Imported on first use by the loudness stage: it would add ~80 ms to every startup
+
+RATE = 48000  # BS.1770 filter coefficients are defined at 48 kHz
+SUB_BLOCK = RATE // 10  # 100 ms; gating blocks are 4 of them (400 ms, 75% overlap)
+SUB_BLOCKS_PER_READ = 10
+# K-weighting: high shelf followed by the RLB high-pass (ITU-R BS.1770-4)
+K_WEIGHTING = (
+    "biquad=b0=1.53512485958697:b1=-2.69169618940638:b2=1.19839281085285"
+    ":a0=1:a1=-1.69065929318241:a2=0.73248077421585,"
+    "biquad=b0=1:b1=-2:b2=1:a0=1:a1=-1.99004745483398:a2=0.99007225036621"
+)
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the absolute-gated loudness
+HISTOGRAM_MAX = 5.0  # LUFS; louder blocks land in the top bin
+HISTOGRAM_STEP = 0.01  # LU per bin
+REPLAYGAIN_REFERENCE = -18.0  # LUFS (ReplayGain 2.0)
+PEAK_CEILING = -1.0  # dBFS a normalized track may reach
+
+
+def _load_numpy() -> bool:
+    """Import NumPy the first time it is needed; False if it is not installed"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # Without NumPy the loudness stage is skipped
+            return False
+        np = numpy
+    return True
+
+
+def _block_loudness(energy):
+    return -0.691 + 10.0 * np.log10(np.maximum(energy, 1e-20))
+
+
+def _gated_loudness(histogram) -> Optional[float]:
+    """Integrated loudness from the histogram of block loudness (both gates)"""
+    centers = ABSOLUTE_GATE + (np.arange(len(histogram)) + 0.5) * HISTOGRAM_STEP
+    energies = 10.0 ** ((centers + 0.691) / 10.0)
+    if not histogram.sum():
+        return None
+    gate = _block_loudness((histogram * energies).sum() / histogram.sum()) + RELATIVE_GATE
+    kept = histogram * (centers >= gate)
+    if not kept.sum():
+        return None
+    return float(_block_loudness((kept * energies).sum() / kept.sum()))
+
+
+def _wav_channels(stream) -> Optional[int]:
+    """Channel count from the header of a WAV stream"""
+    header = stream.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    while True:
+        chunk = stream.read(8)
+        if len(chunk) < 8:
+            return None
+        kind, size = chunk[:4], int.from_bytes(chunk[4:], "little")
+        body = stream.read(size + (size & 1)) if kind != b"data" else b""
+        if kind == b"fmt ":
+            return int.from_bytes(body[2:4], "little")
+        if kind == b"data":
+            return None
+
+
+def source_channels(path: Path, ffmpeg: str = "ffmpeg", owner: Optional[str] = None) -> Optional[int]:
+    """Channels of the first audio stream, from the header of a short WAV decode"""
+    with tracked([ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", str(path), "-map", "0:a:0",
+                  "-t", "0.1", "-f", "wav", "-"], owner=owner,
+                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        channels = _wav_channels(process.stdout)
+        process.stdout.close()
+        process.wait()
+    return channels
+
+
+def measure(path: Path, stop_event: Optional[threading.Event] = None,
+            owner: Optional[str] = None) -> Optional[Tuple[float, float]]:
+    """Integrated loudness (LUFS) and sample peak (linear) of an audio file.
+
+    One FFmpeg decode produces the signal for the peak and its K-weighted
+    copy for the loudness, side by side. Mono is measured as one channel:
+    an upmix would change its peak, and its loudness would depend on the
+    resampler's center mix level. Other layouts are downmixed to stereo.
+    Returns None without FFmpeg or NumPy, for silent or too short tracks,
+    and when canceled.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg or not _load_numpy():
+        return None
+    # FFmpeg settles a list of layouts on its first entry, so the layout is chosen here
+    channels = 1 if source_channels(path, ffmpeg, owner) == 1 else 2
+    layout = "mono" if channels == 1 else "stereo"
+    graph = (f"[0:a:0]aresample={RATE},aformat=sample_fmts=flt:channel_layouts={layout},asplit[raw][k];"
+             f"[k]{K_WEIGHTING}[weighted];[raw][weighted]amerge=inputs=2")
+    bins = int((HISTOGRAM_MAX - ABSOLUTE_GATE) / HISTOGRAM_STEP)
+    histogram = np.zeros(bins, dtype=np.int64)
+    recent = np.zeros(0)  # Energies of the last 3 sub-blocks, shared with the next read
+    leftover = np.zeros((0, channels * 2), dtype=np.float32)
+    peak = 0.0
+    frame_bytes = channels * 2 * 4
+    # Registered under the job, so a cancel kills the decoder and ends the read loop
+    with tracked([ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", str(path),
+                  "-filter_complex", graph, "-f", "f32le", "-"], owner=owner,
+                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        for chunk in iter(lambda: process.stdout.read(SUB_BLOCK * SUB_BLOCKS_PER_READ * frame_bytes), b""):
+            if stop_event is not None and stop_event.is_set():
+                return None
+            samples = np.frombuffer(chunk[:len(chunk) // frame_bytes * frame_bytes],
+                                    dtype="<f4").reshape(-1, channels * 2)
+            peak = max(peak, float(np.abs(samples[:, :channels]).max(initial=0.0)))
+            samples = np.concatenate([leftover, samples])
+            whole = len(samples) // SUB_BLOCK * SUB_BLOCK
+            leftover = samples[whole:]
+            if not whole:
+                continue
+            weighted = samples[:whole, channels:].astype(np.float64).reshape(-1, SUB_BLOCK, channels)
+            energies = np.concatenate([recent, (weighted ** 2).mean(axis=1).sum(axis=1)])
+            if len(energies) >= 4:
+                blocks = np.convolve(energies, np.ones(4) / 4, mode="valid")
+                loudness = _block_loudness(blocks)
+                loudness = loudness[loudness >= ABSOLUTE_GATE]
+                index = np.minimum(((loudness - ABSOLUTE_GATE) / HISTOGRAM_STEP).astype(int), bins - 1)
+                histogram += np.bincount(index, minlength=bins)
+            recent = energies[-3:]
+        process.stdout.close()
+        process.wait()
+    if process.returncode != 0 or (stop_event is not None and stop_event.is_set()):
+        return None
+    integrated = _gated_loudness(histogram)
+    return (integrated, peak) if integrated is not None else None
+
+
+def replaygain_tags(loudness: float, peak: float) -> Dict[str, str]:
+    """ReplayGain 2.0 track tags for a measured track"""
+    return {
+        "replaygain_track_gain": f"{REPLAYGAIN_REFERENCE - loudness:+.2f} dB",
+        "replaygain_track_peak": f"{peak:.6f}",
+    }
+
+
+def normalization_gain(loudness: float, peak: float, target: float) -> float:
+    """dB to apply so the track reaches ``target`` LUFS without its peak passing the ceiling"""
+    gain = target - loudness
+    if peak > 0:
+        gain = min(gain, PEAK_CEILING - 20.0 * math.log10(peak))
+    return gain
+
+
+class LoudnessCache:
+    """SQLite store of measurements by track key (extractor and id, or file hash)"""
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS loudness (
+                key TEXT PRIMARY KEY,
+                integrated REAL NOT NULL,
+                peak REAL NOT NULL,
+                measured REAL NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            row = self._conn.execute("SELECT integrated, peak FROM loudness WHERE key = ?", (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def put(self, key: str, integrated: float, peak: float):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?)",
+                               (key, integrated, peak, time.time()))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
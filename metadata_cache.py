@@ -0,0 +1,135 @@
+"""
+metadata_cache.py
+Cache en disco de los resultados de extraccion (extract_info) por URL
+normalizada. Los metadatos se reutilizan durante dias; los enlaces de audio,
+que caducan, solo mientras siguen siendo validos. Se descartan las entradas
+menos usadas al superar el limite de tamano.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from urllib.parse import urlsplit, parse_qsl
+from typing import Optional, Dict, Any, Tuple
+
+EXPIRY_PARAMS = ("expires", "expire", "exp", "x-amz-expires-at")  # Query params holding a unix time
+STREAM_TTL = 600  # Seconds stream URLs are trusted when they carry no expiry of their own
+EXPIRY_MARGIN = 60  # Do not start a download on a URL about to expire
+
+
+def _is_plain(value: Any) -> bool:
+    """True if the value survives a JSON round trip unchanged (no callables or custom objects)"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_plain(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return all(_is_plain(item) for item in value)
+    return False
+
+
+def cacheable(info: Dict[str, Any]) -> bool:
+    """Only single tracks whose info dict is plain data can be replayed from the cache"""
+    return info.get('_type', 'video') == 'video' and _is_plain(info)
+
+
+def stream_expiry(info: Dict[str, Any], extracted_at: float) -> float:
+    """Unix time at which the info dict's stream URLs stop working.
+
+    Signed CDN URLs carry their expiry in the query string; the earliest
+    one wins. Without any, the streams are trusted for ``STREAM_TTL``.
+    """
+    expiries = []
+    for fmt in (info.get('formats') or []) + [info]:
+        url = fmt.get('url')
+        if not url:
+            continue
+        for key, value in parse_qsl(urlsplit(url).query):
+            if key.lower() in EXPIRY_PARAMS and value.isdigit() and int(value) > 1_000_000_000:
+                expiries.append(int(value))
+    return min(expiries) if expiries else extracted_at + STREAM_TTL
+
+
+def streams_fresh(info: Dict[str, Any], extracted_at: float) -> bool:
+    """True if a download can still use the stream URLs in ``info``"""
+    return time.time() < stream_expiry(info, extracted_at) - EXPIRY_MARGIN
+
+
+class MetadataCache:
+    """SQLite store of extraction results with a TTL and LRU eviction.
+
+    ``get`` returns a fresh copy of the info dict and the time it was
+    extracted, so callers can mutate it (``process_ie_result`` does) and
+    decide whether its stream URLs are still usable.
+    """
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                extracted_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._conn.execute("DELETE FROM info WHERE extracted_at < ?", (time.time() - ttl,))
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Cached info dict and its extraction time, or None if missing or past the TTL"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT data, extracted_at FROM info WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now - self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE info SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, info: Dict[str, Any]) -> bool:
+        """Store a fresh extraction result; False if it cannot be cached"""
+        if not cacheable(info):
+            return False
+        data = json.dumps(info, ensure_ascii=False, separators=(',', ':'))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM info WHERE key = ?", (key,)).fetchone()
+            self.total_bytes += len(data) - (old[0] if old else 0)
+            self._conn.execute("INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?)",
+                               (key, data, len(data), now, now))
+            self._evict()
+            self._conn.commit()
+        return True
+
+    def invalidate(self, key: str):
+        """Drop an entry whose stream URLs turned out to be dead"""
+        with self._lock:
+            row = self._conn.execute("SELECT size FROM info WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.total_bytes -= row[0]
+                self._conn.execute("DELETE FROM info WHERE key = ?", (key,))
+                self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        """Drop least recently used entries until under the cap (lock held)"""
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT key, size FROM info ORDER BY last_used LIMIT 2").fetchall()
+            if len(rows) < 2:
+                break  # Keep at least the entry just stored
+            key, size = rows[0]
+            self._conn.execute("DELETE FROM info WHERE key = ?", (key,))
+            self.total_bytes -= size
@@ -0,0 +1,178 @@
+"""
+retry_policy.py
+Politica de reintentos del planificador: espera exponencial con jitter,
+respeto de Retry-After, limite de descargas simultaneas por servidor y un
+cortacircuitos por servidor que deja de enviar trabajos a un host que falla
+repetidamente hasta que pasa un tiempo de enfriamiento.
+"""
+
+import re
+import time
+import random
+import socket
+from typing import Optional, Dict, Any, Tuple
+
+RETRYABLE_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# Fallback for errors that only carry the status in their message
+STATUS_PATTERN = re.compile(r"HTTP Error (\d{3})")
+TRANSIENT_MESSAGES = ("timed out", "connection reset", "connection refused", "connection aborted",
+                      "temporary failure in name resolution", "remote end closed", "incompleteread")
+
+
+def _error_chain(error: BaseException):
+    """The error and every exception wrapped inside it (yt-dlp nests them)"""
+    seen = set()
+    pending = [error]
+    while pending:
+        current = pending.pop()
+        if current is None or id(current) in seen:
+            continue
+        seen.add(id(current))
+        yield current
+        exc_info = getattr(current, "exc_info", None)
+        if isinstance(exc_info, tuple) and len(exc_info) > 1:
+            pending.append(exc_info[1])
+        pending += [getattr(current, "cause", None), current.__cause__, current.__context__]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    import email.utils  # Deferred: rarely needed, and slow to import
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def classify_error(error: BaseException) -> Tuple[bool, Optional[float], str]:
+    """Whether ``error`` is transient, the server's Retry-After, and a short reason"""
+    for current in _error_chain(error):
+        status = getattr(current, "status", None) or getattr(current, "code", None)
+        if isinstance(status, int) and 100 <= status < 600:
+            response = getattr(current, "response", None)
+            headers = getattr(response, "headers", None) or getattr(current, "headers", None) or {}
+            retry_after = parse_retry_after(headers.get("Retry-After")) if hasattr(headers, "get") else None
+            return status in RETRYABLE_STATUS, retry_after, f"HTTP {status}"
+        if isinstance(current, (socket.timeout, TimeoutError)):
+            return True, None, "timeout"
+        if isinstance(current, ConnectionError):
+            return True, None, "conexion"
+
+    message = str(error)
+    match = STATUS_PATTERN.search(message)
+    if match:
+        status = int(match.group(1))
+        return status in RETRYABLE_STATUS, None, f"HTTP {status}"
+    lowered = message.lower()
+    if any(text in lowered for text in TRANSIENT_MESSAGES):
+        return True, None, "red"
+    return False, None, type(error).__name__
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter for whole-job retries.
+
+    Job attempt ``n`` (0-based) waits a random time between half and all of
+    ``base_delay * 2**n`` (capped at ``max_delay``), so jobs that failed
+    together do not come back in lockstep. A Retry-After sent by the server
+    takes precedence.
+    """
+    def __init__(self, max_attempts: int = 5, base_delay: float = 2.0, max_delay: float = 300.0):
+        self.max_attempts = max_attempts  # Requeues before the job is reported as failed
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number ``attempt`` (0-based)"""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def decide(self, error: BaseException, attempt: int) -> Tuple[Optional[float], str]:
+        """Delay before requeueing after ``error`` (None: report the failure) and the reason"""
+        transient, retry_after, reason = classify_error(error)
+        if not transient or attempt >= self.max_attempts:
+            return None, reason
+        return self.backoff(attempt, retry_after), reason
+
+    def ydl_sleep(self, n: int) -> float:
+        """Sleep between yt-dlp's own in-request retries (``retry_sleep_functions``)"""
+        ceiling = min(30.0, self.base_delay * (2 ** n))
+        return random.uniform(ceiling / 2, ceiling)
+
+
+class HostGate:
+    """Per-host concurrency limit and circuit breaker.
+
+    After ``failure_threshold`` consecutive transient failures a host is
+    blocked for ``cooldown`` seconds (doubling on every re-open, up to
+    ``max_cooldown``). Once the cooldown ends a single trial job is let
+    through; its success closes the circuit again. Callers serialize
+    access (the scheduler holds its lock).
+    """
+    def __init__(self, limit: int, failure_threshold: int = 5, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0):
+        self.limit = max(1, limit)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._running: Dict[str, int] = {}
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._open_cooldown: Dict[str, float] = {}
+        self._trial: Dict[str, bool] = {}  # Half-open host with its trial job running
+
+    def blocked_until(self, host: str, now: float) -> float:
+        """Monotonic time until which the host's circuit is open (0 if closed)"""
+        until = self._open_until.get(host, 0.0)
+        return until if until > now else 0.0
+
+    def available(self, host: str, now: float) -> bool:
+        """True if one more job may start against ``host`` now"""
+        if self.blocked_until(host, now):
+            return False
+        if host in self._open_until:
+            return not self._trial.get(host)  # Half-open: one trial at a time
+        return self._running.get(host, 0) < self.limit
+
+    def acquire(self, host: str):
+        self._running[host] = self._running.get(host, 0) + 1
+        if host in self._open_until:
+            self._trial[host] = True
+
+    def release(self, host: str, success: Optional[bool], now: float) -> Optional[float]:
+        """Record a job's outcome (None: unrelated to host health); the cooldown if the circuit opened"""
+        self._running[host] = max(0, self._running.get(host, 0) - 1)
+        trial = self._trial.pop(host, False)
+        if success is None:
+            return None
+        if success:
+            self._failures.pop(host, None)
+            self._open_until.pop(host, None)
+            self._open_cooldown.pop(host, None)
+            return None
+        if host in self._open_until and not trial:
+            return None  # Started before the circuit opened; already accounted for
+        failures = self._failures.get(host, 0) + 1
+        self._failures[host] = failures
+        if trial or failures >= self.failure_threshold:
+            cooldown = min(self.max_cooldown, self._open_cooldown.get(host, self.cooldown / 2) * 2)
+            self._open_cooldown[host] = cooldown
+            self._open_until[host] = now + cooldown
+            return cooldown
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        """Snapshot of running jobs and open circuits per host"""
+        now = time.monotonic()
+        return {
+            "running": {host: count for host, count in self._running.items() if count},
+            "open": {host: round(until - now, 1) for host, until in self._open_until.items() if until > now},
+        }
@@ -0,0 +1,79 @@
+import sys
+import time
+import queue
+import shutil
+import logging
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tests.stand_in import StandIn, make_track  # noqa: E402
+from downloader_engine import ConfigManager, DownloadScheduler, FINISHED_STATES  # noqa: E402
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="FFmpeg no encontrado")
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """The engine keeps its databases in the working directory: one per test"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def media_server(tmp_path_factory):
+    """Local platform serving a short track, a minute-long track and a long uncompressed one"""
+    if shutil.which("ffmpeg") is None:
+        pytest.skip("FFmpeg no encontrado")
+    root = tmp_path_factory.mktemp("media")
+    make_track(root / "track.mp3", 20, args=["-b:a", "128k"])
+    make_track(root / "minute.mp3", 60, frequency=660, args=["-b:a", "128k"])
+    # Cheap to generate, slow to encode: keeps a conversion busy for seconds
+    make_track(root / "long.wav", 600)
+    server = StandIn(root)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def stand_in(media_server):
+    """The shared media server, without the faults and counts of earlier tests"""
+    media_server.reset()
+    return media_server
+
+
+@pytest.fixture
+def make_scheduler(tmp_path):
+    """Factory for started schedulers writing to ``tmp_path/out``; shut down after the test"""
+    schedulers = []
+
+    def make(**overrides) -> DownloadScheduler:
+        config = ConfigManager().default_config.copy()
+        config.update(output_dir=str(tmp_path / "out"), skip_existing=False, prefetch_workers=0,
+                      save_cover_art=False)
+        config.update(overrides)
+        scheduler = DownloadScheduler(config, queue.Queue(), logging.getLogger("tests"))
+        scheduler.start()
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown(timeout=5.0)
+
+
+def wait_for(predicate, timeout: float = 30.0, interval: float = 0.005) -> float:
+    """Poll until ``predicate()`` is true; returns the seconds it took (fails the test on timeout)"""
+    start = time.monotonic()
+    while not predicate():
+        if time.monotonic() - start > timeout:
+            pytest.fail(f"Timed out after {timeout}s")
+        time.sleep(interval)
+    return time.monotonic() - start
+
+
+def wait_finished(scheduler: DownloadScheduler, job_id: str, timeout: float = 60.0) -> str:
+    wait_for(lambda: scheduler.jobs[job_id].state in FINISHED_STATES, timeout)
+    return scheduler.jobs[job_id].state
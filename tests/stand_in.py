@@ -0,0 +1,100 @@
+"""
+stand_in.py
+Servidor HTTP local que hace de plataforma en las pruebas y los benchmarks:
+sirve pistas generadas con FFmpeg (yt-dlp las descarga con su extractor
+generico) y puede inyectar fallos por ruta (codigos HTTP con Retry-After o
+conexiones colgadas).
+"""
+
+import sys
+import time
+import shutil
+import threading
+import subprocess
+import http.server
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Dict, List
+
+
+def make_track(path: Path, seconds: float, frequency: float = 440.0, rate: int = 44100,
+               channels: int = 2, args: Optional[List[str]] = None) -> Path:
+    """Encode a test tone with FFmpeg; the codec follows the file extension unless ``args`` says otherwise"""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("FFmpeg no encontrado")
+    # A tone with a slow tremolo, so fingerprints and loudness gates have some texture
+    source = f"sine=frequency={frequency}:sample_rate={rate}:duration={seconds}"
+    subprocess.run([ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i", source,
+                    "-af", "tremolo=f=2:d=0.6", "-ac", str(channels), *(args or []), str(path)], check=True)
+    return path
+
+
+class StandIn:
+    """Threaded HTTP server over ``root`` with per-path fault injection"""
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.hits: Counter = Counter()  # Requests per path
+        self._fails: Dict[str, list] = {}  # path -> [status or "hang", remaining, retry_after]
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, as a real platform
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=str(stand_in.root), **kwargs)
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fault = stand_in._take_fault(self.path)
+                if fault is None:
+                    return super().do_GET()
+                status, retry_after = fault
+                if status == "hang":
+                    time.sleep(30)
+                    return
+                self.send_response(status)
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        class Server(http.server.ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)  # Clients hanging up early are normal
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/{name}"
+
+    def fail(self, name: str, status, count: int = 1, retry_after: Optional[float] = None):
+        """Answer the next ``count`` requests for ``name`` with ``status`` ("hang" never answers)"""
+        with self._lock:
+            self._fails[f"/{name}"] = [status, count, retry_after]
+
+    def _take_fault(self, path: str):
+        with self._lock:
+            self.hits[path] += 1
+            fault = self._fails.get(path)
+            if not fault or fault[1] <= 0:
+                return None
+            fault[1] -= 1
+            return fault[0], fault[2]
+
+    def reset(self):
+        """Forget the injected faults and request counts"""
+        with self._lock:
+            self._fails.clear()
+            self.hits.clear()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,35 @@
+import bandwidth_limiter
+from bandwidth_limiter import THROUGHPUT_WINDOW, BandwidthLimiter
+
+
+class FakeClock:
+    """Stands in for the ``time`` module inside bandwidth_limiter"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_samples_stay_within_the_throughput_window(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(bandwidth_limiter, "time", clock)
+    limiter = BandwidthLimiter()  # Unlimited: consume never sleeps
+    for _ in range(200_000):
+        clock.now += 0.001
+        limiter.consume("job-1", 1024)
+
+    # Only the last window's samples are kept, although throughput() was never called
+    assert len(limiter._samples) <= THROUGHPUT_WINDOW / 0.001 + 1
+    assert limiter.throughput() == len(limiter._samples) * 1024 / THROUGHPUT_WINDOW
+
+
+def test_budget_is_split_across_active_transfers():
+    limiter = BandwidthLimiter(limit=300_000, per_job=120_000)
+    first = limiter.open("job-1")
+    assert first.rate == 120_000  # Alone, capped by the per-job limit
+    second = limiter.open("job-2")
+    third = limiter.open("job-3")
+    assert first.rate == second.rate == third.rate == 100_000
+    limiter.close("job-3")
+    assert first.rate == 120_000
@@ -0,0 +1,76 @@
+import threading
+
+import child_processes
+from downloader_engine import JOB_CANCELED, JOB_CONVERTING, JOB_DONE, JOB_RUNNING
+from tests.conftest import wait_finished, wait_for
+
+CANCEL_BOUND = 0.5  # Seconds from cancel() to the canceled state, in every phase
+
+
+def cancel_latency(scheduler, job_id) -> float:
+    scheduler.cancel(job_id)
+    return wait_for(lambda: scheduler.jobs[job_id].state == JOB_CANCELED, timeout=10)
+
+
+def test_cancel_while_waiting_for_prefetch_skips_extraction(stand_in, make_scheduler):
+    stand_in.fail("track.mp3", "hang", count=1)
+    scheduler = make_scheduler(prefetch_workers=1)
+    job_id = scheduler.submit(stand_in.url("track.mp3"))
+    scheduler.pause(job_id)  # Held back until the prefetch is stuck on the hanging request
+    wait_for(lambda: stand_in.hits["/track.mp3"] == 1)
+    scheduler.resume(job_id)
+    wait_for(lambda: scheduler.jobs[job_id].state == JOB_RUNNING)
+
+    assert cancel_latency(scheduler, job_id) < CANCEL_BOUND
+    assert stand_in.hits["/track.mp3"] == 1  # The canceled job did not extract on its own
+
+
+def test_cancel_throttled_transfer(stand_in, make_scheduler, tmp_path):
+    scheduler = make_scheduler(job_bandwidth_limit_kb=32)
+    job_id = scheduler.submit(stand_in.url("minute.mp3"))
+    wait_for(lambda: scheduler.jobs[job_id].worker is not None and scheduler.jobs[job_id].worker.downloaded > 0)
+
+    assert cancel_latency(scheduler, job_id) < CANCEL_BOUND
+    assert not list((tmp_path / "out").iterdir())  # .part and .ytdl removed
+
+
+def test_cancel_during_conversion_kills_ffmpeg(stand_in, make_scheduler, tmp_path):
+    scheduler = make_scheduler(format="mp3", bitrate="320")
+    job_id = scheduler.submit(stand_in.url("long.wav"))
+    wait_for(lambda: scheduler.jobs[job_id].state == JOB_CONVERTING)
+    wait_for(lambda: bool(child_processes._processes))  # FFmpeg is running
+
+    assert cancel_latency(scheduler, job_id) < CANCEL_BOUND
+    wait_for(lambda: not child_processes._processes, timeout=1)
+    assert not list((tmp_path / "out").iterdir())  # Raw stream and FFmpeg temp removed
+
+
+def test_cancel_during_loudness_measurement(stand_in, make_scheduler):
+    scheduler = make_scheduler(format="flac", loudness_mode="normalize")
+    job_id = scheduler.submit(stand_in.url("long.wav"))
+    wait_for(lambda: scheduler.jobs[job_id].worker is not None
+             and scheduler.jobs[job_id].worker.metrics.seen("loudness"))
+
+    assert cancel_latency(scheduler, job_id) < CANCEL_BOUND
+    wait_for(lambda: not child_processes._processes, timeout=1)
+
+
+class SlowLibrary:
+    """Library index stand-in whose update takes long enough to cancel during it"""
+    def __init__(self):
+        self.entered = threading.Event()
+
+    def add(self, *args, **kwargs):
+        self.entered.set()
+        threading.Event().wait(0.5)
+
+
+def test_cancel_after_conversion_keeps_the_track(stand_in, make_scheduler, tmp_path):
+    scheduler = make_scheduler(format="mp3", bitrate="128")  # Same codec and rate: the stream is copied
+    scheduler.library = library = SlowLibrary()
+    job_id = scheduler.submit(stand_in.url("track.mp3"))
+    wait_for(library.entered.is_set)
+    scheduler.cancel(job_id)
+
+    assert wait_finished(scheduler, job_id) == JOB_DONE
+    assert [path.suffix for path in (tmp_path / "out").iterdir()] == [".mp3"]
@@ -0,0 +1,51 @@
+import threading
+
+import child_processes
+import downloader_cli
+from downloader_engine import JOB_CONVERTING, Config, JobJournal, ProgressAggregator
+
+
+def scheduler_threads(before=()):
+    """Scheduler threads still alive, leaving out the ones from earlier tests"""
+    return [thread for thread in threading.enumerate() if thread not in before
+            and thread.name.startswith(("download-worker", "prefetch-worker", "list-"))]
+
+
+def test_normal_exit_joins_the_scheduler(stand_in, tmp_path):
+    before = scheduler_threads()
+    status = downloader_cli.main([stand_in.url("track.mp3"), "-o", str(tmp_path / "out"), "--no-skip-existing"])
+
+    assert status == downloader_cli.EXIT_OK
+    assert [path.suffix for path in (tmp_path / "out").iterdir()] == [".mp3"]
+    assert not scheduler_threads(before)
+
+
+class InterruptedWhileConverting(ProgressAggregator):
+    """Progress channel that raises Ctrl+C in the CLI loop once a conversion has started"""
+    def __init__(self):
+        super().__init__()
+        self.converting = threading.Event()
+
+    def put(self, message):
+        if message[1] == "state" and message[2] == JOB_CONVERTING:
+            self.converting.set()
+        super().put(message)
+
+    def wait(self, timeout=None):
+        if self.converting.is_set() and child_processes._processes:
+            raise KeyboardInterrupt
+        return super().wait(timeout)
+
+
+def test_interrupt_stops_the_conversion_before_closing_the_journal(stand_in, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader_cli, "ProgressAggregator", InterruptedWhileConverting)
+    before = scheduler_threads()
+    status = downloader_cli.main([stand_in.url("long.wav"), "-o", str(tmp_path / "out"), "-f", "mp3",
+                                  "-b", "320", "--no-skip-existing"])
+
+    assert status == downloader_cli.EXIT_INTERRUPTED
+    assert not child_processes._processes
+    assert not scheduler_threads(before)
+    journal = JobJournal(Config.JOURNAL_FILE)
+    assert len(journal.unfinished()) == 1  # Left for --resume
+    journal.close()
@@ -0,0 +1,70 @@
+import subprocess
+import threading
+
+import pytest
+
+from audio_pipeline import TranscodeTask, run_transcode
+from cover_cache import CoverCache
+from tests.conftest import needs_ffmpeg
+from tests.stand_in import StandIn, make_track
+
+pytestmark = needs_ffmpeg
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Local server with three distinct 640x480 PNG thumbnails"""
+    root = tmp_path / "images"
+    root.mkdir()
+    for i in range(3):
+        subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i",
+                        f"testsrc2=size=640x480:duration=1:rate=1,hue=h={i * 90}", "-frames:v", "1",
+                        str(root / f"cover{i}.png")], check=True)
+    server = StandIn(root)
+    yield server
+    server.close()
+
+
+def test_key_locks_are_dropped_after_use(images, tmp_path):
+    cache = CoverCache(str(tmp_path / "covers"), 50 * 1024 * 1024)
+    digests = []
+    threads = [threading.Thread(target=lambda: digests.append(cache.fetch(images.url("cover0.png"))))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.variant(digests[0], "jpg", 300)
+
+    assert len(set(digests)) == 1
+    assert images.hits["/cover0.png"] == 1  # One download for the four concurrent fetches
+    assert cache._key_locks == {}
+    cache.close()
+
+
+def test_pinned_variant_survives_eviction_until_released(images, tmp_path):
+    cache = CoverCache(str(tmp_path / "covers"), 50 * 1024 * 1024)
+    digest = cache.fetch(images.url("cover0.png"))
+    pinned = cache.embeddable(digest, 300, pin=True)
+    cache.max_bytes = 1  # Every later addition evicts whatever is not pinned
+    for i in (1, 2):
+        cache.fetch(images.url(f"cover{i}.png"))
+
+    assert pinned.exists()
+    cache.release(pinned)
+    assert not pinned.exists()
+    assert cache._pins == {}
+    cache.close()
+
+
+def test_transcode_releases_its_covers(images, tmp_path):
+    cache = CoverCache(str(tmp_path / "covers"), 50 * 1024 * 1024)
+    digest = cache.fetch(images.url("cover0.png"))
+    source = make_track(tmp_path / "source.wav", 2)
+    task = TranscodeTask(None, source, tmp_path / "track.mp3", "mp3", "128", {"title": "Pista"},
+                         cover_cache=cache, cover_digest=digest, cover_output=tmp_path / "cover.jpg", cover_size=300)
+    run_transcode(task)
+
+    assert task.cover is not None and (tmp_path / "cover.jpg").exists()
+    assert cache._pins == {}
+    cache.close()
@@ -0,0 +1,37 @@
+import queue
+import logging
+import threading
+
+import pytest
+
+from downloader_engine import JOB_DONE, JOB_SKIPPED, ConfigManager, DownloadArchive, DownloaderThread
+from tests.conftest import wait_finished
+
+
+@pytest.mark.parametrize("artist_folders", [False, True])
+def test_single_track_is_extracted_once(stand_in, tmp_path, artist_folders):
+    config = ConfigManager().default_config.copy()
+    config.update(output_dir=str(tmp_path / "out"), format="mp3", bitrate="128", skip_existing=False,
+                  save_cover_art=False, create_artist_folders=artist_folders)
+    worker = DownloaderThread(stand_in.url("track.mp3"), config, queue.Queue(), threading.Event(),
+                              logging.getLogger("tests"), job_id="job-1")
+    worker.run()
+
+    assert worker.state == JOB_DONE
+    assert worker.extract_calls == 1
+    # One request to resolve the page, one for the stream: the folder lookup adds none
+    assert stand_in.hits["/track.mp3"] == 2
+
+
+def test_archived_urls_are_skipped_without_requests(stand_in, make_scheduler, tmp_path):
+    archive = DownloadArchive(str(tmp_path / "archive.db"))
+    urls = [stand_in.url(f"pista{i}.mp3") for i in range(200)]
+    for i, url in enumerate(urls):
+        archive.add("generic", f"pista{i}", [url])
+    scheduler = make_scheduler(skip_existing=True, prefetch_workers=2, max_concurrent=2)
+    scheduler.archive = archive
+    ids = [scheduler.submit(url) for url in urls]
+
+    assert {wait_finished(scheduler, job_id) for job_id in ids} == {JOB_SKIPPED}
+    assert sum(stand_in.hits.values()) == 0  # Neither the prefetch nor the workers reached the server
+    archive.close()
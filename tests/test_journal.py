@@ -0,0 +1,46 @@
+import pytest
+
+from downloader_engine import JOB_CANCELED, JobJournal
+from tests.conftest import wait_for
+
+
+def interrupted_download(stand_in, make_scheduler, journal, **overrides):
+    """Shut a scheduler down in the middle of a throttled transfer, as closing the app would"""
+    scheduler = make_scheduler(job_bandwidth_limit_kb=64, **overrides)
+    scheduler.journal = journal
+    job_id = scheduler.submit(stand_in.url("minute.mp3"))
+    wait_for(lambda: scheduler.jobs[job_id].worker is not None and scheduler.jobs[job_id].worker.downloaded > 0)
+    assert scheduler.shutdown(timeout=5.0)
+
+
+@pytest.mark.parametrize("staging", [False, True], ids=["output-dir", "staging-dir"])
+def test_discard_unfinished_deletes_partial_files(stand_in, make_scheduler, tmp_path, staging):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    overrides = {"staging_dir": str(tmp_path / "staging")} if staging else {}
+    interrupted_download(stand_in, make_scheduler, journal, **overrides)
+    left = tmp_path / ("staging" if staging else "out")
+    assert any(path.name.endswith(".part") for path in left.rglob("*"))  # Kept for a resume
+
+    journal.discard_unfinished()
+
+    assert not [path for path in left.rglob("*") if path.is_file()]
+    if staging:
+        assert not list(left.iterdir())  # The job's staging folder too
+    assert journal.unfinished() == []
+    journal.close()
+
+
+def test_discard_unfinished_deletes_the_downloaded_stream(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal.db"))
+    entry_id = journal.add("http://example.com/track", "Pista", {"format": "flac"})
+    raw = tmp_path / "Pista.webm"
+    raw.write_bytes(b"audio")
+    (tmp_path / "Pista.temp.flac").write_bytes(b"half a conversion")
+    journal.set_handoff(entry_id, {"filepath": str(raw)})
+
+    journal.discard_unfinished()
+
+    assert list(tmp_path.iterdir()) == [tmp_path / "journal.db"]
+    state = journal._conn.execute("SELECT state FROM jobs WHERE entry_id = ?", (entry_id,)).fetchone()[0]
+    assert state == JOB_CANCELED
+    journal.close()
@@ -0,0 +1,48 @@
+import pytest
+
+from library_index import LibraryIndex
+
+
+@pytest.fixture
+def library(tmp_path):
+    index = LibraryIndex(str(tmp_path / "library.db"))
+    tracks = {}
+    for name in ("Primera cancion", "Segunda cancion", "Tercera cancion"):
+        tracks[name] = tmp_path / f"{name}.mp3"
+        tracks[name].write_bytes(name.encode())
+        index.add(tracks[name], {"title": name, "artist": "Artista"})
+    # Indexed again (e.g. by a rescan): keeps its place, it was not downloaded again
+    index.add(tracks["Primera cancion"], {"title": "Primera cancion", "artist": "Artista"})
+    yield index
+    index.close()
+
+
+def titles(tracks):
+    return [track["title"] for track in tracks]
+
+
+@pytest.mark.parametrize("fts", [True, False], ids=["fts", "like"])
+@pytest.mark.parametrize("text", ["", "cancion", "artista cancion"])
+def test_search_returns_the_most_recently_indexed_first(library, fts, text):
+    if fts and not library.fts:
+        pytest.skip("SQLite sin FTS5")
+    library.fts = fts
+
+    assert titles(library.search(text)) == ["Tercera cancion", "Segunda cancion", "Primera cancion"]
+    assert titles(library.search(text, limit=1)) == ["Tercera cancion"]
+
+
+@pytest.mark.parametrize("fts", [True, False], ids=["fts", "like"])
+@pytest.mark.parametrize("text", ["", "cancion"])
+def test_search_stops_at_the_limit_without_sorting(library, fts, text):
+    if fts and not library.fts:
+        pytest.skip("SQLite sin FTS5")
+    library.fts = fts
+    statements = []
+    library._conn.set_trace_callback(statements.append)
+    library.search(text)
+    library._conn.set_trace_callback(None)
+
+    [select] = [sql for sql in statements if sql.startswith("SELECT")]
+    plan = " ".join(row[3] for row in library._conn.execute(f"EXPLAIN QUERY PLAN {select}"))
+    assert "TEMP B-TREE" not in plan  # Would sort every match before the LIMIT
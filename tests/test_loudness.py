@@ -0,0 +1,37 @@
+import math
+import subprocess
+
+import pytest
+
+from loudness import measure, source_channels
+from tests.conftest import needs_ffmpeg
+
+pytestmark = needs_ffmpeg
+
+AMPLITUDE = 0.125 * 0.1  # lavfi's sine is at 1/8, then -20 dB
+
+
+def tone(path, pan=None):
+    """A 1 kHz tone; ``pan`` spreads it over more channels"""
+    filters = "volume=-20dB" + (f",pan={pan}" if pan else "")
+    subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error", "-y", "-f", "lavfi", "-i",
+                    "sine=frequency=1000:sample_rate=48000:duration=10", "-af", filters, str(path)], check=True)
+    return path
+
+
+def test_mono_is_measured_as_one_channel(tmp_path):
+    mono = tone(tmp_path / "mono.wav")
+    loudness, peak = measure(mono)
+
+    assert source_channels(mono) == 1
+    # BS.1770: a 1 kHz sine reads its RMS level in LUFS (the K-weighting is about +0.69 dB there)
+    assert loudness == pytest.approx(20 * math.log10(AMPLITUDE / math.sqrt(2)), abs=0.1)
+    assert peak == pytest.approx(AMPLITUDE, rel=0.01)  # Not the -3 dB of an upmix
+
+
+def test_the_same_signal_in_both_channels_is_3_lu_louder(tmp_path):
+    mono, _ = measure(tone(tmp_path / "mono.wav"))
+    dual, peak = measure(tone(tmp_path / "dual.wav", pan="stereo|c0=c0|c1=c0"))
+
+    assert dual - mono == pytest.approx(10 * math.log10(2), abs=0.05)
+    assert peak == pytest.approx(AMPLITUDE, rel=0.01)
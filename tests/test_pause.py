@@ -0,0 +1,36 @@
+from downloader_engine import JOB_DONE, JOB_PAUSED, JOB_QUEUED, JOB_RUNNING
+from tests.conftest import wait_finished, wait_for
+
+
+def test_pause_while_waiting_for_prefetch_stays_paused(stand_in, make_scheduler):
+    stand_in.fail("track.mp3", "hang", count=1)
+    scheduler = make_scheduler(prefetch_workers=1, socket_timeout=1)
+    job_id = scheduler.submit(stand_in.url("track.mp3"))
+    job = scheduler.jobs[job_id]
+    scheduler.pause(job_id)  # Held back until the prefetch is stuck on the hanging request
+    wait_for(lambda: stand_in.hits["/track.mp3"] == 1)
+    scheduler.resume(job_id)
+    wait_for(lambda: job.state == JOB_RUNNING)  # Taken by a worker, waiting for the prefetch
+    scheduler.pause(job_id)
+    wait_for(lambda: job.worker is not None)  # The prefetch timed out and the worker started
+
+    assert job.state == JOB_PAUSED
+    scheduler.resume(job_id)
+    assert wait_finished(scheduler, job_id) == JOB_DONE
+
+
+def test_job_paused_before_a_transient_error_is_requeued_paused(stand_in, make_scheduler):
+    stand_in.fail("minute.mp3", "hang", count=1)
+    scheduler = make_scheduler(socket_timeout=1)
+    job_id = scheduler.submit(stand_in.url("minute.mp3"))
+    job = scheduler.jobs[job_id]
+    wait_for(lambda: stand_in.hits["/minute.mp3"] == 1)
+    scheduler.pause(job_id)
+    wait_for(lambda: job.attempts == 1)  # The timeout was retried
+
+    assert job.state == JOB_PAUSED
+    assert not scheduler.is_idle()
+    scheduler.resume(job_id)
+    assert job.state == JOB_QUEUED
+    assert wait_finished(scheduler, job_id) == JOB_DONE
+    wait_for(scheduler.is_idle, timeout=5)
@@ -0,0 +1,76 @@
+import time
+from email.utils import formatdate
+
+from downloader_engine import JOB_DONE, JOB_ERROR
+from retry_policy import HostGate, RetryPolicy, parse_retry_after
+from tests.conftest import wait_finished
+
+
+def test_transient_503_is_retried_after_retry_after(stand_in, make_scheduler):
+    stand_in.fail("track.mp3", 503, count=2, retry_after=0)
+    scheduler = make_scheduler()
+    job_id = scheduler.submit(stand_in.url("track.mp3"))
+
+    assert wait_finished(scheduler, job_id) == JOB_DONE
+    assert scheduler.jobs[job_id].attempts == 2
+
+
+def test_404_fails_without_retry(stand_in, make_scheduler):
+    stand_in.fail("track.mp3", 404, count=10)
+    scheduler = make_scheduler()
+    job_id = scheduler.submit(stand_in.url("track.mp3"))
+
+    assert wait_finished(scheduler, job_id) == JOB_ERROR
+    assert scheduler.jobs[job_id].attempts == 0
+    assert stand_in.hits["/track.mp3"] == 1
+
+
+def test_circuit_opens_after_threshold_and_lets_one_trial_through():
+    gate = HostGate(limit=2, failure_threshold=2, cooldown=10.0)
+    for _ in range(2):
+        gate.acquire("host")
+    assert gate.release("host", False, now=0.0) is None
+    assert gate.release("host", False, now=0.0) == 10.0
+
+    assert not gate.available("host", now=5.0)
+    assert gate.blocked_until("host", now=5.0) == 10.0
+    assert gate.available("host", now=10.0)
+    gate.acquire("host")  # Half-open: the trial job
+    assert not gate.available("host", now=10.0)
+
+    assert gate.release("host", False, now=10.0) == 20.0  # Failed trial: re-opened, cooldown doubled
+    gate.acquire("host")
+    assert gate.release("host", True, now=30.0) is None
+    assert gate.available("host", now=30.0)
+    assert gate.status()["open"] == {}
+
+
+def test_failure_of_a_job_started_before_the_circuit_opened_is_ignored():
+    gate = HostGate(limit=3, failure_threshold=1, cooldown=10.0)
+    gate.acquire("host")
+    gate.acquire("host")
+    assert gate.release("host", False, now=0.0) == 10.0
+    assert gate.release("host", False, now=1.0) is None
+    assert gate.blocked_until("host", now=1.0) == 10.0
+
+
+def test_backoff_bounds():
+    policy = RetryPolicy(max_attempts=3, base_delay=2.0, max_delay=10.0)
+    for attempt, ceiling in ((0, 2.0), (1, 4.0), (2, 8.0), (5, 10.0)):
+        for _ in range(50):
+            assert ceiling / 2 <= policy.backoff(attempt) <= ceiling
+    assert policy.backoff(0, retry_after=7.0) == 7.0
+    assert policy.backoff(0, retry_after=60.0) == 10.0  # Capped at max_delay
+
+    error = OSError("HTTP Error 503: Service Unavailable")
+    assert policy.decide(error, 2)[0] is not None
+    assert policy.decide(error, 3) == (None, "HTTP 503")
+    assert policy.decide(OSError("HTTP Error 404: Not Found"), 0) == (None, "HTTP 404")
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after(formatdate(0, usegmt=True)) == 0.0  # A date in the past
+    assert 50 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after("pronto") is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,39 @@
+import pytest
+
+from audio_pipeline import TranscodeSkipped, TranscodeTask, run_transcode
+from downloader_engine import JOB_DONE, JOB_SKIPPED
+from tests.conftest import needs_ffmpeg, wait_finished
+from tests.stand_in import make_track
+
+pytestmark = needs_ffmpeg
+
+
+@pytest.mark.parametrize("staging", [False, True], ids=["output-dir", "staging-dir"])
+def test_existing_track_is_skipped_without_the_archive(stand_in, make_scheduler, tmp_path, staging):
+    overrides = {"staging_dir": str(tmp_path / "staging")} if staging else {}
+    scheduler = make_scheduler(skip_existing=True, format="mp3", bitrate="128", **overrides)
+    assert scheduler.archive is None
+    first = scheduler.submit(stand_in.url("track.mp3"))
+    assert wait_finished(scheduler, first) == JOB_DONE
+    [track] = (tmp_path / "out").iterdir()
+    written = track.stat().st_mtime_ns
+
+    second = scheduler.submit(stand_in.url("track.mp3"))
+
+    assert wait_finished(scheduler, second) == JOB_SKIPPED
+    assert scheduler.jobs[second].worker.downloaded == 0
+    assert list((tmp_path / "out").iterdir()) == [track]
+    assert track.stat().st_mtime_ns == written
+
+
+def test_conversion_leaves_a_track_written_meanwhile(tmp_path):
+    source = make_track(tmp_path / "Pista.wav", 2)
+    target = tmp_path / "Pista.mp3"
+    target.write_bytes(b"published by another job")
+    task = TranscodeTask(None, source, target, "mp3", "128", {"title": "Pista"}, keep_existing=True)
+
+    with pytest.raises(TranscodeSkipped):
+        run_transcode(task)
+
+    assert target.read_bytes() == b"published by another job"
+    assert list(tmp_path.iterdir()) == [target]  # Raw stream and temp file removed
@@ -0,0 +1,12 @@
+from downloader_engine import JOB_DONE
+from tests.conftest import wait_finished
+
+
+def test_jobs_with_a_staging_dir_share_one_instance(stand_in, make_scheduler, tmp_path):
+    scheduler = make_scheduler(max_concurrent=1, staging_dir=str(tmp_path / "staging"))
+    job_ids = [scheduler.submit(stand_in.url("track.mp3")) for _ in range(4)]
+
+    assert [wait_finished(scheduler, job_id) for job_id in job_ids] == [JOB_DONE] * 4
+    pool = scheduler.ydl_pool
+    assert (pool.created, pool.reused) == (1, 3)
+    assert len(pool._idle) == 1  # A single option set, not one idle instance per job